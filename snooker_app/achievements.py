@@ -0,0 +1,196 @@
+from collections import Counter
+from itertools import groupby
+
+from django.db import transaction
+
+from snooker_app import page_cache
+from snooker_app.models import Achievement, Frame, MatchPlayer, MatchResult
+
+HALF_CENTURY = 50
+CENTURY = 100
+MAXIMUM = 147
+
+ENGINE_FIELDS = ['breaks', 'matches_won', 'frames_won', 'frames_lost', 'fastest_frame_won', 'longest_frame_won',
+                 'consecutive_frames_won', 'consecutive_matches_won', 'current_frame_streak', 'current_match_streak']
+
+# Chart columns and whether their best value is the largest one.
+CHART_COLUMNS = {
+    'tournaments_won': True,
+    'matches_won': True,
+    'frames_won': True,
+    'frames_lost': True,
+    'fastest_frame_won': False,
+    'longest_frame_won': True,
+    'consecutive_frames_won': True,
+    'consecutive_matches_won': True,
+}
+DURATION_COLUMNS = ('fastest_frame_won', 'longest_frame_won')
+
+FRAME_COLUMNS = ('match_player__match_id', 'match_player__match__number_of_frames', 'frame_number',
+                 'player1_id', 'player2_id', 'winner_id', 'time_duration',
+                 'break_points_player1', 'break_points_player2')
+FRAME_ORDERING = ('match_player__match__date', 'match_player__match__time', 'match_player__match_id', 'frame_number')
+
+
+def frame_rows(frames):
+    return frames.with_players().order_by(*FRAME_ORDERING).values_list(*FRAME_COLUMNS)
+
+
+class AchievementEngine:
+    # Keeps one Achievement per player in memory as streak state and folds
+    # results into it. Results must be fed in chronological order.
+
+    def __init__(self):
+        self.achievements = {}
+
+    def load(self, player_ids):
+        # Creates any missing rows, then locks them all, so two results for
+        # the same player recorded at once are folded in one after the other.
+        missing = sorted(player_id for player_id in set(player_ids) if player_id not in self.achievements)
+        if not missing:
+            return
+        Achievement.objects.bulk_create([Achievement(player_id=player_id) for player_id in missing],
+                                        ignore_conflicts=True)
+        for achievement in Achievement.objects.select_for_update().filter(player_id__in=missing).order_by('player'):
+            self.achievements[achievement.player_id] = achievement
+
+    def _achievement(self, player_id):
+        if player_id not in self.achievements:
+            self.achievements[player_id] = Achievement(player_id=player_id)
+        return self.achievements[player_id]
+
+    def add_breaks(self, player_id, breaks):
+        if not breaks:
+            return
+        achievement = self._achievement(player_id)
+        summary = achievement.breaks or {}
+        summary['highest'] = max(summary.get('highest', 0), *breaks)
+        summary['half_centuries'] = summary.get('half_centuries', 0) + sum(HALF_CENTURY <= b < CENTURY for b in breaks)
+        summary['centuries'] = summary.get('centuries', 0) + sum(b >= CENTURY for b in breaks)
+        summary['maximums'] = summary.get('maximums', 0) + sum(b >= MAXIMUM for b in breaks)
+        achievement.breaks = summary
+
+    def frame(self, winner_id, loser_id, duration=None):
+        winner = self._achievement(winner_id)
+        winner.frames_won += 1
+        winner.current_frame_streak += 1
+        winner.consecutive_frames_won = max(winner.consecutive_frames_won, winner.current_frame_streak)
+        if duration is not None:
+            if winner.fastest_frame_won is None or duration < winner.fastest_frame_won:
+                winner.fastest_frame_won = duration
+            if winner.longest_frame_won is None or duration > winner.longest_frame_won:
+                winner.longest_frame_won = duration
+
+        if loser_id is not None:
+            loser = self._achievement(loser_id)
+            loser.frames_lost += 1
+            loser.current_frame_streak = 0
+
+    def match(self, winner_id, player_ids):
+        for player_id in player_ids:
+            achievement = self._achievement(player_id)
+            if player_id == winner_id:
+                achievement.matches_won += 1
+                achievement.current_match_streak += 1
+                achievement.consecutive_matches_won = max(achievement.consecutive_matches_won,
+                                                          achievement.current_match_streak)
+            else:
+                achievement.current_match_streak = 0
+
+    def consume(self, rows):
+        # `rows` are FRAME_COLUMNS tuples in FRAME_ORDERING order, possibly
+        # spanning many matches; each match is closed once its frames end.
+        for match_id, match_rows in groupby(rows, key=lambda row: row[0]):
+            self.consume_match(match_rows)
+
+    def consume_match(self, rows):
+        frames_won = Counter()
+        player_ids = set()
+        last_frame_number = None
+        for _, number_of_frames, frame_number, player1_id, player2_id, winner_id, duration, breaks1, breaks2 in rows:
+            if frame_number == last_frame_number:
+                continue
+            last_frame_number = frame_number
+            player_ids.update(player_id for player_id in (player1_id, player2_id) if player_id is not None)
+
+            for player_id, breaks in ((player1_id, breaks1), (player2_id, breaks2)):
+                if player_id is not None:
+                    self.add_breaks(player_id, breaks)
+            if winner_id is not None:
+                loser_id = player2_id if winner_id == player1_id else player1_id
+                self.frame(winner_id, loser_id, duration)
+                frames_won[winner_id] += 1
+
+        if not player_ids:
+            return
+        ranked = frames_won.most_common(2)
+        winner_id = None
+        if ranked and (len(ranked) == 1 or ranked[0][1] > ranked[1][1]):
+            winner_id = ranked[0][0]
+        self.match(winner_id, player_ids)
+
+    def save(self, batch_size=1000):
+        Achievement.objects.bulk_create(
+            list(self.achievements.values()),
+            update_conflicts=True,
+            unique_fields=['player'],
+            update_fields=ENGINE_FIELDS,
+            batch_size=batch_size,
+        )
+
+
+def record_match(match):
+    # Incremental path: fold one finished match into the stored achievements.
+    # The lines are locked first, so overlapping calls count a match once.
+    with transaction.atomic():
+        lines = list(MatchPlayer.objects.select_for_update().filter(match=match, achievements_recorded=False))
+        if not lines:
+            return 0
+        engine = AchievementEngine()
+        engine.load([line.player_id for line in lines])
+        engine.consume_match(frame_rows(Frame.objects.filter(match_player__match=match)))
+        engine.save()
+        MatchPlayer.objects.filter(pk__in=[line.pk for line in lines]).update(achievements_recorded=True)
+        page_cache.invalidate_on_commit(page_cache.ACHIEVEMENTS)
+    return len(lines)
+
+
+def backfill(chunk_size=5000):
+    # Replays every finished match's frames in one ordered pass over a
+    # server-side cursor, rebuilding all achievements from scratch.
+    finished = MatchResult.objects.values('match_id')
+    rows = frame_rows(Frame.objects.filter(match_player__match__in=finished)).iterator(chunk_size=chunk_size)
+    engine = AchievementEngine()
+    with transaction.atomic():
+        engine.consume(rows)
+        Achievement.objects.update(
+            breaks={}, matches_won=0, frames_won=0, frames_lost=0, fastest_frame_won=None, longest_frame_won=None,
+            consecutive_frames_won=0, consecutive_matches_won=0, current_frame_streak=0, current_match_streak=0,
+        )
+        engine.save()
+        MatchPlayer.objects.filter(match__in=finished).update(achievements_recorded=True)
+        page_cache.invalidate_on_commit(page_cache.ACHIEVEMENTS)
+    return len(engine.achievements)
+
+
+def chart_series(column, limit):
+    # The top `limit` players for one column, best first, ready for a chart.
+    # Durations are sent as seconds so the client never parses them.
+    if column not in CHART_COLUMNS:
+        raise ValueError(f'Unknown achievement column: {column!r}')
+    ordering = column if not CHART_COLUMNS[column] else f'-{column}'
+    rows = (Achievement.objects
+            .filter(**{f'{column}__isnull': False})
+            .select_related('player')
+            .order_by(ordering, 'pk')[:limit])
+    labels, values = [], []
+    for achievement in rows:
+        value = getattr(achievement, column)
+        labels.append(str(achievement.player))
+        values.append(value.total_seconds() if column in DURATION_COLUMNS else value)
+    return {
+        'column': column,
+        'unit': 'seconds' if column in DURATION_COLUMNS else 'count',
+        'labels': labels,
+        'values': values,
+    }
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SnookerAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'snooker_app'
+
+    def ready(self):
+        from snooker_app import signals  # noqa: F401
@@ -0,0 +1,261 @@
+import random
+import statistics
+import time
+from datetime import date, time as clock, timedelta
+from itertools import count
+
+from django import get_version
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from snooker_app import achievements, head_to_head, player_stats, ratings
+from snooker_app.models import (Venue, Player, Referee, Competition, GroupStage, KnockoutStage, Match, MatchPlayer,
+                                MatchResult, Frame, bulk_create_matches)
+from snooker_app.standings import compute_group_standings
+
+# players, matches; every competition is a 16 player, four group stage.
+SCALES = {
+    'tiny': {'players': 32, 'matches': 200},
+    'small': {'players': 100, 'matches': 10_000},
+    'medium': {'players': 1_000, 'matches': 100_000},
+    'large': {'players': 10_000, 'matches': 100_000},
+}
+PLAYERS_PER_COMPETITION = 16
+GROUPS_PER_COMPETITION = 4
+MAX_COMPETITIONS = 50
+FRAMES_PER_MATCH = 5
+CHUNK_SIZE = 2000
+
+
+class Dataset:
+    def __init__(self, players, competitions, counts, seconds):
+        self.players = players
+        self.competitions = competitions
+        self.counts = counts
+        self.seconds = seconds
+
+
+def _frames(rng, match, line, player1, player2):
+    # Best of FRAMES_PER_MATCH; stops as soon as one player has a majority.
+    needed = FRAMES_PER_MATCH // 2 + 1
+    won = {player1.pk: 0, player2.pk: 0}
+    frames = []
+    for number in count(1):
+        if max(won.values()) == needed:
+            return frames
+        winner = player1 if rng.random() < 0.5 else player2
+        won[winner.pk] += 1
+        breaks = [[rng.randint(10, 147) for _ in range(rng.randint(0, 3))] for _ in range(2)]
+        points = [sum(side) + rng.randint(0, 40) for side in breaks]
+        frames.append(Frame(
+            match_player=line, frame_number=number, winner=winner,
+            time_duration=timedelta(seconds=rng.randint(600, 2400)),
+            points_scored_player1=points[0], points_scored_player2=points[1],
+            max_break_player1=max(breaks[0], default=0), max_break_player2=max(breaks[1], default=0),
+            break_points_player1=breaks[0], break_points_player2=breaks[1],
+            total_shots_player1=rng.randint(10, 40), total_shots_player2=rng.randint(10, 40),
+        ))
+
+
+def _write_matches(rng, pairs):
+    # Matches, their player links and lines, frames and results, in bulk.
+    bulk_create_matches(pairs, batch_size=CHUNK_SIZE)
+    lines = []
+    for match, (player1, player2) in pairs:
+        lines.append(MatchPlayer(match=match, player=player1, position=1, attempts=rng.randint(20, 80)))
+        lines.append(MatchPlayer(match=match, player=player2, position=2, attempts=rng.randint(20, 80)))
+    MatchPlayer.objects.bulk_create(lines, batch_size=CHUNK_SIZE)
+    frames = []
+    for (match, (player1, player2)), line in zip(pairs, lines[::2]):
+        frames.extend(_frames(rng, match, line, player1, player2))
+    Frame.objects.bulk_create(frames, batch_size=CHUNK_SIZE)
+    MatchResult.objects.bulk_create([MatchResult(match=match) for match, _ in pairs], batch_size=CHUNK_SIZE)
+    return len(frames)
+
+
+def build_dataset(players, matches, seed=0):
+    # Writes a synthetic but realistically shaped history: group stage
+    # competitions filled with results, then friendlies up to `matches`.
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    venues = Venue.objects.bulk_create([Venue(name=f'Venue {i}') for i in range(10)])
+    Referee.objects.bulk_create([Referee(first_name='Referee', last_name=str(i)) for i in range(20)])
+    player_objects = Player.objects.bulk_create(
+        [Player(first_name=f'Player{i}', last_name=f'Bench{i}') for i in range(players)], batch_size=CHUNK_SIZE)
+
+    first_day = date(2020, 1, 1)
+    competition_count = min(MAX_COMPETITIONS, matches // 24, players // PLAYERS_PER_COMPETITION)
+    competitions = Competition.objects.bulk_create([
+        Competition(name=f'Benchmark Open {i}', start_date=first_day + timedelta(days=7 * i),
+                    end_date=first_day + timedelta(days=7 * i + 2), venue=rng.choice(venues),
+                    competition_type='Qualifiers', is_group_stage=True)
+        for i in range(competition_count)
+    ])
+    stages = GroupStage.objects.bulk_create([
+        GroupStage(competition=competition, name='Groups', num_groups=GROUPS_PER_COMPETITION,
+                   players_per_group=PLAYERS_PER_COMPETITION // GROUPS_PER_COMPETITION)
+        for competition in competitions
+    ])
+
+    pairs = []
+    entrants = []
+    for competition, stage in zip(competitions, stages):
+        field = rng.sample(player_objects, PLAYERS_PER_COMPETITION)
+        entrants.extend(Competition.players.through(competition_id=competition.pk, player_id=player.pk)
+                        for player in field)
+        per_group = PLAYERS_PER_COMPETITION // GROUPS_PER_COMPETITION
+        for group in range(GROUPS_PER_COMPETITION):
+            group_players = field[group * per_group:(group + 1) * per_group]
+            for i, player1 in enumerate(group_players):
+                for player2 in group_players[i + 1:]:
+                    match = Match(date=competition.start_date, time=clock(14, 0), venue=competition.venue,
+                                  number_of_frames=FRAMES_PER_MATCH, group_stage=stage, group_name=chr(65 + group))
+                    match.set_denormalized_fields([player1, player2])
+                    pairs.append((match, (player1, player2)))
+    Competition.players.through.objects.bulk_create(entrants)
+
+    frames = 0
+    total = 0
+    while total < matches:
+        while len(pairs) < CHUNK_SIZE and total + len(pairs) < matches:
+            player1, player2 = rng.sample(player_objects, 2)
+            match = Match(date=first_day + timedelta(days=rng.randint(0, 4 * 365)),
+                          time=clock(rng.randint(10, 20), 0), venue=rng.choice(venues),
+                          number_of_frames=FRAMES_PER_MATCH)
+            match.set_denormalized_fields([player1, player2])
+            pairs.append((match, (player1, player2)))
+        frames += _write_matches(rng, pairs)
+        total += len(pairs)
+        pairs = []
+
+    counts = {'players': players, 'matches': total, 'frames': frames, 'competitions': len(competitions)}
+    return Dataset(player_objects, competitions, counts, time.perf_counter() - started)
+
+
+class Scenario:
+    def __init__(self, name, run, budget, repeat=None):
+        self.name = name
+        self.run = run
+        self.budget = budget
+        self.repeat = repeat
+
+
+def _view(path, user=None):
+    factory = RequestFactory()
+    match = resolve(path.split('?')[0])
+    unique = count()
+
+    def run():
+        # A throwaway query parameter keeps every call a page cache miss, so
+        # the numbers are for the real render path.
+        separator = '&' if '?' in path else '?'
+        request = factory.get(f'{path}{separator}bench={next(unique)}')
+        request.user = user or AnonymousUser()
+        response = match.func(request, *match.args, **match.kwargs)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        if response.status_code != 200:
+            raise RuntimeError(f'{path} answered {response.status_code}')
+    return run
+
+
+def _rolled_back(operation):
+    def run():
+        with transaction.atomic():
+            operation()
+            transaction.set_rollback(True)
+    return run
+
+
+def scenarios(dataset):
+    competition = dataset.competitions[0] if dataset.competitions else None
+    player = dataset.players[0]
+    operator = User(username='benchmark', is_staff=True)
+    # The rebuilds write players in batches of 1000, so their budgets grow
+    # with the number of players and nothing else.
+    player_batches = -(-len(dataset.players) // 1000)
+    # There are at most as many head-to-head pairs as matches.
+    pair_batches = -(-dataset.counts['matches'] // 1000)
+    found = [
+        Scenario('model:backfill_achievements', achievements.backfill, budget=5 + player_batches, repeat=1),
+        Scenario('model:recompute_player_stats', player_stats.recompute_all, budget=6 + 3 * player_batches,
+                 repeat=1),
+        Scenario('model:rebuild_head_to_head', head_to_head.rebuild, budget=6 + pair_batches, repeat=1),
+        Scenario('model:replay_ratings', ratings.replay, budget=8 + 2 * pair_batches + player_batches, repeat=1),
+        Scenario('view:match_list', _view(reverse('match_list')), budget=6),
+        Scenario('view:match_list_by_player', _view(f"{reverse('match_list')}?player={player.pk}"), budget=6),
+        Scenario('view:achievement_list', _view(reverse('achievement_list')), budget=3),
+        Scenario('view:achievement_chart_data', _view(f"{reverse('achievement_chart_data')}?column=frames_won"),
+                 budget=2),
+        Scenario('view:head_to_head', _view(reverse('head_to_head', args=[player.pk])), budget=2),
+        Scenario('view:player_stats', _view(reverse('player_stats', args=[player.pk])), budget=2),
+        Scenario('export:matches', _view(reverse('export_results', args=['matches']), operator), budget=2, repeat=1),
+    ]
+    if competition is not None:
+        stage = competition.groupstage_stages.get()
+        found += [
+            Scenario('view:competition_detail', _view(reverse('competition_detail', args=[competition.pk])),
+                     budget=10),
+            Scenario('view:competition_stages', _view(reverse('competition_stages', args=[competition.pk])),
+                     budget=8),
+            Scenario('view:competition_stats', _view(reverse('competition_stats', args=[competition.pk])),
+                     budget=2),
+            Scenario('model:compute_group_standings', lambda: compute_group_standings([stage]), budget=3),
+            Scenario('model:create_groups_and_matches', _rolled_back(
+                lambda: GroupStage.objects.create(competition=competition, name='Bench', num_groups=4,
+                                                  players_per_group=4).create_groups_and_matches(5)), budget=12),
+            Scenario('model:create_knockout_matches', _rolled_back(
+                lambda: KnockoutStage.objects.create(competition=competition, name='Bench', num_rounds=4,
+                                                     frames_per_match=7).create_knockout_matches()), budget=16),
+        ]
+    return found
+
+
+def measure(scenario, repeat):
+    timings = []
+    queries = 0
+    for _ in range(scenario.repeat or repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            scenario.run()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(captured))
+    return {
+        'name': scenario.name,
+        'queries': queries,
+        'budget': scenario.budget,
+        'within_budget': queries <= scenario.budget,
+        'runs': len(timings),
+        'ms': {
+            'min': round(min(timings), 3),
+            'median': round(statistics.median(timings), 3),
+            'max': round(max(timings), 3),
+        },
+    }
+
+
+def run_suite(scale, repeat=5, seed=0, only=None):
+    # Builds the dataset and runs every scenario inside one transaction that
+    # is rolled back at the end, so the database is left as it was.
+    settings = SCALES[scale]
+    started_at = timezone.now().isoformat()
+    with transaction.atomic():
+        dataset = build_dataset(settings['players'], settings['matches'], seed=seed)
+        results = [measure(scenario, repeat) for scenario in scenarios(dataset)
+                   if only is None or scenario.name in only]
+        transaction.set_rollback(True)
+    return {
+        'scale': scale,
+        'seed': seed,
+        'repeat': repeat,
+        'started_at': started_at,
+        'django': get_version(),
+        'database': connection.vendor,
+        'dataset': {**dataset.counts, 'build_seconds': round(dataset.seconds, 3)},
+        'results': results,
+    }
@@ -0,0 +1,120 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from snooker_app.models import Match
+
+# Outcome of a bracket slot that can never produce a player (both sides empty).
+EMPTY = 'empty'
+# Outcome of a bracket slot whose winner is only known once the match is played.
+PENDING = 'pending'
+
+
+class BracketError(ValueError):
+    pass
+
+
+def seed_order(size):
+    # Standard draw order, e.g. 8 -> [1, 8, 4, 5, 2, 7, 3, 6], so that the top
+    # seeds can only meet in the later rounds and byes go to the top seeds.
+    order = [1]
+    while len(order) < size:
+        total = len(order) * 2 + 1
+        order = [seed for top in order for seed in (top, total - top)]
+    return order
+
+
+def feeder_slots(round_number, slot):
+    return (round_number - 1, 2 * slot), (round_number - 1, 2 * slot + 1)
+
+
+def next_slot(round_number, slot):
+    return round_number + 1, slot // 2
+
+
+def _resolve(sides):
+    players = [side for side in sides if side not in (EMPTY, PENDING)]
+    if PENDING in sides:
+        return players, PENDING
+    if len(players) == 1:
+        return players, players[0]
+    if not players:
+        return players, EMPTY
+    return players, PENDING
+
+
+def build_bracket(stage, players):
+    # `players` must already be in seed order. Every match of every round is
+    # written up front, round by round from the final down, so that each match
+    # can point at the match its winner goes to. Byes are advanced straight away.
+    size = 2 ** stage.num_rounds
+    seeds = dict(enumerate(players[:size], start=1))
+    order = seed_order(size)
+    match_time = timezone.now().time()
+
+    layout = {}
+    outcomes = {}
+    for round_number in range(1, stage.num_rounds + 1):
+        for slot in range(size // 2 ** round_number):
+            if round_number == 1:
+                sides = [seeds.get(order[2 * slot], EMPTY), seeds.get(order[2 * slot + 1], EMPTY)]
+            else:
+                sides = [outcomes[feeder] for feeder in feeder_slots(round_number, slot)]
+            layout[(round_number, slot)], outcomes[(round_number, slot)] = _resolve(sides)
+
+    matches = {}
+    with transaction.atomic():
+        for round_number in range(stage.num_rounds, 0, -1):
+            round_matches = []
+            for slot in range(size // 2 ** round_number):
+                match = Match(
+                    date=stage.competition.start_date + timedelta(days=round_number - 1),
+                    time=match_time,
+                    venue=stage.competition.venue,
+                    number_of_frames=stage.frames_per_match,
+                    knockout_stage=stage,
+                    knockout_name=f'Round {round_number}',
+                    bracket_round=round_number,
+                    bracket_slot=slot,
+                    next_match=matches.get(next_slot(round_number, slot)),
+                )
+                match.set_denormalized_fields(layout[(round_number, slot)])
+                matches[(round_number, slot)] = match
+                round_matches.append(match)
+            Match.objects.bulk_create(round_matches)
+
+        MatchPlayers = Match.players.through
+        MatchPlayers.objects.bulk_create([
+            MatchPlayers(match_id=matches[key].pk, player_id=player.pk)
+            for key, entrants in layout.items() for player in entrants
+        ])
+    return matches
+
+
+def bracket_index(stage):
+    # {(round, slot): match} for the whole draw in one query (plus players).
+    matches = stage.matches.filter(bracket_round__isnull=False).prefetch_related('players')
+    return {(match.bracket_round, match.bracket_slot): match for match in matches}
+
+
+def feeders(index, round_number, slot):
+    return [index[key] for key in feeder_slots(round_number, slot) if key in index]
+
+
+def advance_winner(match, winner):
+    # Puts `winner` into the next match in place of whoever this match sent
+    # there before, so correcting a result moves the right player on. Only
+    # this match's players can have come from its slot.
+    entrants = set(match.players.values_list('pk', flat=True))
+    if winner.pk not in entrants:
+        raise BracketError(f'{winner} did not play in {match}.')
+    if match.next_match_id is None:
+        return None
+    with transaction.atomic():
+        next_match = Match.objects.select_for_update().get(pk=match.next_match_id)
+        previous = (entrants & set(next_match.players.values_list('pk', flat=True))) - {winner.pk}
+        if previous:
+            next_match.players.remove(*previous)
+        next_match.players.add(winner)
+    return next_match
@@ -0,0 +1,112 @@
+from itertools import chain
+
+import numpy as np
+from django.db.models import Case, F, Q, When
+
+from snooker_app.achievements import CENTURY, HALF_CENTURY, MAXIMUM
+from snooker_app.models import Frame, Match, filter_matches
+from snooker_app.scoring import MIN_RECORDED_BREAK
+
+PERCENTILES = (25, 50, 75, 90, 95, 99)
+BUCKET_SIZE = 10
+BUCKET_EDGES = np.arange(MIN_RECORDED_BREAK, MAXIMUM + 2 * BUCKET_SIZE, BUCKET_SIZE)
+
+
+class BreakSet:
+    # Every recorded break in a selection of frames, flattened into one array.
+    # `owners[i]` is the "frame side" (one player's half of one frame) that
+    # breaks[i] belongs to, and `points[j]` is what that side scored in total.
+
+    def __init__(self, breaks, owners, points):
+        self.breaks = breaks
+        self.owners = owners
+        self.points = points
+
+    @classmethod
+    def from_sides(cls, sides):
+        # `sides` is a list of (breaks, points) pairs as they come out of the
+        # database; only the flattening touches Python objects.
+        lengths = np.fromiter((len(breaks or ()) for breaks, _ in sides), dtype=np.int64, count=len(sides))
+        total = int(lengths.sum())
+        breaks = np.fromiter(chain.from_iterable(breaks or () for breaks, _ in sides), dtype=np.int32, count=total)
+        owners = np.repeat(np.arange(len(sides)), lengths)
+        points = np.fromiter((points or 0 for _, points in sides), dtype=np.int64, count=len(sides))
+        return cls(breaks, owners, points)
+
+    def __len__(self):
+        return len(self.breaks)
+
+    def distribution(self):
+        counts, edges = np.histogram(self.breaks, bins=BUCKET_EDGES)
+        return [{'low': int(low), 'high': int(high) - 1, 'count': int(count)}
+                for low, high, count in zip(edges[:-1], edges[1:], counts)]
+
+    def percentiles(self):
+        if not len(self):
+            return {}
+        return dict(zip(PERCENTILES, np.percentile(self.breaks, PERCENTILES).round(1).tolist()))
+
+    def break_share(self):
+        # Fraction of a frame side's points that came from recorded breaks,
+        # averaged over the sides that scored, plus the overall ratio.
+        from_breaks = np.bincount(self.owners, weights=self.breaks, minlength=len(self.points))
+        scored = self.points > 0
+        if not scored.any():
+            return {'mean': 0.0, 'overall': 0.0}
+        shares = np.minimum(from_breaks[scored] / self.points[scored], 1.0)
+        return {
+            'mean': round(float(shares.mean()) * 100, 1),
+            'overall': round(float(from_breaks[scored].sum() / self.points[scored].sum()) * 100, 1),
+        }
+
+    def summary(self):
+        breaks = self.breaks
+        return {
+            'count': len(self),
+            'frames': len(self.points),
+            'total': int(breaks.sum()),
+            'average': round(float(breaks.mean()), 1) if len(self) else 0.0,
+            'highest': int(breaks.max()) if len(self) else 0,
+            'half_centuries': int(np.count_nonzero((breaks >= HALF_CENTURY) & (breaks < CENTURY))),
+            'centuries': int(np.count_nonzero(breaks >= CENTURY)),
+            'maximums': int(np.count_nonzero(breaks >= MAXIMUM)),
+            'percentiles': self.percentiles(),
+            'distribution': self.distribution(),
+            'break_share': self.break_share(),
+        }
+
+
+def _unique_frames(frames):
+    # Frames are reached through either MatchPlayer line, so the same frame
+    # number can appear twice for a match; keep one row per frame.
+    return (frames.order_by('match_player__match_id', 'frame_number', 'pk')
+            .distinct('match_player__match_id', 'frame_number'))
+
+
+def _in_season(frames, season):
+    if season is None:
+        return frames
+    return frames.filter(match_player__match__date__year=season)
+
+
+def player_breaks(player, season=None):
+    frames = Frame.objects.with_players().filter(Q(player1_id=player.pk) | Q(player2_id=player.pk))
+    frames = _unique_frames(_in_season(frames, season)).annotate(
+        own_breaks=Case(When(player1_id=player.pk, then=F('break_points_player1')),
+                        default=F('break_points_player2')),
+        own_points=Case(When(player1_id=player.pk, then=F('points_scored_player1')),
+                        default=F('points_scored_player2')),
+    )
+    return BreakSet.from_sides(list(frames.values_list('own_breaks', 'own_points')))
+
+
+def competition_breaks(competition, season=None):
+    matches = filter_matches(Match.objects.all(), competition_id=competition.pk)
+    frames = Frame.objects.filter(match_player__match__in=matches)
+    rows = _unique_frames(_in_season(frames, season)).values_list(
+        'break_points_player1', 'points_scored_player1', 'break_points_player2', 'points_scored_player2')
+    sides = []
+    for breaks1, points1, breaks2, points2 in rows:
+        sides.append((breaks1, points1))
+        sides.append((breaks2, points2))
+    return BreakSet.from_sides(sides)
@@ -0,0 +1,77 @@
+import time
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from snooker_app import page_cache
+from snooker_app.models import (Match, MatchPlayer, MatchResult, Frame, Referee, Competition, TemporaryPlayer,
+                                RatingHistory, ShotEvent, TEMPORARY_MATCH_LIFETIME)
+
+
+def _delete(queryset):
+    # One DELETE ... WHERE pk IN (...) statement. QuerySet.delete() would load
+    # every row to send delete signals and follow cascades, which is what a
+    # purge must not do; callers invalidate the cached pages themselves.
+    model = queryset.model
+    quote = connection.ops.quote_name
+    sql, params = queryset.values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {quote(model._meta.db_table)} WHERE {quote(model._meta.pk.column)} IN ({sql})',
+                       params)
+        return cursor.rowcount
+
+
+def _purge_matches(match_ids):
+    with transaction.atomic():
+        # Competition pages list their matches, so they are looked up while
+        # the links still exist and invalidated once the purge commits.
+        page_cache.invalidate_matches(match_ids, deferred=False)
+        Match.objects.filter(next_match__in=match_ids).update(next_match=None)
+        _delete(Frame.objects.filter(match_player__match__in=match_ids))
+        _delete(MatchPlayer.objects.filter(match__in=match_ids))
+        _delete(MatchResult.objects.filter(match__in=match_ids))
+        _delete(RatingHistory.objects.filter(match__in=match_ids))
+        _delete(ShotEvent.objects.filter(match__in=match_ids))
+        for through in (Match.players.through, Match.referees.through, Referee.matches.through,
+                        Competition.matches.through):
+            _delete(through.objects.filter(match__in=match_ids))
+        return _delete(Match.objects.filter(pk__in=match_ids))
+
+
+def orphaned_temporary_players(cutoff):
+    return TemporaryPlayer.objects.filter(created_at__lt=cutoff).exclude(
+        Q(pk__in=Match.objects.filter(temp_player1__isnull=False).values('temp_player1')) |
+        Q(pk__in=Match.objects.filter(temp_player2__isnull=False).values('temp_player2'))
+    )
+
+
+def purge_expired_temporary(batch_size=1000, pause=0.1, now=None, report=None):
+    # Deletes expired temporary matches, oldest first, and then the temporary
+    # players no match refers to any more. Each batch is its own short
+    # transaction and batches are `pause` seconds apart, so the match table
+    # is never locked for long.
+    started = time.perf_counter()
+    cutoff = (now or timezone.now()) - TEMPORARY_MATCH_LIFETIME
+    totals = {'matches': 0, 'temporary_players': 0, 'batches': 0, 'seconds': 0.0}
+    expired = (Match.objects.filter(is_temporary=True, created_at__lt=cutoff)
+               .order_by('created_at').values_list('pk', flat=True))
+
+    def finish_batch(kind, deleted):
+        totals[kind] += deleted
+        totals['batches'] += 1
+        totals['seconds'] = time.perf_counter() - started
+        if report:
+            report(totals)
+
+    while match_ids := list(expired[:batch_size]):
+        finish_batch('matches', _purge_matches(match_ids))
+        time.sleep(pause)
+
+    orphans = orphaned_temporary_players(cutoff).order_by('pk').values_list('pk', flat=True)
+    while player_ids := list(orphans[:batch_size]):
+        finish_batch('temporary_players', _delete(TemporaryPlayer.objects.filter(pk__in=player_ids)))
+        time.sleep(pause)
+
+    totals['seconds'] = time.perf_counter() - started
+    return totals
@@ -0,0 +1,131 @@
+import csv
+import json
+from itertools import islice
+
+from snooker_app.models import Match, Frame, GroupStage, filter_matches
+from snooker_app.standings import compute_group_standings
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+MATCH_COLUMNS = ('id', 'date', 'time', 'venue', 'number_of_frames', 'players', 'player_ids', 'referees',
+                 'referee_ids', 'group_name', 'knockout_name')
+FRAME_COLUMNS = ('match_id', 'frame_number', 'player1_id', 'player2_id', 'winner_id', 'duration_seconds',
+                 'points_scored_player1', 'points_scored_player2', 'max_break_player1', 'max_break_player2',
+                 'player1_fouls', 'player2_fouls', 'foul_points_player1', 'foul_points_player2',
+                 'misses_player1', 'misses_player2', 'total_shots_player1', 'total_shots_player2',
+                 'break_points_player1', 'break_points_player2')
+STANDING_COLUMNS = ('competition_id', 'competition', 'stage_id', 'stage', 'group', 'rank', 'player_id', 'player',
+                    'played', 'won', 'drawn', 'lost', 'frames_won', 'frames_lost', 'points')
+STANDINGS_STAGE_BATCH = 100
+
+
+class InvalidExport(ValueError):
+    pass
+
+
+def match_rows(matches, chunk_size=2000):
+    # Player and referee names come from the denormalized columns, so a match
+    # is one row of one query with no per-match lookups.
+    rows = (matches.order_by('date', 'time', 'pk')
+            .values_list('pk', 'date', 'time', 'venue__name', 'number_of_frames', 'player_names', 'player_ids',
+                         'referee_names', 'referee_ids', 'group_name', 'knockout_name'))
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield dict(zip(MATCH_COLUMNS, row))
+
+
+def frame_rows(matches, chunk_size=2000):
+    rows = (Frame.objects.with_players()
+            .filter(match_player__match__in=matches.values('pk'))
+            .order_by('match_player__match_id', 'frame_number', 'pk')
+            .values_list('match_player__match_id', 'frame_number', 'player1_id', 'player2_id', 'winner_id',
+                         'time_duration', *FRAME_COLUMNS[6:]))
+    last = None
+    for row in rows.iterator(chunk_size=chunk_size):
+        # Either of a match's lines can hold a frame; export it once.
+        if row[:2] == last:
+            continue
+        last = row[:2]
+        frame = dict(zip(FRAME_COLUMNS, row))
+        if frame['duration_seconds'] is not None:
+            frame['duration_seconds'] = frame['duration_seconds'].total_seconds()
+        yield frame
+
+
+def standing_rows(competition_id=None, date_from=None, date_to=None):
+    stages = GroupStage.objects.select_related('competition').order_by('competition_id', 'order', 'pk')
+    if competition_id:
+        stages = stages.filter(competition_id=competition_id)
+    if date_from:
+        stages = stages.filter(competition__end_date__gte=date_from)
+    if date_to:
+        stages = stages.filter(competition__start_date__lte=date_to)
+
+    stages = stages.iterator(chunk_size=STANDINGS_STAGE_BATCH)
+    while batch := list(islice(stages, STANDINGS_STAGE_BATCH)):
+        standings = compute_group_standings(batch)
+        for stage in batch:
+            for group_name, rows in standings[stage.pk].items():
+                for rank, row in enumerate(rows, start=1):
+                    yield {
+                        'competition_id': stage.competition_id,
+                        'competition': stage.competition.name,
+                        'stage_id': stage.pk,
+                        'stage': stage.name,
+                        'group': group_name,
+                        'rank': rank,
+                        'player_id': row['player'].pk,
+                        'player': str(row['player']),
+                        **{column: row[column] for column in STANDING_COLUMNS[8:]},
+                    }
+
+
+EXPORTS = {
+    'matches': MATCH_COLUMNS,
+    'frames': FRAME_COLUMNS,
+    'standings': STANDING_COLUMNS,
+}
+
+
+def export_rows(kind, competition_id=None, date_from=None, date_to=None, chunk_size=2000):
+    if kind not in EXPORTS:
+        raise InvalidExport(f'Unknown export: {kind!r}')
+    if kind == 'standings':
+        return standing_rows(competition_id, date_from, date_to)
+    matches = filter_matches(Match.objects.all(), competition_id=competition_id, date_from=date_from,
+                             date_to=date_to)
+    if kind == 'matches':
+        return match_rows(matches, chunk_size)
+    return frame_rows(matches, chunk_size)
+
+
+class _Echo:
+    # csv.writer wants a file; this one hands each formatted line back.
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    return ';'.join(str(item) for item in value) if isinstance(value, list) else value
+
+
+def _csv_lines(rows, columns):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[column]) for column in columns])
+
+
+def _jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row, default=str) + '\n'
+
+
+def encode(rows, columns, fmt):
+    # Returns an iterator over the export's lines, so it can feed a streaming
+    # response or a file without being held in memory.
+    if fmt not in FORMATS:
+        raise InvalidExport(f'Unknown format: {fmt!r}')
+    return _csv_lines(rows, columns) if fmt == 'csv' else _jsonl_lines(rows)
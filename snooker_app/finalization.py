@@ -0,0 +1,210 @@
+import time
+from collections import Counter
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from snooker_app import page_cache
+from snooker_app.achievements import AchievementEngine
+from snooker_app.head_to_head import HeadToHeadEngine, ordered_pair
+from snooker_app.models import Match, MatchPlayer, MatchResult, Frame, Player, PlayerStatistics, RatingHistory
+from snooker_app.player_stats import PLAYER_STAT_FIELDS
+from snooker_app.ratings import rate_pair
+
+LINE_FIELDS = MatchPlayer.FRAME_TOTAL_FIELDS + ['stats_recorded', 'achievements_recorded', 'head_to_head_recorded',
+                                                'rating_recorded']
+STATISTICS_FIELDS = ['matches_played', 'attempts', 'successful_pots', 'fouls', 'foul_points', 'timed_attempts',
+                     'total_shot_time', 'highest_break']
+RESULT_FIELDS = ['match_score', 'frames', 'total_fouls', 'player1_fouls', 'player2_fouls', 'player1_breaks',
+                 'player2_breaks', 'match_end_time', 'match_duration']
+
+
+class FinalizationError(ValueError):
+    pass
+
+
+def frame_scores(frame):
+    # Fouls score for the other player, as on the scoreboard.
+    return ((frame.points_scored_player1 or 0) + (frame.foul_points_player2 or 0),
+            (frame.points_scored_player2 or 0) + (frame.foul_points_player1 or 0))
+
+
+def is_decided(won_first, won_second, number_of_frames):
+    # Decided once a player has won more than half the frames, or every
+    # frame has been played, which an even number of frames can leave level.
+    return max(won_first, won_second) * 2 > number_of_frames or won_first + won_second >= number_of_frames
+
+
+def _total(frames, field):
+    return sum(getattr(frame, field) or 0 for frame in frames)
+
+
+def _line_totals(line, frames, suffix):
+    # The same totals scoring keeps on the lines, from the frames in hand.
+    breaks = [getattr(frame, f'max_break_player{suffix}') for frame in frames]
+    line.set_frame_totals(_total(frames, f'points_scored_player{suffix}'),
+                          max((b for b in breaks if b is not None), default=None),
+                          _total(frames, f'player{suffix}_fouls'), _total(frames, f'foul_points_player{suffix}'),
+                          _total(frames, f'total_shots_player{suffix}'), _total(frames, f'safety_shot_player{suffix}'),
+                          _total(frames, f'misses_player{suffix}'))
+
+
+def break_summary(frames, suffix):
+    breaks = [b for frame in frames for b in getattr(frame, f'break_points_player{suffix}')]
+    return {'breaks': breaks, 'highest': max(breaks, default=0)}
+
+
+def _result(match, result, frames, lines, won):
+    first, second = lines
+    result.match_score = f'{won[first.player_id]}-{won[second.player_id]}'
+    result.frames = [{'frame': frame.frame_number, 'winner_id': frame.winner_id, 'scores': list(frame_scores(frame))}
+                     for frame in frames]
+    result.player1_fouls = first.fouls
+    result.player2_fouls = second.fouls
+    result.total_fouls = first.fouls + second.fouls
+    result.player1_breaks = break_summary(frames, '1')
+    result.player2_breaks = break_summary(frames, '2')
+    result.match_end_time = result.match_end_time or timezone.now()
+    result.match = match
+    result.calculate_match_duration()
+
+
+def _finalize(match_id):
+    try:
+        match = Match.objects.select_for_update().get(pk=match_id)
+    except Match.DoesNotExist:
+        raise FinalizationError(f'No match {match_id}.') from None
+    lines = list(MatchPlayer.objects.select_for_update().filter(match=match, position__in=(1, 2))
+                 .order_by('position'))
+    if len(lines) != 2 or lines[0].player_id == lines[1].player_id:
+        raise FinalizationError('A match needs its two players before it can be finished.')
+    first, second = lines
+
+    # Either line can hold a frame; keep one per frame number.
+    frames = {}
+    for frame in Frame.objects.filter(match_player__match=match).order_by('frame_number', 'pk'):
+        frames.setdefault(frame.frame_number, frame)
+    frames = list(frames.values())
+    if not frames:
+        raise FinalizationError('A match needs at least one frame before it can be finished.')
+
+    decided = []
+    for frame in frames:
+        score1, score2 = frame_scores(frame)
+        if frame.winner_id is None and score1 != score2:
+            frame.winner_id = first.player_id if score1 > score2 else second.player_id
+            decided.append(frame)
+    won = Counter(frame.winner_id for frame in frames if frame.winner_id is not None)
+    won_first, won_second = won[first.player_id], won[second.player_id]
+    if not is_decided(won_first, won_second, match.number_of_frames):
+        raise FinalizationError(f'The match is not decided yet: {won_first}-{won_second} '
+                                f'of {match.number_of_frames} frames.')
+    Frame.objects.bulk_update(decided, ['winner'])
+
+    _line_totals(first, frames, '1')
+    _line_totals(second, frames, '2')
+
+    result = MatchResult.objects.filter(match=match).order_by('pk').first()
+    created = result is None
+    result = result or MatchResult()
+    _result(match, result, frames, lines, won)
+    if created:
+        # bulk_create skips post_save, whose receivers would record the
+        # derived numbers again one query at a time.
+        MatchResult.objects.bulk_create([result])
+    else:
+        MatchResult.objects.bulk_update([result], RESULT_FIELDS)
+
+    recorded = []
+    players = Player.objects.select_for_update().in_bulk([first.player_id, second.player_id])
+    player_fields = set()
+
+    # Statistics and achievements belong to one player each, so only the
+    # lines not yet recorded are folded in.
+    pending = [line for line in lines if not line.stats_recorded]
+    if pending:
+        statistics = PlayerStatistics.objects.select_for_update().in_bulk([line.player_id for line in pending],
+                                                                          field_name='player_id')
+        for line in pending:
+            totals = statistics.setdefault(line.player_id, PlayerStatistics(player_id=line.player_id))
+            totals.add(line)
+            for field, value in totals.player_fields().items():
+                setattr(players[line.player_id], field, value)
+            line.stats_recorded = True
+        PlayerStatistics.objects.bulk_create(list(statistics.values()), update_conflicts=True,
+                                             unique_fields=['player'], update_fields=STATISTICS_FIELDS)
+        player_fields.update(PLAYER_STAT_FIELDS)
+        recorded.append('stats')
+
+    pending = [line for line in lines if not line.achievements_recorded]
+    if pending:
+        engine = AchievementEngine()
+        engine.load([line.player_id for line in pending])
+        engine.consume_match([(match.pk, match.number_of_frames, frame.frame_number, first.player_id,
+                               second.player_id, frame.winner_id, frame.time_duration,
+                               frame.break_points_player1, frame.break_points_player2) for frame in frames])
+        # The other player's row already has this match.
+        engine.achievements = {line.player_id: engine.achievements[line.player_id] for line in pending}
+        engine.save()
+        for line in pending:
+            line.achievements_recorded = True
+        page_cache.invalidate_on_commit(page_cache.ACHIEVEMENTS)
+        recorded.append('achievements')
+
+    # Head-to-head and rating are shared by the pair: a match recorded
+    # against either line is already in them.
+    if not any(line.head_to_head_recorded for line in lines):
+        engine = HeadToHeadEngine()
+        engine.load([ordered_pair(first.player_id, second.player_id)])
+        engine.consume_match([(match.pk, match.date, frame.frame_number, first.player_id, second.player_id,
+                               frame.winner_id, frame.max_break_player1, frame.max_break_player2,
+                               frame.break_points_player1, frame.break_points_player2) for frame in frames])
+        engine.save()
+        recorded.append('head_to_head')
+    for line in lines:
+        line.head_to_head_recorded = True
+
+    if not any(line.rating_recorded for line in lines) and won:
+        score = 1.0 if won_first > won_second else 0.0 if won_first < won_second else 0.5
+        RatingHistory.objects.bulk_create(rate_pair(players[first.player_id], players[second.player_id], score,
+                                                    match.pk, match.date))
+        player_fields.update(['rating', 'rated_matches'])
+        recorded.append('rating')
+    if any(line.rating_recorded for line in lines) or won:
+        for line in lines:
+            line.rating_recorded = True
+
+    if player_fields:
+        Player.objects.bulk_update(list(players.values()), sorted(player_fields))
+    MatchPlayer.objects.bulk_update(lines, LINE_FIELDS)
+    page_cache.invalidate_matches([match.pk])
+
+    winner_id = first.player_id if won_first > won_second else second.player_id if won_second > won_first else None
+    return {
+        'match': match.pk,
+        'created': created,
+        'frames': len(frames),
+        'frame_winners_set': len(decided),
+        'score': result.match_score,
+        'winner_id': winner_id,
+        'recorded': recorded,
+    }
+
+
+def finalize_match(match):
+    # Finishes a match in one transaction: frame winners, the MatchPlayer
+    # totals, the MatchResult, and the player statistics, achievements,
+    # head-to-head and rating that depend on it, all computed from one read
+    # of the frames and written in bulk. Running it again rewrites the
+    # match's own rows with the same values and adds nothing to the derived
+    # numbers. Matches nobody has won yet are refused. The report lists the
+    # SQL it took.
+    started = time.perf_counter()
+    with CaptureQueriesContext(connection) as captured:
+        with transaction.atomic():
+            report = _finalize(getattr(match, 'pk', match))
+    report['queries'] = len(captured)
+    report['sql'] = [query['sql'] for query in captured.captured_queries]
+    report['seconds'] = time.perf_counter() - started
+    return report
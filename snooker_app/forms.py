@@ -1,5 +1,8 @@
+from urllib.parse import urlencode
+
 from django import forms
 from django.core.exceptions import ValidationError
+from django.urls import reverse
 from django.utils import timezone
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
@@ -47,6 +50,53 @@ class VenueForm(forms.ModelForm):
         fields = ['name', 'address', 'capacity']
 
 
+class SearchSelectWidget(forms.SelectMultiple):
+    # Renders only the choices already selected, plus a search box that finds
+    # the rest through a JSON search endpoint, instead of one option per row
+    # in the table. The form still posts a list of ids.
+    template_name = 'widgets/search_select.html'
+    search_url_name = None
+    placeholder = 'Search'
+
+    class Media:
+        js = ['js/search_select.js']
+
+    def __init__(self, attrs=None, search_params=None):
+        super().__init__(attrs)
+        self.search_params = search_params or {}
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        url = reverse(self.search_url_name)
+        context['widget']['search_url'] = f'{url}?{urlencode(self.search_params)}' if self.search_params else url
+        context['widget']['placeholder'] = self.placeholder
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        choices = self.choices
+        selected = [v for v in value if str(v).isdigit()]
+        self.choices = [(item.pk, str(item)) for item in choices.queryset.filter(pk__in=selected)]
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = choices
+
+
+class PlayerSearchWidget(SearchSelectWidget):
+    search_url_name = 'player_search'
+    placeholder = 'Search players by name'
+
+
+class RefereeSearchWidget(SearchSelectWidget):
+    search_url_name = 'referee_search'
+    placeholder = 'Search referees by name or licence'
+
+
+class MatchSearchWidget(SearchSelectWidget):
+    search_url_name = 'match_search'
+    placeholder = 'Search matches by player or date (YYYY-MM-DD)'
+
+
 # =======================================================
 # =======================================================
 # =======================================================
@@ -56,13 +106,13 @@ class VenueForm(forms.ModelForm):
 class MatchForm(forms.ModelForm):
     players = forms.ModelMultipleChoiceField(
         queryset=Player.objects.all(),
-        widget=forms.CheckboxSelectMultiple,
+        widget=PlayerSearchWidget,
         required=True,
     )
 
     referees = forms.ModelMultipleChoiceField(
         queryset=Referee.objects.all(),
-        widget=forms.CheckboxSelectMultiple,
+        widget=RefereeSearchWidget,
         required=False,
     )
 
@@ -98,7 +148,7 @@ class CompetitionForm(forms.ModelForm):
             'end_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
             'venue': forms.Select(attrs={'class': 'form-control'}),
             'competition_type': forms.Select(attrs={'class': 'form-control'}),
-            'matches': forms.CheckboxSelectMultiple(),
+            'matches': MatchSearchWidget(),
         }
 
     def __init__(self, *args, **kwargs):
@@ -131,6 +181,21 @@ class AddMatchesToCompetitionForm(forms.Form):
             self.fields['matches'].queryset = Match.objects.exclude(competitions=competition)
 
 
+class AddPlayersToCompetitionForm(forms.Form):
+    players = forms.ModelMultipleChoiceField(
+        queryset=Player.objects.all(),
+        widget=PlayerSearchWidget,
+        required=False
+    )
+
+    def __init__(self, *args, **kwargs):
+        competition = kwargs.pop('competition', None)
+        super().__init__(*args, **kwargs)
+        if competition:
+            self.fields['players'].queryset = Player.objects.exclude(competitions=competition)
+            self.fields['players'].widget.search_params = {'exclude_competition': competition.pk}
+
+
 class GroupStageForm(forms.ModelForm):
     default_frames = forms.IntegerField(min_value=1, initial=5)
 
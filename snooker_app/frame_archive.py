@@ -0,0 +1,250 @@
+import json
+import os
+import re
+import shutil
+import time
+from itertools import chain, islice
+
+import numpy as np
+from django.db.models import BigIntegerField, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from snooker_app.break_analytics import BreakSet
+from snooker_app.models import Competition, Frame, Match
+
+FORMAT_VERSION = 1
+META_FILE = 'meta.json'
+# Stands in for NULL in integer columns; float columns use NaN.
+NULL = -1
+
+# name, dtype, source column. Every column is one fixed-width .bin file with
+# a value per frame, in the same order.
+COLUMNS = (
+    ('frame_id', 'int64', 'pk'),
+    ('match_id', 'int64', 'match_player__match_id'),
+    ('competition_id', 'int64', 'competition_id'),
+    ('date', 'datetime64[D]', 'match_player__match__date'),
+    ('frame_number', 'int16', 'frame_number'),
+    ('player1_id', 'int64', 'player1_id'),
+    ('player2_id', 'int64', 'player2_id'),
+    ('winner_id', 'int64', 'winner_id'),
+    ('duration_seconds', 'float32', 'time_duration'),
+    ('points_scored_player1', 'int16', 'points_scored_player1'),
+    ('points_scored_player2', 'int16', 'points_scored_player2'),
+    ('max_break_player1', 'int16', 'max_break_player1'),
+    ('max_break_player2', 'int16', 'max_break_player2'),
+    ('player1_fouls', 'int16', 'player1_fouls'),
+    ('player2_fouls', 'int16', 'player2_fouls'),
+    ('foul_points_player1', 'int16', 'foul_points_player1'),
+    ('foul_points_player2', 'int16', 'foul_points_player2'),
+    ('pot_success_percentage_player1', 'float32', 'pot_success_percentage_player1'),
+    ('pot_success_percentage_player2', 'float32', 'pot_success_percentage_player2'),
+    ('safety_shot_player1', 'int16', 'safety_shot_player1'),
+    ('safety_shot_player2', 'int16', 'safety_shot_player2'),
+    ('misses_player1', 'int16', 'misses_player1'),
+    ('misses_player2', 'int16', 'misses_player2'),
+    ('total_shots_player1', 'int16', 'total_shots_player1'),
+    ('total_shots_player2', 'int16', 'total_shots_player2'),
+)
+# Breaks are ragged: all of one side's breaks end to end in one array, and
+# frame i's are values[offsets[i]:offsets[i + 1]].
+BREAK_COLUMNS = (
+    ('breaks_player1', 'int16', 'break_points_player1'),
+    ('breaks_player2', 'int16', 'break_points_player2'),
+)
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+def completed_competitions(today=None):
+    return Competition.objects.filter(end_date__lt=today or timezone.now().date())
+
+
+def archived_frames(competitions):
+    # One row per frame of a match in any of `competitions`, tagged with its
+    # competition: the stage's, or else the first one the match is linked to.
+    linked = Competition.matches.through.objects.filter(competition__in=competitions)
+    matches = Match.objects.filter(Q(pk__in=linked.values('match_id')) |
+                                   Q(group_stage__competition__in=competitions) |
+                                   Q(knockout_stage__competition__in=competitions))
+    first_link = linked.filter(match_id=OuterRef('match_player__match_id')).order_by('competition_id')
+    frames = (Frame.objects.with_players()
+              .filter(match_player__match__in=matches)
+              .annotate(competition_id=Coalesce(F('match_player__match__group_stage__competition_id'),
+                                                F('match_player__match__knockout_stage__competition_id'),
+                                                Subquery(first_link.values('competition_id')[:1]),
+                                                output_field=BigIntegerField()))
+              .order_by('match_player__match__date', 'match_player__match_id', 'frame_number', 'pk')
+              .distinct('match_player__match__date', 'match_player__match_id', 'frame_number'))
+    return frames.values_list(*(source for _, _, source in COLUMNS), *(source for _, _, source in BREAK_COLUMNS))
+
+
+def _column_values(dtype, values):
+    if dtype == 'datetime64[D]':
+        return np.array(values, dtype=dtype)
+    if dtype.startswith('float'):
+        return np.array([np.nan if value is None else value.total_seconds() if hasattr(value, 'total_seconds')
+                         else value for value in values], dtype=dtype)
+    return np.array([NULL if value is None else value for value in values], dtype=dtype)
+
+
+def _version_dirs(parent, base):
+    pattern = re.compile(rf'{re.escape(base)}\.\d+')
+    return [name for name in os.listdir(parent) if pattern.fullmatch(name)]
+
+
+def _publish(path, version):
+    # Points the `path` symlink at the `version` directory with one rename,
+    # so readers find the old archive or the new one and never neither. The
+    # previous version is kept for readers that still have it open; older
+    # ones, and any left behind by an interrupted write, are removed.
+    parent, base = os.path.split(path)
+    previous = os.path.basename(os.path.realpath(path)) if os.path.islink(path) else None
+    if os.path.isdir(path) and not os.path.islink(path):
+        # An archive written before versioning is moved aside once.
+        previous = f'{base}.0'
+        os.replace(path, os.path.join(parent, previous))
+    link = os.path.join(parent, f'{base}.link')
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(version, link)
+    os.replace(link, path)
+    for name in _version_dirs(parent, base):
+        if name not in (version, previous):
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+def write_archive(path, rows, chunk_size=10000):
+    # Streams `rows` (archived_frames() tuples) into a new directory of raw
+    # column files next to `path`, then publishes it as `path`.
+    path = os.path.abspath(path)
+    version = f'{os.path.basename(path)}.{time.time_ns()}'
+    staging = os.path.join(os.path.dirname(path), version)
+    os.makedirs(staging)
+    files = {name: open(os.path.join(staging, f'{name}.bin'), 'wb')
+             for name in chain((name for name, _, _ in COLUMNS), (name for name, _, _ in BREAK_COLUMNS),
+                               (f'{name}_offsets' for name, _, _ in BREAK_COLUMNS))}
+    ends = {name: 0 for name, _, _ in BREAK_COLUMNS}
+    count = 0
+    try:
+        for name, _, _ in BREAK_COLUMNS:
+            np.zeros(1, dtype='int64').tofile(files[f'{name}_offsets'])
+        rows = iter(rows)
+        while chunk := list(islice(rows, chunk_size)):
+            columns = list(zip(*chunk))
+            for (name, dtype, _), values in zip(COLUMNS, columns):
+                _column_values(dtype, values).tofile(files[name])
+            for (name, dtype, _), values in zip(BREAK_COLUMNS, columns[len(COLUMNS):]):
+                lengths = np.fromiter((len(breaks or ()) for breaks in values), dtype='int64', count=len(values))
+                np.fromiter(chain.from_iterable(breaks or () for breaks in values), dtype=dtype,
+                            count=int(lengths.sum())).tofile(files[name])
+                (ends[name] + np.cumsum(lengths)).tofile(files[f'{name}_offsets'])
+                ends[name] += int(lengths.sum())
+            count += len(chunk)
+    finally:
+        for f in files.values():
+            f.close()
+
+    meta = {
+        'version': FORMAT_VERSION,
+        'frames': count,
+        'null': NULL,
+        'columns': {name: dtype for name, dtype, _ in COLUMNS},
+        'breaks': {name: {'dtype': dtype, 'values': ends[name]} for name, dtype, _ in BREAK_COLUMNS},
+        'created_at': timezone.now().isoformat(),
+    }
+    with open(os.path.join(staging, META_FILE), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    _publish(path, version)
+    return meta
+
+
+def export_completed(path, today=None, chunk_size=10000):
+    rows = archived_frames(completed_competitions(today)).iterator(chunk_size=chunk_size)
+    return write_archive(path, rows, chunk_size=chunk_size)
+
+
+class FrameArchive:
+    # Read side of the archive. Columns are memory-mapped on first use, so
+    # opening an archive is cheap and a scan only pages in what it touches.
+    # The symlink is resolved once, so an open archive keeps reading the
+    # version it started with when a new one is published.
+
+    def __init__(self, path):
+        path = os.path.realpath(path)
+        try:
+            with open(os.path.join(path, META_FILE)) as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            raise ArchiveError(f'No frame archive at {path}') from None
+        if self.meta['version'] != FORMAT_VERSION:
+            raise ArchiveError(f"Unsupported frame archive version {self.meta['version']}")
+        self.path = path
+        self.mapped = {}
+
+    def __len__(self):
+        return self.meta['frames']
+
+    def _map(self, name, dtype, length):
+        if name not in self.mapped:
+            if length:
+                self.mapped[name] = np.memmap(os.path.join(self.path, f'{name}.bin'), dtype=dtype, mode='r',
+                                              shape=(length,))
+            else:
+                self.mapped[name] = np.empty(0, dtype=dtype)
+        return self.mapped[name]
+
+    def column(self, name):
+        if name not in self.meta['columns']:
+            raise ArchiveError(f'Unknown column: {name!r}')
+        return self._map(name, self.meta['columns'][name], len(self))
+
+    def breaks(self, side):
+        # (values, offsets) for side 1 or 2.
+        name = f'breaks_player{side}'
+        spec = self.meta['breaks'][name]
+        return self._map(name, spec['dtype'], spec['values']), self._map(f'{name}_offsets', 'int64', len(self) + 1)
+
+    def select(self, competition_id=None, player_id=None, season=None, date_from=None, date_to=None):
+        # Indexes of the frames that match every given filter.
+        mask = np.ones(len(self), dtype=bool)
+        if competition_id is not None:
+            mask &= self.column('competition_id') == competition_id
+        if player_id is not None:
+            mask &= (self.column('player1_id') == player_id) | (self.column('player2_id') == player_id)
+        if season is not None:
+            mask &= self.column('date').astype('datetime64[Y]') == np.datetime64(str(season), 'Y')
+        if date_from is not None:
+            mask &= self.column('date') >= np.datetime64(date_from, 'D')
+        if date_to is not None:
+            mask &= self.column('date') <= np.datetime64(date_to, 'D')
+        return np.flatnonzero(mask)
+
+    def _side(self, side, rows):
+        values, offsets = self.breaks(side)
+        starts = offsets[rows]
+        lengths = offsets[rows + 1] - starts
+        # Positions of every selected frame's breaks, without a Python loop.
+        within = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        points = np.maximum(self.column(f'points_scored_player{side}')[rows].astype(np.int64), 0)
+        return values[np.repeat(starts, lengths) + within].astype(np.int32), lengths, points
+
+    def break_set(self, rows=None, player_id=None):
+        # The BreakSet break_analytics builds from Postgres, built from the
+        # archive instead: both sides of every frame in `rows`, or only
+        # `player_id`'s side.
+        rows = np.arange(len(self)) if rows is None else np.asarray(rows, dtype=np.int64)
+        sides = []
+        for side in (1, 2):
+            side_rows = rows
+            if player_id is not None:
+                side_rows = rows[self.column(f'player{side}_id')[rows] == player_id]
+            sides.append(self._side(side, side_rows))
+        breaks = np.concatenate([side_breaks for side_breaks, _, _ in sides])
+        lengths = np.concatenate([side_lengths for _, side_lengths, _ in sides])
+        points = np.concatenate([side_points for _, _, side_points in sides])
+        return BreakSet(breaks, np.repeat(np.arange(len(points)), lengths), points)
@@ -1,17 +1,198 @@
-import openai
+import asyncio
+import hashlib
 import os
+import threading
+
+import openai
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
 from dotenv import load_dotenv
 
 load_dotenv()
 openai.api_key = os.getenv("OPAENAI_API_KEY")
 
-def analyze_achievement(text):
-    try:
-        response = openai.Completion.create(
-            engine='text-davinci-003',
-            prompt=text,
-            max_tokens=150,
+DEFAULT_BACKEND = 'snooker_app.gpt_integration.OpenAIBackend'
+DEFAULT_CACHE = 'default'
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_BATCH_WAIT = 0.05
+KEY_PREFIX = 'analysis'
+
+
+class AnalysisError(RuntimeError):
+    pass
+
+
+class OpenAIBackend:
+    # The completions endpoint takes a list of prompts, so a whole batch is
+    # one API call.
+    model = 'gpt-3.5-turbo-instruct'
+    max_tokens = 150
+
+    def __init__(self):
+        self.client = openai.AsyncOpenAI(api_key=openai.api_key)
+
+    async def complete(self, prompts):
+        response = await self.client.completions.create(model=self.model, prompt=prompts,
+                                                        max_tokens=self.max_tokens)
+        texts = [''] * len(prompts)
+        for choice in response.choices:
+            texts[choice.index] = choice.text.strip()
+        return texts
+
+
+class StubBackend:
+    # Answers locally and remembers each batch, for tests and offline work.
+    def __init__(self):
+        self.batches = []
+
+    async def complete(self, prompts):
+        self.batches.append(list(prompts))
+        return [f'Analysis: {prompt}' for prompt in prompts]
+
+
+def prompt_key(model, prompt):
+    digest = hashlib.sha256(f'{model}\0{prompt}'.encode()).hexdigest()
+    return f'{KEY_PREFIX}:{digest}'
+
+
+class AnalysisService:
+    # Runs every analysis on its own event loop thread, so no request waits
+    # on the backend. Identical prompts share one result: from the cache
+    # while it lasts, and from the pending call while one is in flight.
+    # Prompts that miss are grouped into batches of up to `batch_size`,
+    # collected for at most `batch_wait` seconds, and at most `concurrency`
+    # batches are sent at a time.
+
+    def __init__(self, backend, cache=None, ttl=DEFAULT_TTL, concurrency=DEFAULT_CONCURRENCY,
+                 batch_size=DEFAULT_BATCH_SIZE, batch_wait=DEFAULT_BATCH_WAIT):
+        self.backend = backend
+        self.cache = cache or caches[DEFAULT_CACHE]
+        self.ttl = ttl
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.model = getattr(backend, 'model', type(backend).__name__)
+        self.loop = None
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.sending = set()
+
+    def _start(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, name='analysis-service', daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self._setup(), self.loop).result()
+        return self.loop
+
+    async def _setup(self):
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.worker = asyncio.create_task(self._collect())
+
+    def submit(self, prompt):
+        # Returns a concurrent.futures.Future; safe to call from any thread.
+        return asyncio.run_coroutine_threadsafe(self._analyze(prompt), self._start())
+
+    async def analyze(self, prompt):
+        return await asyncio.wrap_future(self.submit(prompt))
+
+    async def _analyze(self, prompt):
+        key = prompt_key(self.model, prompt)
+        if key not in self.in_flight:
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                return cached
+            if key not in self.in_flight:
+                self.in_flight[key] = asyncio.get_running_loop().create_future()
+                self.queue.put_nowait((key, prompt))
+        return await asyncio.shield(self.in_flight[key])
+
+    async def _collect(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), max(timeout, 0)))
+                except asyncio.TimeoutError:
+                    break
+            await self.slots.acquire()
+            task = asyncio.create_task(self._send(batch))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def _send(self, batch):
+        error = AnalysisError('The analysis was cancelled.')
+        try:
+            texts = await self.backend.complete([prompt for _, prompt in batch])
+            if len(texts) != len(batch):
+                raise AnalysisError(f'Expected {len(batch)} analyses from the backend, got {len(texts)}.')
+            await self.cache.aset_many({key: text for (key, _), text in zip(batch, texts)}, self.ttl)
+            for (key, _), text in zip(batch, texts):
+                self.in_flight.pop(key).set_result(text)
+        except Exception as e:
+            error = e
+        finally:
+            # Whatever went wrong, cancellation included, nobody is left
+            # waiting on a prompt of this batch. Failures are not cached; the
+            # next request for the prompt retries.
+            for key, _ in batch:
+                future = self.in_flight.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(error)
+            self.slots.release()
+
+    async def _shutdown(self):
+        self.worker.cancel()
+        await asyncio.gather(self.worker, return_exceptions=True)
+
+    def close(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = None
+
+
+_service = None
+
+
+def get_service():
+    global _service
+    if _service is None:
+        backend = import_string(getattr(settings, 'SNOOKER_ANALYSIS_BACKEND', DEFAULT_BACKEND))
+        _service = AnalysisService(
+            backend(),
+            cache=caches[getattr(settings, 'SNOOKER_ANALYSIS_CACHE', DEFAULT_CACHE)],
+            ttl=getattr(settings, 'SNOOKER_ANALYSIS_TTL', DEFAULT_TTL),
+            concurrency=getattr(settings, 'SNOOKER_ANALYSIS_CONCURRENCY', DEFAULT_CONCURRENCY),
         )
-        return response.choices[0].text.strip()
+    return _service
+
+
+def set_service(service):
+    global _service
+    if _service is not None and _service is not service:
+        _service.close()
+    _service = service
+
+
+def submit_analysis(text):
+    return get_service().submit(text)
+
+
+async def analyze_achievement_async(text):
+    return await get_service().analyze(text)
+
+
+def analyze_achievement(text, timeout=30):
+    # Blocking form, kept for existing callers; views should use
+    # submit_analysis() or analyze_achievement_async() instead.
+    try:
+        return submit_analysis(text).result(timeout)
     except Exception as e:
         return f'Error: {e}'
@@ -0,0 +1,164 @@
+from collections import Counter
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Q
+
+from snooker_app.models import Frame, HeadToHead, MatchPlayer, MatchResult
+
+RECORD_FIELDS = ['matches', 'player1_wins', 'player2_wins', 'player1_frames', 'player2_frames',
+                 'player1_highest_break', 'player2_highest_break', 'last_played']
+
+FRAME_COLUMNS = ('match_player__match_id', 'match_player__match__date', 'frame_number', 'player1_id', 'player2_id',
+                 'winner_id', 'max_break_player1', 'max_break_player2', 'break_points_player1', 'break_points_player2')
+
+
+def ordered_pair(player_id, opponent_id):
+    return (player_id, opponent_id) if player_id < opponent_id else (opponent_id, player_id)
+
+
+def frame_rows(frames):
+    return (frames.with_players().order_by('match_player__match_id', 'frame_number')
+            .values_list(*FRAME_COLUMNS))
+
+
+class HeadToHeadEngine:
+    # Keeps the HeadToHead rows touched so far in memory and folds finished
+    # matches into them. Unlike achievements, order doesn't matter.
+
+    def __init__(self):
+        self.records = {}
+
+    def load(self, pairs):
+        # Creates the rows of pairs meeting for the first time, then locks
+        # every row, so two results for the same pair recorded at once are
+        # applied one after the other even when neither had a row yet.
+        missing = sorted(pair for pair in pairs if pair not in self.records)
+        if not missing:
+            return
+        HeadToHead.objects.bulk_create([HeadToHead(player1_id=player1_id, player2_id=player2_id)
+                                        for player1_id, player2_id in missing], ignore_conflicts=True)
+        query = Q()
+        for player1_id, player2_id in missing:
+            query |= Q(player1_id=player1_id, player2_id=player2_id)
+        for record in HeadToHead.objects.select_for_update().filter(query).order_by('player1', 'player2'):
+            self.records[(record.player1_id, record.player2_id)] = record
+
+    def _record(self, pair):
+        if pair not in self.records:
+            self.records[pair] = HeadToHead(player1_id=pair[0], player2_id=pair[1])
+        return self.records[pair]
+
+    def consume(self, rows):
+        # `rows` are FRAME_COLUMNS tuples grouped by match.
+        for match_id, match_rows in groupby(rows, key=lambda row: row[0]):
+            self.consume_match(match_rows)
+
+    def consume_match(self, rows):
+        frames_won = Counter()
+        highest = Counter()
+        players = None
+        played = None
+        last_frame_number = None
+        for _, date, frame_number, player1_id, player2_id, winner_id, max1, max2, breaks1, breaks2 in rows:
+            if frame_number == last_frame_number or None in (player1_id, player2_id) or player1_id == player2_id:
+                continue
+            last_frame_number = frame_number
+            players, played = (player1_id, player2_id), date
+            for player_id, max_break, breaks in ((player1_id, max1, breaks1), (player2_id, max2, breaks2)):
+                highest[player_id] = max(highest[player_id], max_break or 0, *breaks)
+            if winner_id in players:
+                frames_won[winner_id] += 1
+
+        if players is None:
+            return
+        record = self._record(ordered_pair(*players))
+        record.matches += 1
+        record.last_played = max(record.last_played or played, played)
+        sides = ((1, record.player1_id), (2, record.player2_id))
+        for side, player_id in sides:
+            setattr(record, f'player{side}_frames', getattr(record, f'player{side}_frames') + frames_won[player_id])
+            setattr(record, f'player{side}_highest_break',
+                    max(getattr(record, f'player{side}_highest_break'), highest[player_id]))
+        ranked = frames_won.most_common(2)
+        if ranked and (len(ranked) == 1 or ranked[0][1] > ranked[1][1]):
+            side = 1 if ranked[0][0] == record.player1_id else 2
+            setattr(record, f'player{side}_wins', getattr(record, f'player{side}_wins') + 1)
+
+    def save(self, batch_size=1000):
+        HeadToHead.objects.bulk_create(
+            list(self.records.values()),
+            update_conflicts=True,
+            unique_fields=['player1', 'player2'],
+            update_fields=RECORD_FIELDS,
+            batch_size=batch_size,
+        )
+
+
+def record_match(match):
+    # Incremental path: adds one finished match to its pair's row. The lines
+    # are locked first, so overlapping calls for one match count it once.
+    with transaction.atomic():
+        lines = list(MatchPlayer.objects.select_for_update()
+                     .filter(match=match, head_to_head_recorded=False).values_list('pk', flat=True))
+        if not lines:
+            return 0
+        engine = HeadToHeadEngine()
+        rows = list(frame_rows(Frame.objects.filter(match_player__match=match)))
+        engine.load({ordered_pair(row[3], row[4]) for row in rows if None not in row[3:5] and row[3] != row[4]})
+        engine.consume_match(rows)
+        engine.save()
+        MatchPlayer.objects.filter(pk__in=lines).update(head_to_head_recorded=True)
+    return len(engine.records)
+
+
+def rebuild(chunk_size=5000):
+    # Recomputes every pair from the frames of all finished matches in one
+    # pass over a server-side cursor, then replaces the table.
+    finished = MatchResult.objects.values('match_id')
+    rows = frame_rows(Frame.objects.filter(match_player__match__in=finished)).iterator(chunk_size=chunk_size)
+    engine = HeadToHeadEngine()
+    engine.consume(rows)
+    with transaction.atomic():
+        HeadToHead.objects.all().delete()
+        engine.save()
+        MatchPlayer.objects.filter(match__in=finished).update(head_to_head_recorded=True)
+        MatchPlayer.objects.exclude(match__in=finished).update(head_to_head_recorded=False)
+    return len(engine.records)
+
+
+def seen_by(record, player_id):
+    # A stored pair from one player's side of the table.
+    mine, theirs = (1, 2) if record.player1_id == player_id else (2, 1)
+    opponent = getattr(record, f'player{theirs}')
+    wins = getattr(record, f'player{mine}_wins')
+    losses = getattr(record, f'player{theirs}_wins')
+    return {
+        'opponent_id': opponent.pk,
+        'opponent': str(opponent),
+        'matches': record.matches,
+        'wins': wins,
+        'losses': losses,
+        'draws': record.matches - wins - losses,
+        'frames_won': getattr(record, f'player{mine}_frames'),
+        'frames_lost': getattr(record, f'player{theirs}_frames'),
+        'highest_break': getattr(record, f'player{mine}_highest_break'),
+        'opponent_highest_break': getattr(record, f'player{theirs}_highest_break'),
+        'last_played': record.last_played.isoformat() if record.last_played else None,
+    }
+
+
+def pair_record(player_id, opponent_id):
+    player1_id, player2_id = ordered_pair(player_id, opponent_id)
+    record = (HeadToHead.objects.select_related('player1', 'player2')
+              .filter(player1_id=player1_id, player2_id=player2_id).first())
+    return seen_by(record, player_id) if record else None
+
+
+def opponents(player_id):
+    # Every pair the player is part of, most played first; the unique
+    # constraint indexes player1 and the Meta index covers player2.
+    records = (HeadToHead.objects.select_related('player1', 'player2')
+               .filter(Q(player1_id=player_id) | Q(player2_id=player_id))
+               .order_by('-matches', 'pk'))
+    return [seen_by(record, player_id) for record in records]
@@ -0,0 +1,292 @@
+import csv
+import json
+import time
+from collections import Counter
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.postgres.fields import ArrayField
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+
+from snooker_app.finalization import break_summary, frame_scores, is_decided
+from snooker_app.models import (Venue, Player, Referee, Match, MatchPlayer, MatchResult, Frame, ImportedRecord,
+                                bulk_create_matches)
+
+# Import order: every kind only refers to kinds before it.
+KINDS = ('venues', 'players', 'referees', 'matches', 'match_players', 'frames')
+SIMPLE_KINDS = ('venues', 'players', 'referees')
+
+FIELDS = {
+    'venues': (Venue, ['name', 'address', 'capacity']),
+    'players': (Player, ['first_name', 'last_name', 'nickname']),
+    'referees': (Referee, ['first_name', 'last_name', 'license_number']),
+    'matches': (Match, ['date', 'time', 'number_of_frames', 'group_name', 'knockout_name']),
+    'match_players': (MatchPlayer, ['position', 'points_scored', 'max_break', 'fouls', 'foul_points',
+                                    'avg_shot_time', 'attempts', 'successful_pots']),
+    'frames': (Frame, ['frame_number', 'points_scored_player1', 'points_scored_player2',
+                       'max_break_player1', 'max_break_player2', 'player1_fouls', 'player2_fouls',
+                       'foul_points_player1', 'foul_points_player2', 'time_duration',
+                       'pot_success_percentage_player1', 'pot_success_percentage_player2',
+                       'safety_shot_player1', 'safety_shot_player2', 'misses_player1', 'misses_player2',
+                       'total_shots_player1', 'total_shots_player2',
+                       'break_points_player1', 'break_points_player2']),
+}
+# Columns without a usable default; rows missing one are refused before
+# anything in their batch is written.
+REQUIRED = {
+    'matches': ['date', 'time', 'number_of_frames'],
+    'match_players': ['position'],
+    'frames': ['frame_number'],
+}
+
+
+class ImportDataError(ValueError):
+    pass
+
+
+def read_rows(path):
+    # Streams dicts from a .csv file (header row) or a JSON-lines file. Empty
+    # CSV cells become None, like missing keys in JSON.
+    with open(path, newline='') as f:
+        if path.endswith('.csv'):
+            for row in csv.DictReader(f):
+                yield {key: value if value != '' else None for key, value in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+def split_list(value):
+    # Lists are JSON arrays in JSON-lines files and ';'-separated in CSV.
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [part.strip() for part in str(value).split(';') if part.strip()]
+
+
+def _convert(field, value):
+    if isinstance(field, ArrayField):
+        return [field.base_field.to_python(item) for item in split_list(value)]
+    if isinstance(field, models.DurationField) and not isinstance(value, timedelta):
+        try:
+            return timedelta(seconds=float(value))
+        except ValueError:
+            pass
+    return field.to_python(value)
+
+
+def field_values(model, names, row, line, required=()):
+    # Only columns that are present get set, so missing ones keep the
+    # model defaults.
+    for name in required:
+        if row.get(name) is None:
+            raise ImportDataError(f'Line {line}: missing required column {name}.')
+    values = {}
+    for name in names:
+        if row.get(name) is None:
+            continue
+        try:
+            values[name] = _convert(model._meta.get_field(name), row[name])
+        except ValidationError as e:
+            raise ImportDataError(f'Line {line}: invalid {name} {row[name]!r}: {" ".join(e.messages)}') from e
+    return values
+
+
+class Importer:
+    # Loads one kind of row at a time in bulk batches, one transaction per
+    # batch. Source ids are mapped to database ids through ImportedRecord
+    # rows written in the same transaction, so an interrupted import can be
+    # re-run and carries on after the last committed batch.
+
+    def __init__(self, batch_size=5000, report=None):
+        self.batch_size = batch_size
+        self.report = report or (lambda kind, totals: None)
+        self.id_maps = {}
+
+    def id_map(self, kind):
+        if kind not in self.id_maps:
+            self.id_maps[kind] = dict(ImportedRecord.objects.filter(kind=kind).values_list('source_id', 'object_id'))
+        return self.id_maps[kind]
+
+    def resolve(self, kind, source_id, line):
+        if source_id is None:
+            return None
+        try:
+            return self.id_map(kind)[str(source_id)]
+        except KeyError:
+            raise ImportDataError(f'Line {line}: {kind} {source_id!r} has not been imported.') from None
+
+    def run(self, kind, path):
+        if kind not in KINDS:
+            raise ImportDataError(f'Unknown kind: {kind!r}')
+        totals = {'rows': 0, 'imported': 0, 'skipped': 0, 'seconds': 0.0, 'rows_per_second': 0.0}
+        started = time.perf_counter()
+        for batch in batches(enumerate(read_rows(path), start=1), self.batch_size):
+            try:
+                with transaction.atomic():
+                    imported = self.import_batch(kind, batch)
+            except Exception:
+                # The failed batch was rolled back, so the maps may now hold
+                # ids that don't exist; reload them from the database.
+                self.id_maps.clear()
+                raise
+            totals['rows'] += len(batch)
+            totals['imported'] += imported
+            totals['skipped'] += len(batch) - imported
+            totals['seconds'] = time.perf_counter() - started
+            totals['rows_per_second'] = totals['rows'] / totals['seconds'] if totals['seconds'] else 0.0
+            self.report(kind, totals)
+        return totals
+
+    def _new_rows(self, kind, batch):
+        # Drops rows already imported by an earlier run or earlier in the file.
+        id_map = self.id_map(kind)
+        seen = set()
+        fresh = []
+        for line, row in batch:
+            source_id = row.get('id')
+            if source_id is None:
+                raise ImportDataError(f'Line {line}: {kind} rows need an id.')
+            source_id = str(source_id)
+            if source_id not in id_map and source_id not in seen:
+                seen.add(source_id)
+                fresh.append((line, source_id, row))
+        return fresh
+
+    def _remember(self, kind, rows, objects):
+        ImportedRecord.objects.bulk_create([
+            ImportedRecord(kind=kind, source_id=source_id, object_id=obj.pk)
+            for (_, source_id, _), obj in zip(rows, objects)
+        ])
+        self.id_map(kind).update((source_id, obj.pk) for (_, source_id, _), obj in zip(rows, objects))
+        return len(objects)
+
+    def import_batch(self, kind, batch):
+        if kind in SIMPLE_KINDS:
+            return self._import_simple(kind, batch)
+        return getattr(self, f'_import_{kind}')(batch)
+
+    def _import_simple(self, kind, batch):
+        model, names = FIELDS[kind]
+        rows = self._new_rows(kind, batch)
+        objects = model.objects.bulk_create([model(**field_values(model, names, row, line)) for line, _, row in rows])
+        return self._remember(kind, rows, objects)
+
+    def _import_matches(self, batch):
+        rows = self._new_rows('matches', batch)
+        links = []
+        for line, _, row in rows:
+            links.append(([self.resolve('players', source_id, line) for source_id in split_list(row.get('players'))],
+                          [self.resolve('referees', source_id, line) for source_id in split_list(row.get('referees'))]))
+        players = Player.objects.in_bulk({pk for player_ids, _ in links for pk in player_ids})
+        referees = Referee.objects.in_bulk({pk for _, referee_ids in links for pk in referee_ids})
+
+        pairs = []
+        referee_links = []
+        for (line, _, row), (player_ids, referee_ids) in zip(rows, links):
+            match = Match(venue_id=self.resolve('venues', row.get('venue'), line),
+                          **field_values(Match, FIELDS['matches'][1], row, line, REQUIRED['matches']))
+            match_players = [players[pk] for pk in player_ids]
+            match_referees = [referees[pk] for pk in referee_ids]
+            match.set_denormalized_fields(match_players, match_referees)
+            pairs.append((match, match_players))
+            referee_links.append((match, match_referees))
+
+        matches = bulk_create_matches(pairs, batch_size=self.batch_size)
+        MatchReferees = Match.referees.through
+        MatchReferees.objects.bulk_create([MatchReferees(match_id=match.pk, referee_id=referee.pk)
+                                           for match, match_referees in referee_links for referee in match_referees])
+        return self._remember('matches', rows, matches)
+
+    def _import_match_players(self, batch):
+        model, names = FIELDS['match_players']
+        resolved = [(line, row, self.resolve('matches', row.get('match'), line),
+                     self.resolve('players', row.get('player'), line)) for line, row in batch]
+        existing = set(MatchPlayer.objects.filter(match_id__in={match_id for _, _, match_id, _ in resolved})
+                       .values_list('match_id', 'player_id'))
+        lines = []
+        for line, row, match_id, player_id in resolved:
+            if match_id is None or player_id is None:
+                raise ImportDataError(f'Line {line}: match_players rows need a match and a player.')
+            if (match_id, player_id) in existing:
+                continue
+            existing.add((match_id, player_id))
+            lines.append(MatchPlayer(match_id=match_id, player_id=player_id,
+                                     **field_values(model, names, row, line, REQUIRED['match_players'])))
+        return len(MatchPlayer.objects.bulk_create(lines))
+
+    def _import_frames(self, batch):
+        # Frames hang off the match's position 1 line, like scored frames do.
+        model, names = FIELDS['frames']
+        match_ids = {line: self.resolve('matches', row.get('match'), line) for line, row in batch}
+        first_lines = dict(MatchPlayer.objects.filter(match_id__in=set(match_ids.values()), position=1)
+                           .values_list('match_id', 'pk'))
+        existing = set(Frame.objects.filter(match_player_id__in=first_lines.values())
+                       .values_list('match_player_id', 'frame_number'))
+        frames = []
+        for line, row in batch:
+            match_player_id = first_lines.get(match_ids[line])
+            if match_player_id is None:
+                raise ImportDataError(f'Line {line}: match {row.get("match")!r} has no position 1 player.')
+            values = field_values(model, names, row, line, REQUIRED['frames'])
+            if (match_player_id, values['frame_number']) in existing:
+                continue
+            existing.add((match_player_id, values['frame_number']))
+            frames.append(Frame(match_player_id=match_player_id,
+                                winner_id=self.resolve('players', row.get('winner'), line), **values))
+        return len(Frame.objects.bulk_create(frames))
+
+    def record_results(self):
+        # Imported matches come without a MatchResult, and everything derived
+        # from results (player statistics, achievements, head-to-head,
+        # ratings) only looks at matches that have one. Records one, without
+        # signals, for every imported match its frame winners decide; the
+        # rebuild commands then take them all in. Matches still undecided are
+        # picked up by a later run.
+        imported = ImportedRecord.objects.filter(kind='matches').values('object_id')
+        pending = (Match.objects.filter(pk__in=imported).exclude(pk__in=MatchResult.objects.values('match_id'))
+                   .order_by('pk').values_list('pk', 'number_of_frames'))
+        recorded = 0
+        for batch in batches(pending.iterator(chunk_size=self.batch_size), self.batch_size):
+            match_ids = [match_id for match_id, _ in batch]
+            lines = {}
+            for line in MatchPlayer.objects.filter(match_id__in=match_ids, position__in=(1, 2)).order_by('position'):
+                lines.setdefault(line.match_id, []).append(line)
+            frames = {}
+            for frame in (Frame.objects.filter(match_player__match_id__in=match_ids).select_related('match_player')
+                          .order_by('frame_number', 'pk')):
+                frames.setdefault(frame.match_player.match_id, {}).setdefault(frame.frame_number, frame)
+
+            results = []
+            for match_id, number_of_frames in batch:
+                match_lines = lines.get(match_id, [])
+                match_frames = list(frames.get(match_id, {}).values())
+                if len(match_lines) != 2 or match_lines[0].player_id == match_lines[1].player_id:
+                    continue
+                first, second = match_lines
+                won = Counter(frame.winner_id for frame in match_frames)
+                if not is_decided(won[first.player_id], won[second.player_id], number_of_frames):
+                    continue
+                results.append(MatchResult(
+                    match_id=match_id,
+                    match_score=f'{won[first.player_id]}-{won[second.player_id]}',
+                    frames=[{'frame': frame.frame_number, 'winner_id': frame.winner_id,
+                             'scores': list(frame_scores(frame))} for frame in match_frames],
+                    player1_fouls=first.fouls or 0,
+                    player2_fouls=second.fouls or 0,
+                    total_fouls=(first.fouls or 0) + (second.fouls or 0),
+                    player1_breaks=break_summary(match_frames, '1'),
+                    player2_breaks=break_summary(match_frames, '2'),
+                ))
+            MatchResult.objects.bulk_create(results)
+            recorded += len(results)
+        return recorded
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'snooker_app.live.InMemoryBackend'
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def match_channel(match_id):
+    return f'match:{match_id}'
+
+
+def competition_channel(competition_id):
+    return f'competition:{competition_id}'
+
+
+class Subscription:
+    def __init__(self, backend, channel):
+        self.backend = backend
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def deliver(self, message):
+        # Runs on the subscriber's loop. A spectator that can't keep up loses
+        # the oldest deltas rather than slowing down everybody else.
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.backend.unsubscribe(self)
+
+
+class InMemoryBackend:
+    # Fans messages out to subscribers in this process. Publishing is safe from
+    # any thread; delivery is scheduled on each subscriber's event loop.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            subscription.loop.call_soon_threadsafe(subscription.deliver, message)
+        return len(subscribers)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscriptions.get(channel, ()))
+
+
+class Broker:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def publish(self, channels, payload):
+        # The payload is encoded once however many spectators receive it.
+        message = json.dumps(payload, separators=(',', ':'))
+        return sum(self.backend.publish(channel, message) for channel in channels)
+
+    def subscribe(self, channel):
+        return self.backend.subscribe(channel)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        backend = import_string(getattr(settings, 'SNOOKER_LIVE_BACKEND', DEFAULT_BACKEND))
+        _broker = Broker(backend())
+    return _broker
+
+
+def set_broker(broker):
+    global _broker
+    _broker = broker
+
+
+def format_event(message, event='score'):
+    return f'event: {event}\ndata: {message}\n\n'
+
+
+async def event_stream(channel, keepalive=15):
+    subscription = get_broker().subscribe(channel)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                message = await subscription.get(timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(message)
+    finally:
+        subscription.close()
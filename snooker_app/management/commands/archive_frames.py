@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from snooker_app.frame_archive import export_completed
+
+
+def _date(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Writes the frames of every completed competition to a memory-mappable columnar archive.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Archive directory; replaced atomically if it exists.')
+        parser.add_argument('--today', type=_date, default=None,
+                            help='Treat competitions ending before this date (YYYY-MM-DD) as completed.')
+        parser.add_argument('--chunk-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        meta = export_completed(options['output'], today=options['today'], chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Done, {meta['frames']} frames archived to {options['output']}."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from snooker_app.achievements import backfill
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds every Achievement by replaying all finished frames in chronological order.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        players = backfill(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Done, achievements rebuilt for {players} players.'))
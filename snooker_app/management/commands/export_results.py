@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from snooker_app.exports import EXPORTS, FORMATS, InvalidExport, encode, export_rows
+
+
+def _date(value):
+    parsed = parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+class Command(BaseCommand):
+    help = 'Streams matches, frames or group standings to a CSV or JSON-lines file (or stdout).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--output', help='File to write, defaults to stdout.')
+        parser.add_argument('--competition', type=int)
+        parser.add_argument('--date-from', type=_date)
+        parser.add_argument('--date-to', type=_date)
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        try:
+            rows = export_rows(options['kind'], competition_id=options['competition'],
+                               date_from=options['date_from'], date_to=options['date_to'],
+                               chunk_size=options['chunk_size'])
+            lines = encode(rows, EXPORTS[options['kind']], options['format'])
+        except InvalidExport as e:
+            raise CommandError(e) from e
+
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        count = 0
+        with open(options['output'], 'w', newline='') as output:
+            for line in lines:
+                output.write(line)
+                count += 1
+        self.stderr.write(self.style.SUCCESS(f'Wrote {count} lines to {options["output"]}.'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from snooker_app.finalization import finalize_match, FinalizationError
+
+
+class Command(BaseCommand):
+    help = 'Finishes matches in one transaction each: frame winners, totals, result and derived numbers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('match_ids', nargs='+', type=int)
+        parser.add_argument('--sql', action='store_true', help='Print the statements each match took.')
+
+    def handle(self, *args, **options):
+        for match_id in options['match_ids']:
+            try:
+                report = finalize_match(match_id)
+            except FinalizationError as e:
+                raise CommandError(str(e))
+            if options['sql']:
+                for sql in report['sql']:
+                    self.stdout.write(sql)
+            recorded = ', '.join(report['recorded']) or 'nothing new'
+            self.stdout.write(self.style.SUCCESS(
+                f"Match {match_id} finished {report['score']} in {report['queries']} queries "
+                f"({report['seconds'] * 1000:.0f} ms); recorded {recorded}."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from snooker_app.importer import Importer, ImportDataError, KINDS
+
+
+class Command(BaseCommand):
+    help = ('Bulk imports historical venues, players, referees, matches, match player lines and frames from '
+            'CSV or JSON-lines files. Re-running skips rows that were already imported. Imported matches '
+            'their frames decide get a MatchResult; run recompute_player_stats, backfill_achievements, '
+            'rebuild_head_to_head and replay_ratings afterwards to take them in.')
+
+    def add_arguments(self, parser):
+        for kind in KINDS:
+            parser.add_argument(f'--{kind.replace("_", "-")}', dest=kind, metavar='FILE')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        files = [(kind, options[kind]) for kind in KINDS if options[kind]]
+        if not files:
+            raise CommandError('Nothing to import, pass at least one of: '
+                               + ', '.join(f'--{kind.replace("_", "-")}' for kind in KINDS))
+
+        importer = Importer(batch_size=options['batch_size'], report=self.report_batch)
+        for kind, path in files:
+            try:
+                totals = importer.run(kind, path)
+            except ImportDataError as e:
+                raise CommandError(f'{kind}: {e} Committed batches are kept, re-run to resume.') from e
+            self.stdout.write(self.style.SUCCESS(
+                f"{kind}: {totals['imported']} imported, {totals['skipped']} skipped in {totals['seconds']:.2f}s "
+                f"({totals['rows_per_second']:.0f} rows/s)"))
+        if any(kind in ('matches', 'match_players', 'frames') for kind, _ in files):
+            results = importer.record_results()
+            self.stdout.write(self.style.SUCCESS(f'results: {results} recorded'))
+
+    def report_batch(self, kind, totals):
+        if self.verbosity >= 2:
+            self.stdout.write(f"{kind}: {totals['rows']} rows ({totals['rows_per_second']:.0f} rows/s)")
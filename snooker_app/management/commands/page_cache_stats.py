@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+import snooker_app.views  # noqa: F401 - registers the cached pages
+from snooker_app.page_cache import stats
+
+
+class Command(BaseCommand):
+    help = 'Prints hit and miss counts for the cached competition and achievement pages.'
+
+    def handle(self, *args, **options):
+        for page, counts in stats().items():
+            total = counts['hits'] + counts['misses']
+            ratio = counts['hits'] / total * 100 if total else 0.0
+            self.stdout.write(f"{page}: {counts['hits']} hits, {counts['misses']} misses ({ratio:.1f}% hit rate)")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from snooker_app.cleanup import purge_expired_temporary
+
+
+class Command(BaseCommand):
+    help = 'Deletes expired temporary matches and orphaned temporary players in small, throttled batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.1, help='Seconds to wait between batches.')
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+
+        def report(totals):
+            if verbosity >= 2:
+                self.stdout.write(f"batch {totals['batches']}: {totals['matches']} matches, "
+                                  f"{totals['temporary_players']} temporary players")
+
+        totals = purge_expired_temporary(batch_size=options['batch_size'], pause=options['pause'], report=report)
+        self.stdout.write(self.style.SUCCESS(
+            f"Done, deleted {totals['matches']} matches and {totals['temporary_players']} temporary players "
+            f"in {totals['batches']} batches ({totals['seconds']:.2f}s)."))
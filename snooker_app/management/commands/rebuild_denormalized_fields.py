@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from snooker_app.models import Match, refresh_denormalized_fields
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds player_names, player_ids, referee_names and referee_ids for every match.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = 0
+        total = 0
+        while True:
+            match_ids = list(Match.objects.filter(pk__gt=last_id).order_by('pk')
+                             .values_list('pk', flat=True)[:chunk_size])
+            if not match_ids:
+                break
+            with transaction.atomic():
+                refresh_denormalized_fields(match_ids)
+            total += len(match_ids)
+            last_id = match_ids[-1]
+            self.stdout.write(f'Rebuilt {total} matches')
+
+        self.stdout.write(self.style.SUCCESS(f'Done, {total} matches rebuilt.'))
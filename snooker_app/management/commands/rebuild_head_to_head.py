@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from snooker_app.head_to_head import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the head-to-head table from the frames of every finished match.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        pairs = rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Done, head-to-head records rebuilt for {pairs} pairs.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from snooker_app.player_stats import recompute_all
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds PlayerStatistics and the stored Player averages from all recorded match results.'
+
+    def handle(self, *args, **options):
+        players = recompute_all()
+        self.stdout.write(self.style.SUCCESS(f'Done, statistics rebuilt for {players} players.'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from snooker_app.ratings import REPLAY_CHUNK_SIZE, replay
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds every player rating and the rating history by replaying all finished matches in order.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=REPLAY_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        report = replay(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Done, {report['matches']} matches rated for {report['players']} players "
+            f"in {report['seconds']:.1f}s."))
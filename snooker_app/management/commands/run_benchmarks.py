@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from snooker_app.benchmarks import SCALES, run_suite
+
+
+class Command(BaseCommand):
+    help = ('Builds a synthetic dataset, times the main views and model operations against it and checks their '
+            'query budgets. Everything runs in a transaction that is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='small')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='Run only these scenarios.')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout.')
+        parser.add_argument('--no-budget', action='store_true', help='Do not fail when a budget is exceeded.')
+
+    def handle(self, *args, **options):
+        report = run_suite(options['scale'], repeat=options['repeat'], seed=options['seed'], only=options['only'])
+        encoded = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(encoded + '\n')
+        else:
+            self.stdout.write(encoded)
+
+        for result in report['results']:
+            self.stderr.write(f"{result['name']:<36} {result['ms']['median']:>10.1f} ms "
+                              f"{result['queries']:>4}/{result['budget']} queries")
+        over = [result['name'] for result in report['results'] if not result['within_budget']]
+        if over and not options['no_budget']:
+            raise CommandError(f'Query budget exceeded: {", ".join(over)}')
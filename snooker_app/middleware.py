@@ -0,0 +1,119 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+# Enabled by adding 'snooker_app.middleware.RequestMetricsMiddleware' to
+# MIDDLEWARE after AuthenticationMiddleware, so staff can be recognised.
+logger = logging.getLogger('snooker_app.requests')
+
+DEFAULT_SLOW_REQUEST_MS = 500
+DEFAULT_SLOW_REQUEST_MAX_SQL = 100
+
+
+class QueryRecorder:
+    # Installed as an execute wrapper on every database connection for the
+    # length of one request; keeps the SQL, parameters and time of each query.
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, params, (time.perf_counter() - started) * 1000))
+
+    @property
+    def db_ms(self):
+        return sum(ms for _, _, ms in self.queries)
+
+    @property
+    def duplicates(self):
+        # Executions of a statement already run with the same parameters.
+        seen = set()
+        for sql, params, _ in self.queries:
+            seen.add((sql, repr(params)))
+        return len(self.queries) - len(seen)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return None
+    return match.view_name or match._func_path
+
+
+def _is_staff(request):
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_authenticated and user.is_staff)
+
+
+class RequestMetricsMiddleware:
+    # Records the view, wall time, query count, database time and duplicate
+    # queries of every request. Staff get them back as response headers;
+    # everyone's are logged as one JSON line, and requests slower than
+    # SNOOKER_SLOW_REQUEST_MS are logged as warnings along with their SQL.
+    # A streaming response is measured up to the point it starts streaming.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'SNOOKER_SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS)
+        self.max_sql = getattr(settings, 'SNOOKER_SLOW_REQUEST_MAX_SQL', DEFAULT_SLOW_REQUEST_MAX_SQL)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with self._recording(recorder):
+            response = self.get_response(request)
+        return self.finish(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with self._recording(recorder):
+            response = await self.get_response(request)
+        return self.finish(request, response, recorder, started)
+
+    def _recording(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def finish(self, request, response, recorder, started):
+        metrics = {
+            'method': request.method,
+            'path': request.path,
+            'view': _view_name(request),
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+            'queries': len(recorder.queries),
+            'db_ms': round(recorder.db_ms, 3),
+            'duplicate_queries': recorder.duplicates,
+        }
+        if _is_staff(request):
+            response['X-View-Name'] = metrics['view'] or ''
+            response['X-Query-Count'] = metrics['queries']
+            response['X-Duplicate-Query-Count'] = metrics['duplicate_queries']
+            response['Server-Timing'] = f"total;dur={metrics['duration_ms']}, db;dur={metrics['db_ms']}"
+
+        if self.slow_ms is not None and metrics['duration_ms'] >= self.slow_ms:
+            slow = {**metrics, 'slow': True, 'sql': [
+                {'sql': sql, 'ms': round(ms, 3)} for sql, _, ms in recorder.queries[:self.max_sql]
+            ]}
+            logger.warning(json.dumps(slow), extra={'metrics': slow})
+        else:
+            logger.info(json.dumps(metrics), extra={'metrics': metrics})
+        return response
@@ -1,15 +1,30 @@
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import OpClass
+from django.db.models import Max
+from django.db.models.functions import Cast, Substr, Upper
 
 from datetime import timedelta
 
-import random
+import time
 
 # Create your models here.
 
+INITIAL_RATING = 1500.0
+
+
+def prefix_indexes(prefix, fields, aliases=None):
+    # Prefix search: istartswith compares UPPER(name::text) with LIKE, which
+    # text_pattern_ops can answer whatever the collation. Index names are
+    # capped at 30 characters, so long field names take a short alias.
+    aliases = aliases or {}
+    return [models.Index(OpClass(Upper(Cast(field, models.TextField())), name='text_pattern_ops'),
+                         name=f'{prefix}_{aliases.get(field, field)}_prefix_idx')
+            for field in fields]
+
 
 class Player(models.Model):
     first_name = models.CharField(max_length=30, blank=True, null=True)
@@ -21,6 +36,14 @@ class Player(models.Model):
     avg_shots_per_match = models.FloatField(blank=True, null=True)
     avg_fouls_per_match = models.FloatField(blank=True, null=True)
     avg_foul_points_per_match = models.FloatField(blank=True, null=True)
+    rating = models.FloatField(default=INITIAL_RATING)
+    rated_matches = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['rating', 'id'], name='player_rating_idx'),
+            *prefix_indexes('player', ['first_name', 'last_name', 'nickname']),
+        ]
 
     def __str__(self):
         if self.nickname:
@@ -56,6 +79,31 @@ class Player(models.Model):
         return "N/A"
 
 
+class Counter(models.Model):
+    name = models.CharField(max_length=50, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
+    @classmethod
+    def reserve(cls, name, count=1, start=None):
+        # Atomically hands out the next `count` numbers as a range. The
+        # UPDATE locks the counter row until the caller's transaction ends,
+        # so concurrent callers queue up instead of getting the same numbers.
+        # `start` is called once, when the counter is first created, for the
+        # highest number already in use before it existed.
+        with transaction.atomic(savepoint=False):
+            if not cls.objects.filter(name=name).update(value=models.F('value') + count):
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(name=name, value=(start() if start else 0) + count)
+                except IntegrityError:
+                    cls.objects.filter(name=name).update(value=models.F('value') + count)
+            last = cls.objects.filter(name=name).values_list('value', flat=True).get()
+        return range(last - count + 1, last + 1)
+
+
 class TemporaryPlayer(models.Model):
     name = models.CharField(max_length=30)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -63,6 +111,24 @@ class TemporaryPlayer(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def highest_number(cls):
+        # The largest n among existing 'Player <n>' names, which were handed
+        # out from count() before the counter took over.
+        numbered = cls.objects.filter(name__regex=r'^Player [0-9]{1,18}$')
+        return numbered.aggregate(highest=Max(Cast(Substr('name', 8), models.BigIntegerField())))['highest'] or 0
+
+    @classmethod
+    def create_numbered(cls, count):
+        # Names are 'Player <n>' from a counter, so they stay unique however
+        # many quick matches start at once and cost the same at any table size.
+        with transaction.atomic(savepoint=False):
+            numbers = Counter.reserve('temporary_player', count, start=cls.highest_number)
+            return cls.objects.bulk_create([cls(name=f'Player {number}') for number in numbers])
+
+
+TEMPORARY_MATCH_LIFETIME = timedelta(days=30)
+
 
 class Match(models.Model):
     date = models.DateField()
@@ -84,10 +150,18 @@ class Match(models.Model):
     is_temporary = models.BooleanField(default=False)
     group_name = models.CharField(max_length=1, blank=True, null=True)
     knockout_name = models.CharField(max_length=100, blank=True, null=True)
+    bracket_round = models.PositiveSmallIntegerField(blank=True, null=True)
+    bracket_slot = models.PositiveIntegerField(blank=True, null=True)
+    next_match = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='feeder_matches')
 
     class Meta:
         indexes = [
             models.Index(fields=['date', 'time']),
+            models.Index(fields=['is_temporary', 'created_at'], name='match_temporary_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['knockout_stage', 'bracket_round', 'bracket_slot'],
+                                    name='unique_bracket_slot'),
         ]
 
     def __str__(self):
@@ -111,26 +185,79 @@ class Match(models.Model):
             self.knockout_stage = stage
             self.group_stage = None
 
-    def save(self, *args, **kwargs):
-        is_new = self.pk is None
-        super().save(*args, **kwargs)
-
-        if not is_new:
-            self.player_names = ', '.join([str(player) for player in self.players.all()])
-            self.player_ids = ', '.join([str(player.id) for player in self.players.all()])
-            self.referee_names = ', '.join([str(referee) for referee in self.referees.all()])
-            self.referee_ids = ', '.join([str(referee.id) for referee in self.referees.all()])
-            super().save(update_fields=['player_names', 'player_ids', 'referee_names', 'referee_ids'])
+    def set_denormalized_fields(self, players, referees=()):
+        players = sorted(players, key=lambda player: player.id)
+        referees = sorted(referees, key=lambda referee: referee.id)
+        self.player_names = ', '.join(str(player) for player in players)
+        self.player_ids = ', '.join(str(player.id) for player in players)
+        self.referee_names = ', '.join(str(referee) for referee in referees)
+        self.referee_ids = ', '.join(str(referee.id) for referee in referees)
 
     def is_expired(self):
-        return self.is_temporary and self.created_at < timezone.now() - timedelta(days=30)
+        return self.is_temporary and self.created_at < timezone.now() - TEMPORARY_MATCH_LIFETIME
 
     def delete_if_expired(self):
         if self.is_expired():
             self.delete()
 
 
+DENORMALIZED_MATCH_FIELDS = ['player_names', 'player_ids', 'referee_names', 'referee_ids']
+
+
+def refresh_denormalized_fields(match_ids):
+    # Recomputes player_names/player_ids/referee_names/referee_ids for the given
+    # matches with one read per relation and a single bulk UPDATE.
+    match_ids = list(match_ids)
+    players = {match_id: [] for match_id in match_ids}
+    referees = {match_id: [] for match_id in match_ids}
+    for link in (Match.players.through.objects.filter(match_id__in=match_ids)
+                 .select_related('player')):
+        players[link.match_id].append(link.player)
+    for link in (Match.referees.through.objects.filter(match_id__in=match_ids)
+                 .select_related('referee')):
+        referees[link.match_id].append(link.referee)
+
+    matches = []
+    for match_id in match_ids:
+        match = Match(pk=match_id)
+        match.set_denormalized_fields(players[match_id], referees[match_id])
+        matches.append(match)
+    Match.objects.bulk_update(matches, DENORMALIZED_MATCH_FIELDS)
+    return matches
+
+
+def bulk_create_matches(matches, batch_size=1000):
+    # Takes (match, players) pairs of unsaved matches and writes the matches and
+    # their player links with one bulk insert each, skipping Match.save().
+    Match.objects.bulk_create([match for match, _ in matches], batch_size=batch_size)
+    MatchPlayers = Match.players.through
+    MatchPlayers.objects.bulk_create(
+        [MatchPlayers(match_id=match.pk, player_id=player.pk) for match, players in matches for player in players],
+        batch_size=batch_size
+    )
+    return [match for match, _ in matches]
+
+
+def filter_matches(queryset, venue_id=None, competition_id=None, player_id=None, date_from=None, date_to=None):
+    if venue_id:
+        queryset = queryset.filter(venue_id=venue_id)
+    if competition_id:
+        linked = Competition.matches.through.objects.filter(competition_id=competition_id).values('match_id')
+        queryset = queryset.filter(models.Q(pk__in=linked) |
+                                   models.Q(group_stage__competition_id=competition_id) |
+                                   models.Q(knockout_stage__competition_id=competition_id))
+    if player_id:
+        queryset = queryset.filter(pk__in=Match.players.through.objects.filter(player_id=player_id).values('match_id'))
+    if date_from:
+        queryset = queryset.filter(date__gte=date_from)
+    if date_to:
+        queryset = queryset.filter(date__lte=date_to)
+    return queryset
+
+
 class MatchPlayer(models.Model):
+    FRAME_TOTAL_FIELDS = ['points_scored', 'max_break', 'fouls', 'foul_points', 'attempts', 'successful_pots']
+
     match = models.ForeignKey('Match', on_delete=models.CASCADE)
     player = models.ForeignKey('Player', on_delete=models.CASCADE)
     position = models.PositiveSmallIntegerField(choices=[(1, 'First'), (2, 'Second')])
@@ -141,6 +268,10 @@ class MatchPlayer(models.Model):
     avg_shot_time = models.DurationField(blank=True, null=True)
     attempts = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     successful_pots = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    stats_recorded = models.BooleanField(default=False)
+    achievements_recorded = models.BooleanField(default=False)
+    head_to_head_recorded = models.BooleanField(default=False)
+    rating_recorded = models.BooleanField(default=False)
 
     class Meta:
         unique_together = ('match', 'player')
@@ -160,6 +291,17 @@ class MatchPlayer(models.Model):
     def total_points(self):
         return self.points_scored + self.foul_points
 
+    def set_frame_totals(self, points, max_break, fouls, foul_points, shots, safeties, misses):
+        # Sums over one side of the match's frames. Shots include safeties and
+        # a pot is an attempt that wasn't missed; frames entered by hand can
+        # disagree, so the counts stop at zero rather than go negative.
+        self.points_scored = points or 0
+        self.max_break = max_break
+        self.fouls = fouls or 0
+        self.foul_points = foul_points or 0
+        self.attempts = max((shots or 0) - (safeties or 0), 0)
+        self.successful_pots = max(self.attempts - (misses or 0), 0)
+
     def calculate_points_scored(self):
         opponent_foul_points = \
         self.match.matchplayer_set.exclude(player=self.player).aggregate(models.Sum('foul_points'))['foul_points__sum'] or 0
@@ -170,6 +312,17 @@ class MatchPlayer(models.Model):
         super().save(*args, **kwargs)
 
 
+class FrameQuerySet(models.QuerySet):
+    def with_players(self):
+        # Frames only hang off one MatchPlayer, so resolve who played as
+        # player1/player2 from the match's position 1 and 2 lines.
+        lines = MatchPlayer.objects.filter(match_id=models.OuterRef('match_player__match_id'))
+        return self.annotate(
+            player1_id=models.Subquery(lines.filter(position=1).values('player_id')[:1]),
+            player2_id=models.Subquery(lines.filter(position=2).values('player_id')[:1]),
+        )
+
+
 class Frame(models.Model):
     match_player = models.ForeignKey('MatchPlayer', on_delete=models.CASCADE)
     frame_number = models.PositiveIntegerField()
@@ -201,13 +354,40 @@ class Frame(models.Model):
         default=list,
         blank=True
     )
+    live_events = models.JSONField(default=list, blank=True)
+    live_seq = models.PositiveIntegerField(default=0)
+    shot_events_logged = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = FrameQuerySet.as_manager()
+
     class Meta:
         unique_together = ('match_player', 'frame_number')
 
 
+class ShotEvent(models.Model):
+    # Append-only log of every scoring event, in the order it was applied.
+    # Rows are written in bulk with COPY (see snooker_app.shot_log); the match
+    # link has no database constraint so ingestion never waits on FK checks.
+    match = models.ForeignKey('Match', on_delete=models.CASCADE, db_constraint=False, related_name='shot_events')
+    frame_number = models.PositiveIntegerField()
+    sequence = models.PositiveIntegerField()
+    player = models.PositiveSmallIntegerField(choices=[(1, 'First'), (2, 'Second')])
+    kind = models.CharField(max_length=10)
+    value = models.PositiveSmallIntegerField(blank=True, null=True)
+    shot_time = models.FloatField(blank=True, null=True)
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['match', 'frame_number', 'sequence'], name='shot_event_sequence_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} by player {self.player} (match {self.match_id}, frame {self.frame_number})'
+
+
 class Referee(models.Model):
     first_name = models.CharField(max_length=30, blank=True)
     last_name = models.CharField(max_length=30, blank=True)
@@ -215,6 +395,10 @@ class Referee(models.Model):
 
     matches = models.ManyToManyField('Match', blank=True)
 
+    class Meta:
+        indexes = prefix_indexes('referee', ['first_name', 'last_name', 'license_number'],
+                                 aliases={'license_number': 'licence'})
+
     def __str__(self):
         if self.first_name and self.last_name:
             return f'{self.first_name} {self.last_name}'
@@ -279,30 +463,39 @@ class GroupStage(Stage):
     matches_per_pair = models.IntegerField(default=1, validators=[MinValueValidator(1)])
 
     def create_groups_and_matches(self, default_frames):
-        players = list(self.competition.players.all())
-        random.shuffle(players)
+        from snooker_app.ratings import seed_groups
+        started = time.perf_counter()
+        groups = seed_groups(self.competition.players.all(), self.num_groups, self.players_per_group)
+        match_time = timezone.now().time()
 
-        for i in range(self.num_groups):
+        matches = []
+        for i, group_players in enumerate(groups):
             group_name = chr(65 + i)
-            group_players = players[i*self.players_per_group:(i+1)*self.players_per_group]
 
             for j, player1 in enumerate(group_players):
                 for player2 in group_players[j+1:]:
                     for _ in range(self.matches_per_pair):
-                        match = Match.objects.create(
+                        match = Match(
                             date=self.competition.start_date,
-                            time=timezone.now().time(),
+                            time=match_time,
                             venue=self.competition.venue,
                             number_of_frames=default_frames,
                             group_stage=self,
-                            player_names=f"{player1}, {player2}",
-                            player_ids=f"{player1.id},{player2.id}",
-                            referee_names="",
-                            referee_ids="",
                             group_name=group_name
                         )
-                        match.players.add(player1, player2)
-                        match.save()
+                        match.set_denormalized_fields([player1, player2])
+                        matches.append((match, [player1, player2]))
+
+        from snooker_app.page_cache import invalidate_competitions
+        with transaction.atomic():
+            bulk_create_matches(matches)
+            invalidate_competitions([self.competition_id])
+
+        return {'matches': len(matches), 'seconds': time.perf_counter() - started}
+
+    def standings(self):
+        from snooker_app.standings import compute_group_standings
+        return compute_group_standings([self])[self.pk]
 
 
 class KnockoutStage(Stage):
@@ -310,38 +503,18 @@ class KnockoutStage(Stage):
     frames_per_match = models.IntegerField(validators=[MinValueValidator(1)])
 
     def create_knockout_matches(self):
-        players = list(self.competition.players.all())
-        random.shuffle(players)
-        num_matches = 2 ** (self.num_rounds - 1)
-
-        for round_num in range(self.num_rounds):
-            round_name = f'Round {round_num + 1}'
-            matches_in_round = num_matches // (2 ** round_num)
-
-            for i in range(matches_in_round):
-                if round_num == 0:
-                    player1 = players[2*i] if 2*i < len(players) else None
-                    player2 = players[2*i+1] if 2*i+1 < len(players) else None
-                else:
-                    player1 = player2 = None
-
-                match = Match.objects.create(
-                    date=self.competition.start_date + timedelta(days=round_num),
-                    time=timezone.now().time(),
-                    venue=self.competition.venue,
-                    number_of_frames=self.frames_per_match,
-                    knockout_stage=self,
-                    player_names="" if not player1 and not player2 else f'{player1},{player2}',
-                    player_ids="" if not player1 and not player2 else f"{player1.id},{player2.id}" if player1 and player2 else "",
-                    referee_names="",
-                    referee_ids="",
-                    knockout_name=round_name
-                )
-                if player1:
-                    match.players.add(player1)
-                if player2:
-                    match.players.add(player2)
-                match.save()
+        from snooker_app.brackets import build_bracket
+        from snooker_app.ratings import seed
+        started = time.perf_counter()
+        players = seed(self.competition.players.all())
+        from snooker_app.page_cache import invalidate_competitions
+        matches = build_bracket(self, players)
+        invalidate_competitions([self.competition_id])
+        return {'matches': len(matches), 'seconds': time.perf_counter() - started}
+
+    def bracket(self):
+        from snooker_app.brackets import bracket_index
+        return bracket_index(self)
 
     def clean(self):
         super().clean()
@@ -369,7 +542,10 @@ class MatchResult(models.Model):
 
     def calculate_match_duration(self):
         if self.match_end_time:
-            self.match_duration = self.match_end_time - timezone.datetime.combine(self.match.date, self.match.time)
+            started = timezone.datetime.combine(self.match.date, self.match.time)
+            if timezone.is_aware(self.match_end_time):
+                started = timezone.make_aware(started)
+            self.match_duration = self.match_end_time - started
 
     def save(self, *args, **kwargs):
         self.calculate_match_duration()
@@ -390,6 +566,110 @@ class Achievement(models.Model):
     longest_frame_won = models.DurationField(blank=True, null=True)
     consecutive_frames_won = models.IntegerField(default=0, validators=[MinValueValidator(0)])
     consecutive_matches_won = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    current_frame_streak = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    current_match_streak = models.IntegerField(default=0, validators=[MinValueValidator(0)])
 
     def __str__(self):
         return f'Achievements for {self.player}'
+
+
+class HeadToHead(models.Model):
+    # One row per pair of players who have met, with player1 the lower id, so
+    # a pair has a single place to look no matter which side is asked about.
+    player1 = models.ForeignKey('Player', on_delete=models.CASCADE, related_name='+')
+    player2 = models.ForeignKey('Player', on_delete=models.CASCADE, related_name='+')
+    matches = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    player1_wins = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    player2_wins = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    player1_frames = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    player2_frames = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    player1_highest_break = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    player2_highest_break = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    last_played = models.DateField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['player1', 'player2'], name='unique_head_to_head'),
+            models.CheckConstraint(check=models.Q(player1__lt=models.F('player2')), name='head_to_head_ordered'),
+        ]
+        indexes = [
+            models.Index(fields=['player2']),
+        ]
+
+    def __str__(self):
+        return f'{self.player1} v {self.player2}'
+
+
+class RatingHistory(models.Model):
+    # A player's rating before and after one rated match.
+    player = models.ForeignKey('Player', on_delete=models.CASCADE, related_name='rating_history')
+    match = models.ForeignKey('Match', on_delete=models.CASCADE, related_name='+')
+    played_on = models.DateField()
+    rating_before = models.FloatField()
+    rating_after = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['player', 'played_on', 'match'], name='rating_history_player_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.player}: {self.rating_before:.0f} -> {self.rating_after:.0f}'
+
+    @property
+    def change(self):
+        return self.rating_after - self.rating_before
+
+
+class PlayerStatistics(models.Model):
+    player = models.OneToOneField('Player', on_delete=models.CASCADE, related_name='statistics')
+    matches_played = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    successful_pots = models.IntegerField(default=0)
+    fouls = models.IntegerField(default=0)
+    foul_points = models.IntegerField(default=0)
+    timed_attempts = models.IntegerField(default=0)
+    total_shot_time = models.DurationField(default=timedelta)
+    highest_break = models.IntegerField(blank=True, null=True)
+
+    def __str__(self):
+        return f'Statistics for {self.player}'
+
+    def add(self, match_player):
+        self.matches_played += 1
+        self.attempts += match_player.attempts
+        self.successful_pots += match_player.successful_pots
+        self.fouls += match_player.fouls
+        self.foul_points += match_player.foul_points
+        if match_player.avg_shot_time is not None and match_player.attempts:
+            self.timed_attempts += match_player.attempts
+            self.total_shot_time += match_player.avg_shot_time * match_player.attempts
+        if match_player.max_break is not None:
+            self.highest_break = max(self.highest_break or 0, match_player.max_break)
+
+    def player_fields(self):
+        matches = self.matches_played
+        return {
+            'highest_break': self.highest_break,
+            'avg_shot_time': self.total_shot_time / self.timed_attempts if self.timed_attempts else None,
+            'pot_success_percentage': self.successful_pots / self.attempts * 100 if self.attempts else None,
+            'avg_shots_per_match': self.attempts / matches if matches else None,
+            'avg_fouls_per_match': self.fouls / matches if matches else None,
+            'avg_foul_points_per_match': self.foul_points / matches if matches else None,
+        }
+
+
+class ImportedRecord(models.Model):
+    # Maps an id from an imported source file to the row created for it, so
+    # later files can refer to it and a re-run skips what is already loaded.
+    kind = models.CharField(max_length=20)
+    source_id = models.CharField(max_length=64)
+    object_id = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'source_id'], name='unique_imported_record'),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.source_id} -> {self.object_id}'
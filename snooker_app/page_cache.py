@@ -0,0 +1,162 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse
+
+DEFAULT_ALIAS = 'default'
+DEFAULT_TIMEOUT = 600
+ACHIEVEMENTS = 'achievements'
+KEY_PREFIX = 'page_cache'
+PAGES = []
+
+
+def get_cache():
+    # Any configured Django cache works as the backend: locmem for a single
+    # process, the file cache, or a shared cache such as Redis or Memcached.
+    return caches[getattr(settings, 'SNOOKER_PAGE_CACHE', DEFAULT_ALIAS)]
+
+
+def competition_scope(competition_id):
+    return f'competition:{competition_id}'
+
+
+def _generation_key(scope):
+    return f'{KEY_PREFIX}:generation:{scope}'
+
+
+def _counter_key(page, outcome):
+    return f'{KEY_PREFIX}:stats:{page}:{outcome}'
+
+
+def _increment(cache, key, initial):
+    # incr() is atomic on shared backends; add() seeds a missing key without
+    # overwriting one another process created in the meantime.
+    try:
+        return cache.incr(key)
+    except ValueError:
+        if cache.add(key, initial + 1, None):
+            return initial + 1
+        return cache.incr(key)
+
+
+def generations(scopes, cache=None):
+    cache = cache or get_cache()
+    keys = [_generation_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Start from the clock so a generation that was evicted can never
+            # come back with a number an older cached page was stored under.
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def invalidate(*scopes):
+    # Bumping a scope's generation orphans every page stored under the old
+    # one; nothing needs to be found or deleted.
+    cache = get_cache()
+    for scope in set(scopes):
+        _increment(cache, _generation_key(scope), time.time_ns())
+
+
+def invalidate_on_commit(*scopes):
+    # Pages rendered inside the writing transaction would still see old rows,
+    # so the bump waits until the write is visible to everybody.
+    if scopes:
+        transaction.on_commit(lambda: invalidate(*scopes))
+
+
+def competition_ids_for_matches(match_ids):
+    from snooker_app.models import Competition, Match
+
+    match_ids = list(match_ids)
+    if not match_ids:
+        return set()
+    linked = Competition.matches.through.objects.filter(match_id__in=match_ids).values_list('competition_id', flat=True)
+    staged = Match.objects.filter(pk__in=match_ids).values_list('group_stage__competition_id',
+                                                               'knockout_stage__competition_id')
+    ids = set(linked)
+    for group_competition_id, knockout_competition_id in staged:
+        ids.update({group_competition_id, knockout_competition_id})
+    ids.discard(None)
+    return ids
+
+
+def competition_ids_for_player(player_id):
+    from snooker_app.models import Competition
+
+    return set(Competition.objects.filter(
+        Q(players=player_id) | Q(matches__players=player_id) |
+        Q(groupstage_stages__matches__players=player_id) | Q(knockoutstage_stages__matches__players=player_id)
+    ).values_list('pk', flat=True).distinct())
+
+
+def invalidate_competitions(competition_ids):
+    invalidate_on_commit(*(competition_scope(pk) for pk in competition_ids))
+
+
+def invalidate_matches(match_ids, deferred=True):
+    # Saves only need the lookup once they commit, which keeps it off the
+    # write path. Deletes must look up now, while the links still exist.
+    if deferred:
+        transaction.on_commit(lambda: invalidate(*(competition_scope(pk)
+                                                   for pk in competition_ids_for_matches(match_ids))))
+    else:
+        invalidate_competitions(competition_ids_for_matches(match_ids))
+
+
+def record(page, outcome, cache=None):
+    _increment(cache or get_cache(), _counter_key(page, outcome), 0)
+
+
+def stats(pages=None):
+    pages = PAGES if pages is None else pages
+    cache = get_cache()
+    keys = {(page, outcome): _counter_key(page, outcome) for page in pages for outcome in ('hits', 'misses')}
+    found = cache.get_many(keys.values())
+    result = {page: {'hits': 0, 'misses': 0} for page in pages}
+    for (page, outcome), key in keys.items():
+        result[page][outcome] = found.get(key, 0)
+    return result
+
+
+def page_key(page, request, scopes, cache=None):
+    # The navigation bar is the only per-user part of these pages, so the
+    # authentication state is the only thing about the user in the key.
+    parts = [page, request.get_full_path(), str(request.user.is_authenticated)]
+    parts.extend(f'{scope}={generation}' for scope, generation in zip(scopes, generations(scopes, cache)))
+    return f'{KEY_PREFIX}:page:{hashlib.sha256("|".join(parts).encode()).hexdigest()}'
+
+
+def cached_page(page, scopes):
+    # Caches a view's successful GET responses. `scopes(**view_kwargs)` lists
+    # the invalidation scopes the page depends on.
+    PAGES.append(page)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            cache = get_cache()
+            key = page_key(page, request, scopes(**kwargs), cache)
+            stored = cache.get(key)
+            if stored is not None:
+                record(page, 'hits', cache)
+                content, content_type = stored
+                return HttpResponse(content, content_type=content_type)
+
+            record(page, 'misses', cache)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                timeout = getattr(settings, 'SNOOKER_PAGE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,58 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _model_field(model, name):
+    return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+
+def encode_cursor(values):
+    raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(model, fields, cursor):
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(raw) != len(fields):
+            raise InvalidCursor(cursor)
+        return [_model_field(model, field).to_python(value) for field, value in zip(fields, raw)]
+    except (ValueError, TypeError, ValidationError) as e:
+        raise InvalidCursor(cursor) from e
+
+
+def _after(fields, values):
+    # Rows strictly after `values` in descending (fields) order, i.e. the
+    # row-value comparison (f1, f2, ...) < (v1, v2, ...) spelled out as ORs.
+    condition = Q()
+    for i, field in enumerate(fields):
+        step = Q(**{f'{field}__lt': values[i]})
+        for prior, value in zip(fields[:i], values[:i]):
+            step &= Q(**{prior: value})
+        condition |= step
+    return Q(**{f'{fields[0]}__lte': values[0]}) & condition
+
+
+def keyset_page(queryset, fields, cursor=None, per_page=50):
+    # Returns (items, next_cursor) for a queryset ordered by `fields`
+    # descending. `fields` must end with a unique column (normally 'pk').
+    fields = list(fields)
+    queryset = queryset.order_by(*[f'-{field}' for field in fields])
+    if cursor:
+        values = decode_cursor(queryset.model, fields, cursor)
+        queryset = queryset.filter(_after(fields, values))
+
+    items = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        next_cursor = encode_cursor([getattr(last, field) for field in fields])
+    return items, next_cursor
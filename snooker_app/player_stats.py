@@ -0,0 +1,79 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Sum, Max, F, Q, ExpressionWrapper, DurationField
+
+from snooker_app.models import Player, MatchPlayer, MatchResult, PlayerStatistics
+
+PLAYER_STAT_FIELDS = ['highest_break', 'avg_shot_time', 'pot_success_percentage',
+                      'avg_shots_per_match', 'avg_fouls_per_match', 'avg_foul_points_per_match']
+
+
+def record_match_players(match_players):
+    # Folds each not-yet-recorded MatchPlayer into its player's running totals
+    # and refreshes the stored Player averages from them. The work per line is
+    # constant: it never looks at the player's earlier matches. Callers pass
+    # lines locked in their transaction, so overlapping calls count one once.
+    recorded = []
+    with transaction.atomic():
+        for match_player in match_players:
+            if match_player.stats_recorded:
+                continue
+            PlayerStatistics.objects.get_or_create(player_id=match_player.player_id)
+            totals = PlayerStatistics.objects.select_for_update().get(player_id=match_player.player_id)
+            totals.add(match_player)
+            totals.save()
+            Player.objects.filter(pk=match_player.player_id).update(**totals.player_fields())
+            recorded.append(match_player.pk)
+        MatchPlayer.objects.filter(pk__in=recorded).update(stats_recorded=True)
+    return len(recorded)
+
+
+def record_match(match):
+    with transaction.atomic():
+        return record_match_players(MatchPlayer.objects.select_for_update()
+                                    .filter(match=match, stats_recorded=False).order_by('position'))
+
+
+def recompute_all():
+    # Rebuilds every player's totals from the MatchPlayer lines of matches with
+    # a recorded result, using one grouped query and bulk writes.
+    finished = Q(match__in=MatchResult.objects.values('match_id'))
+    shot_time = ExpressionWrapper(F('avg_shot_time') * F('attempts'), output_field=DurationField())
+    rows = (MatchPlayer.objects.filter(finished)
+            .values('player_id')
+            .annotate(total_matches=Count('match_id', distinct=True),
+                      total_attempts=Sum('attempts'),
+                      total_pots=Sum('successful_pots'),
+                      total_fouls=Sum('fouls'),
+                      total_foul_points=Sum('foul_points'),
+                      total_timed_attempts=Sum('attempts', filter=Q(avg_shot_time__isnull=False)),
+                      total_time=Sum(shot_time, filter=Q(avg_shot_time__isnull=False)),
+                      best_break=Max('max_break'))
+            .order_by())
+
+    totals = []
+    players = []
+    for row in rows:
+        statistics = PlayerStatistics(
+            player_id=row['player_id'],
+            matches_played=row['total_matches'],
+            attempts=row['total_attempts'],
+            successful_pots=row['total_pots'],
+            fouls=row['total_fouls'],
+            foul_points=row['total_foul_points'],
+            timed_attempts=row['total_timed_attempts'] or 0,
+            total_shot_time=row['total_time'] or timedelta(),
+            highest_break=row['best_break'],
+        )
+        totals.append(statistics)
+        players.append(Player(pk=statistics.player_id, **statistics.player_fields()))
+
+    with transaction.atomic():
+        PlayerStatistics.objects.all().delete()
+        PlayerStatistics.objects.bulk_create(totals, batch_size=1000)
+        Player.objects.update(**{field: None for field in PLAYER_STAT_FIELDS})
+        Player.objects.bulk_update(players, PLAYER_STAT_FIELDS, batch_size=1000)
+        MatchPlayer.objects.filter(finished).update(stats_recorded=True)
+        MatchPlayer.objects.exclude(finished).update(stats_recorded=False)
+    return len(players)
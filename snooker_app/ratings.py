@@ -0,0 +1,170 @@
+import random
+import time
+from itertools import groupby, islice
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from snooker_app.models import Player, MatchPlayer, MatchResult, Frame, RatingHistory, INITIAL_RATING
+
+K_FACTOR = 32
+SCALE = 400
+REPLAY_CHUNK_SIZE = 20000
+
+
+def expected_score(rating, opponent):
+    # Works on plain numbers and on numpy arrays alike.
+    return 1 / (1 + 10 ** ((opponent - rating) / SCALE))
+
+
+def rating_change(rating, opponent, score, k=K_FACTOR):
+    return k * (score - expected_score(rating, opponent))
+
+
+def line_rows(lines):
+    # MatchPlayer lines in chronological order with the frames each player
+    # won; a frame counts once whichever of the match's lines it hangs off.
+    won = (Frame.objects.filter(match_player__match_id=OuterRef('match_id'), winner_id=OuterRef('player_id'))
+           .order_by().values('winner_id').annotate(frames=Count('frame_number', distinct=True)).values('frames'))
+    return (lines.annotate(frames_won=Coalesce(Subquery(won), 0))
+            .order_by('match__date', 'match__time', 'match_id', 'position')
+            .values_list('match_id', 'match__date', 'player_id', 'frames_won'))
+
+
+def outcomes(rows):
+    # Yields (match_id, date, player_id, opponent_id, score) for every match
+    # between two players in which a frame was decided; score is 1, 0 or 0.5
+    # from the first player's side.
+    for match_id, match_rows in groupby(rows, key=lambda row: row[0]):
+        match_rows = list(match_rows)
+        if len(match_rows) != 2 or match_rows[0][2] == match_rows[1][2]:
+            continue
+        (_, played, player_id, won), (_, _, opponent_id, lost) = match_rows
+        if won or lost:
+            yield match_id, played, player_id, opponent_id, 1.0 if won > lost else 0.0 if won < lost else 0.5
+
+
+def layers(first, second):
+    # Splits a chronological run of matches into layers in which no player
+    # appears twice, keeping each player's matches in order, so a whole layer
+    # can be rated at once and give the same result as going match by match.
+    last = {}
+    found = np.empty(len(first), dtype=np.int64)
+    for i, (a, b) in enumerate(zip(first.tolist(), second.tolist())):
+        found[i] = last[a] = last[b] = max(last.get(a, -1), last.get(b, -1)) + 1
+    return found
+
+
+def rate_chunk(ratings, first, second, scores):
+    # Updates `ratings` (indexed by position) in place for one chronological
+    # chunk and returns every match's ratings before and after.
+    before = np.empty((len(first), 2))
+    after = np.empty((len(first), 2))
+    found = layers(first, second)
+    order = np.argsort(found, kind='stable')
+    boundaries = np.flatnonzero(np.diff(found[order])) + 1
+    for members in np.split(order, boundaries):
+        a, b = first[members], second[members]
+        before[members, 0], before[members, 1] = ratings[a], ratings[b]
+        change = rating_change(ratings[a], ratings[b], scores[members])
+        ratings[a] += change
+        ratings[b] -= change
+        after[members, 0], after[members, 1] = ratings[a], ratings[b]
+    return before, after
+
+
+def replay(chunk_size=REPLAY_CHUNK_SIZE):
+    # Rebuilds every rating and all rating history from the lines of every
+    # finished match, oldest first, in chunks rated a layer at a time.
+    started = time.perf_counter()
+    player_ids = np.fromiter(Player.objects.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+    position = {player_id: i for i, player_id in enumerate(player_ids.tolist())}
+    ratings = np.full(len(player_ids), INITIAL_RATING)
+    rated = np.zeros(len(player_ids), dtype=np.int64)
+
+    finished = MatchResult.objects.values('match_id')
+    rows = outcomes(line_rows(MatchPlayer.objects.filter(match__in=finished)).iterator(chunk_size=chunk_size))
+    matches = 0
+    with transaction.atomic():
+        RatingHistory.objects.all().delete()
+        while chunk := list(islice(rows, chunk_size)):
+            match_ids, dates, firsts, seconds, scores = zip(*chunk)
+            first = np.array([position[player_id] for player_id in firsts])
+            second = np.array([position[player_id] for player_id in seconds])
+            before, after = rate_chunk(ratings, first, second, np.array(scores))
+            np.add.at(rated, first, 1)
+            np.add.at(rated, second, 1)
+            RatingHistory.objects.bulk_create([
+                RatingHistory(player_id=player_id, match_id=match_id, played_on=played,
+                              rating_before=rating_before, rating_after=rating_after)
+                for match_id, played, pair, pair_before, pair_after
+                in zip(match_ids, dates, zip(firsts, seconds), before.tolist(), after.tolist())
+                for player_id, rating_before, rating_after in zip(pair, pair_before, pair_after)
+            ], batch_size=1000)
+            matches += len(chunk)
+
+        Player.objects.bulk_update(
+            [Player(pk=player_id, rating=rating, rated_matches=count)
+             for player_id, rating, count in zip(player_ids.tolist(), ratings.tolist(), rated.tolist())],
+            ['rating', 'rated_matches'], batch_size=1000)
+        MatchPlayer.objects.filter(match__in=finished).update(rating_recorded=True)
+        MatchPlayer.objects.exclude(match__in=finished).update(rating_recorded=False)
+    return {'matches': matches, 'players': int(np.count_nonzero(rated)), 'seconds': time.perf_counter() - started}
+
+
+def rate_pair(player, opponent, score, match_id, played):
+    # Applies one result to two (locked) Player instances and returns the
+    # unsaved RatingHistory rows for it.
+    change = rating_change(player.rating, opponent.rating, score)
+    history = []
+    for rated, delta in ((player, change), (opponent, -change)):
+        history.append(RatingHistory(player=rated, match_id=match_id, played_on=played,
+                                     rating_before=rated.rating, rating_after=rated.rating + delta))
+        rated.rating += delta
+        rated.rated_matches += 1
+    return history
+
+
+def record_match(match):
+    # Incremental path: rates one finished match against the players'
+    # current ratings. The lines are locked first, so overlapping calls rate
+    # a match once, and only lines that were rated are marked, so a match
+    # without a decided frame yet is rated by a later call.
+    with transaction.atomic():
+        lines = dict(MatchPlayer.objects.select_for_update().filter(match=match, rating_recorded=False)
+                     .order_by('position').values_list('player_id', 'pk'))
+        if not lines:
+            return 0
+        rated = []
+        found = outcomes(line_rows(MatchPlayer.objects.filter(match=match)))
+        for match_id, played, player_id, opponent_id, score in found:
+            if player_id not in lines or opponent_id not in lines:
+                continue
+            players = Player.objects.select_for_update().in_bulk([player_id, opponent_id])
+            player, opponent = players[player_id], players[opponent_id]
+            RatingHistory.objects.bulk_create(rate_pair(player, opponent, score, match_id, played))
+            Player.objects.bulk_update([player, opponent], ['rating', 'rated_matches'])
+            rated += [lines[player_id], lines[opponent_id]]
+        MatchPlayer.objects.filter(pk__in=rated).update(rating_recorded=True)
+    return len(rated) // 2
+
+
+def seed(players):
+    # Highest rated first. Players with equal ratings, such as newcomers who
+    # have never been rated, are drawn in random order.
+    players = list(players)
+    random.shuffle(players)
+    players.sort(key=lambda player: player.rating, reverse=True)
+    return players
+
+
+def seed_groups(players, num_groups, players_per_group):
+    # Deals the seeded players into groups in snake order (A B C D D C B A
+    # ...), so every group gets a similar spread of ratings.
+    groups = [[] for _ in range(num_groups)]
+    for i, player in enumerate(seed(players)[:num_groups * players_per_group]):
+        row, column = divmod(i, num_groups)
+        groups[column if row % 2 == 0 else num_groups - 1 - column].append(player)
+    return groups
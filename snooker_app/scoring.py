@@ -0,0 +1,240 @@
+import math
+
+from django.db import transaction
+from django.db.models import Sum, Max, Q
+from django.utils import timezone
+
+from snooker_app.live import get_broker, match_channel, competition_channel
+from snooker_app.models import Frame, MatchPlayer, Competition
+from snooker_app.shot_log import log_events
+
+MAX_POINTS_ON_TABLE = 147
+MIN_RECORDED_BREAK = 10
+BALL_VALUES = range(1, 8)
+FOUL_VALUES = range(4, 8)
+EVENT_TYPES = ('pot', 'miss', 'safety', 'foul', 'undo', 'set_player')
+
+
+class ScoringError(ValueError):
+    pass
+
+
+def _choice(value, allowed):
+    # JSON true and 3.0 compare equal to 1 and 3, so the type is checked too.
+    return type(value) is int and value in allowed
+
+
+def _seconds(value):
+    return type(value) in (int, float) and math.isfinite(value) and value >= 0
+
+
+def validate_event(event):
+    if not isinstance(event, dict) or event.get('type') not in EVENT_TYPES:
+        raise ScoringError(f'Unknown event: {event!r}')
+    kind = event['type']
+    if kind == 'pot' and not _choice(event.get('value'), BALL_VALUES):
+        raise ScoringError(f'A pot needs a ball value between 1 and 7: {event!r}')
+    if kind == 'foul' and not _choice(event.get('points'), FOUL_VALUES):
+        raise ScoringError(f'A foul is worth between 4 and 7 points: {event!r}')
+    if kind == 'set_player' and not _choice(event.get('player'), (1, 2)):
+        raise ScoringError(f'The active player must be 1 or 2: {event!r}')
+    if 'time' in event and not _seconds(event['time']):
+        raise ScoringError(f'Shot time must be a non-negative number of seconds: {event!r}')
+    compact = {'type': kind}
+    for key in ('value', 'points', 'player', 'time'):
+        if key in event:
+            compact[key] = event[key]
+    return compact
+
+
+def replay(events):
+    # Folds a frame's event list into its totals. Undo is handled by the
+    # caller dropping events, so replaying is always from the start.
+    state = {
+        'active_player': 1,
+        'current_break': 0,
+        'points': [0, 0],
+        'pots': [0, 0],
+        'misses': [0, 0],
+        'safeties': [0, 0],
+        'fouls': [0, 0],
+        'foul_points': [0, 0],
+        'breaks': [[], []],
+        'max_break': [0, 0],
+    }
+
+    def end_break():
+        player = state['active_player'] - 1
+        if state['current_break'] >= MIN_RECORDED_BREAK:
+            state['breaks'][player].append(state['current_break'])
+        state['max_break'][player] = max(state['max_break'][player], state['current_break'])
+        state['current_break'] = 0
+
+    def switch():
+        end_break()
+        state['active_player'] = 3 - state['active_player']
+
+    for event in events:
+        player = state['active_player'] - 1
+        kind = event['type']
+        if kind == 'pot':
+            state['points'][player] += event['value']
+            state['pots'][player] += 1
+            state['current_break'] += event['value']
+        elif kind == 'miss':
+            state['misses'][player] += 1
+            switch()
+        elif kind == 'safety':
+            state['safeties'][player] += 1
+            switch()
+        elif kind == 'foul':
+            state['fouls'][player] += 1
+            state['foul_points'][player] += event['points']
+            switch()
+        elif kind == 'set_player' and event['player'] != state['active_player']:
+            switch()
+
+    player = state['active_player'] - 1
+    state['max_break'][player] = max(state['max_break'][player], state['current_break'])
+    state['points_on_table'] = max(0, MAX_POINTS_ON_TABLE - sum(state['points']))
+    state['scores'] = [state['points'][0] + state['foul_points'][1], state['points'][1] + state['foul_points'][0]]
+    return state
+
+
+def next_player(active, event):
+    # Who is at the table after `event`, as replay() would have it.
+    if event['type'] in ('miss', 'safety', 'foul'):
+        return 3 - active
+    if event['type'] == 'set_player':
+        return event['player']
+    return active
+
+
+def _apply_totals(frame, state):
+    for index, suffix in ((0, '1'), (1, '2')):
+        attempts = state['pots'][index] + state['misses'][index]
+        setattr(frame, f'points_scored_player{suffix}', state['points'][index])
+        setattr(frame, f'max_break_player{suffix}', state['max_break'][index])
+        setattr(frame, f'player{suffix}_fouls', state['fouls'][index])
+        setattr(frame, f'foul_points_player{suffix}', state['foul_points'][index])
+        setattr(frame, f'safety_shot_player{suffix}', state['safeties'][index])
+        setattr(frame, f'misses_player{suffix}', state['misses'][index])
+        setattr(frame, f'total_shots_player{suffix}', attempts + state['safeties'][index])
+        setattr(frame, f'pot_success_percentage_player{suffix}',
+                state['pots'][index] / attempts * 100 if attempts else 0.0)
+        setattr(frame, f'break_points_player{suffix}', state['breaks'][index])
+
+
+def match_lines(match, create=True):
+    # The position 1 and 2 MatchPlayer lines of a match, created on first use
+    # from the match's players in id order. With create=False missing lines
+    # come back unsaved, so reading a match never writes to it.
+    lines = {line.position: line for line in MatchPlayer.objects.filter(match=match).select_related('player')}
+    if len(lines) < 2:
+        players = list(match.players.order_by('pk')[:2])
+        if len(players) < 2:
+            raise ScoringError('A match needs two players before it can be scored.')
+        taken = {line.player_id for line in lines.values()}
+        for position in (1, 2):
+            if position not in lines:
+                player = next(player for player in players if player.pk not in taken)
+                taken.add(player.pk)
+                if create:
+                    lines[position], _ = MatchPlayer.objects.get_or_create(match=match, player=player,
+                                                                           defaults={'position': position})
+                else:
+                    lines[position] = MatchPlayer(match=match, player=player, position=position)
+    return lines[1], lines[2]
+
+
+def _refresh_match_lines(match, lines):
+    totals = Frame.objects.filter(match_player__match=match).aggregate(
+        points1=Sum('points_scored_player1'), points2=Sum('points_scored_player2'),
+        break1=Max('max_break_player1'), break2=Max('max_break_player2'),
+        fouls1=Sum('player1_fouls'), fouls2=Sum('player2_fouls'),
+        foul_points1=Sum('foul_points_player1'), foul_points2=Sum('foul_points_player2'),
+        misses1=Sum('misses_player1'), misses2=Sum('misses_player2'),
+        shots1=Sum('total_shots_player1'), shots2=Sum('total_shots_player2'),
+        safeties1=Sum('safety_shot_player1'), safeties2=Sum('safety_shot_player2'),
+    )
+    for line, suffix in zip(lines, ('1', '2')):
+        line.set_frame_totals(totals[f'points{suffix}'], totals[f'break{suffix}'], totals[f'fouls{suffix}'],
+                              totals[f'foul_points{suffix}'], totals[f'shots{suffix}'], totals[f'safeties{suffix}'],
+                              totals[f'misses{suffix}'])
+    MatchPlayer.objects.bulk_update(lines, MatchPlayer.FRAME_TOTAL_FIELDS)
+
+
+def frame_state(frame, lines):
+    state = replay(frame.live_events)
+    return {
+        'match': lines[0].match_id,
+        'frame': frame.frame_number,
+        'seq': frame.live_seq,
+        'players': [{'id': line.player_id, 'name': str(line.player)} for line in lines],
+        'active_player': state['active_player'],
+        'current_break': state['current_break'],
+        'scores': state['scores'],
+        'points_on_table': state['points_on_table'],
+        'breaks': state['breaks'],
+        'fouls': state['fouls'],
+        'foul_points': state['foul_points'],
+        'events': len(frame.live_events),
+    }
+
+
+def apply_events(match, frame_number, events, seq=None):
+    # Applies one client batch to a frame under a row lock. A batch whose seq
+    # was already applied is ignored, so clients can safely retry.
+    events = [validate_event(event) for event in events]
+    with transaction.atomic():
+        lines = match_lines(match)
+        frame = Frame.objects.filter(match_player__match=match, frame_number=frame_number).first()
+        if frame is None:
+            frame, _ = Frame.objects.get_or_create(match_player=lines[0], frame_number=frame_number)
+        frame = Frame.objects.select_for_update().get(pk=frame.pk)
+        if seq is not None and seq <= frame.live_seq:
+            return frame_state(frame, lines)
+
+        shots = []
+        active = replay(frame.live_events)['active_player']
+        recorded_at = timezone.now()
+        for event in events:
+            frame.shot_events_logged += 1
+            shots.append((match.pk, frame_number, frame.shot_events_logged, event.get('player', active),
+                          event['type'], event.get('value', event.get('points')), event.get('time'), recorded_at))
+            if event['type'] == 'undo':
+                if frame.live_events:
+                    frame.live_events.pop()
+                active = replay(frame.live_events)['active_player']
+            else:
+                frame.live_events.append(event)
+                active = next_player(active, event)
+        if seq is not None:
+            frame.live_seq = seq
+        _apply_totals(frame, replay(frame.live_events))
+        frame.save()
+        _refresh_match_lines(match, lines)
+        state = frame_state(frame, lines)
+        transaction.on_commit(lambda: publish_score(match, state))
+        transaction.on_commit(lambda: log_events(shots))
+    return state
+
+
+def publish_score(match, state):
+    # Pushes a small score delta to everyone following the match or one of
+    # the competitions it belongs to.
+    competition_ids = (Competition.objects
+                       .filter(Q(matches=match) | Q(groupstage_stages__matches=match) |
+                               Q(knockoutstage_stages__matches=match))
+                       .values_list('pk', flat=True).distinct())
+    channels = [match_channel(match.pk)] + [competition_channel(pk) for pk in competition_ids]
+    delta = {key: state[key] for key in ('match', 'frame', 'seq', 'scores', 'active_player', 'current_break')}
+    return get_broker().publish(channels, delta)
+
+
+def current_state(match, frame_number):
+    lines = match_lines(match, create=False)
+    frame = Frame.objects.filter(match_player__match=match, frame_number=frame_number).first()
+    if frame is None:
+        frame = Frame(match_player=lines[0], frame_number=frame_number)
+    return frame_state(frame, lines)
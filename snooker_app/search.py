@@ -0,0 +1,46 @@
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+
+from snooker_app.models import Player, Referee, Match
+
+PLAYER_SEARCH_FIELDS = ('first_name', 'last_name', 'nickname')
+REFEREE_SEARCH_FIELDS = ('first_name', 'last_name', 'license_number')
+MAX_TERMS = 4
+
+
+def _prefix_search(queryset, fields, query):
+    # Every word of `query` has to start one of `fields`. Each word is a
+    # prefix match the prefix_indexes on the model can answer.
+    for term in query.split()[:MAX_TERMS]:
+        queryset = queryset.filter(reduce(or_, (Q(**{f'{field}__istartswith': term}) for field in fields)))
+    return queryset
+
+
+def search_players(query, players=None):
+    # "ron rock" finds Ronnie "Rocket" O'Sullivan.
+    return _prefix_search(Player.objects.all() if players is None else players, PLAYER_SEARCH_FIELDS, query)
+
+
+def search_referees(query, referees=None):
+    return _prefix_search(Referee.objects.all() if referees is None else referees, REFEREE_SEARCH_FIELDS, query)
+
+
+def search_matches(query, matches=None):
+    # A word that is a date (2024-07-01) picks that day; any other word has
+    # to start a name of one of the match's players, so "ronnie judd" finds
+    # their matches.
+    matches = Match.objects.all() if matches is None else matches
+    for term in query.split()[:MAX_TERMS]:
+        try:
+            day = parse_date(term)
+        except ValueError:
+            day = None
+        if day:
+            matches = matches.filter(date=day)
+        else:
+            playing = Match.players.through.objects.filter(player__in=search_players(term))
+            matches = matches.filter(pk__in=playing.values('match_id'))
+    return matches
@@ -0,0 +1,150 @@
+import atexit
+import csv
+import io
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from snooker_app.models import ShotEvent
+
+DEFAULT_MAX_ROWS = 500
+DEFAULT_MAX_SECONDS = 2.0
+# How many unwritten events a buffer keeps while the database is failing,
+# as a multiple of max_rows; the oldest are dropped beyond that.
+PENDING_FACTOR = 20
+
+logger = logging.getLogger('snooker_app.shot_log')
+COPY_COLUMNS = ('match_id', 'frame_number', 'sequence', 'player', 'kind', 'value', 'shot_time', 'recorded_at')
+
+
+def copy_rows(rows):
+    # Writes ShotEvent rows (COPY_COLUMNS tuples) with one COPY statement.
+    # An unquoted empty CSV field is NULL to COPY, which is what csv writes
+    # for None.
+    if not rows:
+        return 0
+    data = io.StringIO()
+    csv.writer(data).writerows(rows)
+    data.seek(0)
+    sql = (f'COPY {ShotEvent._meta.db_table} ({", ".join(COPY_COLUMNS)}) '
+           f'FROM STDIN WITH (FORMAT csv)')
+    with connection.cursor() as cursor:
+        cursor.copy_expert(sql, data)
+    return len(rows)
+
+
+class ShotEventBuffer:
+    # Collects committed events from every request in this process and
+    # writes them once `max_rows` are waiting or the oldest has waited
+    # `max_seconds`; a timer covers the second case when no more events
+    # arrive. A failed write keeps the events for the next attempt and never
+    # reaches the request that logged them. Events still buffered when a
+    # process dies are lost; the frame totals they produced are already
+    # saved on Frame.
+
+    def __init__(self, max_rows=DEFAULT_MAX_ROWS, max_seconds=DEFAULT_MAX_SECONDS):
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+        self.lock = threading.Lock()
+        # Held for a whole flush, so one COPY runs at a time and rows a failed
+        # COPY puts back are written before anything buffered after them.
+        self.flush_lock = threading.Lock()
+        self.rows = []
+        self.oldest = None
+        self.timer = None
+
+    def add(self, rows):
+        with self.lock:
+            if not self.rows:
+                self.oldest = time.monotonic()
+            self.rows.extend(rows)
+            due = len(self.rows) >= self.max_rows or time.monotonic() - self.oldest >= self.max_seconds
+            if not due:
+                self._schedule()
+        if due:
+            self.flush(blocking=False)
+
+    def _schedule(self):
+        # Called with the lock held.
+        if self.timer is None:
+            self.timer = threading.Timer(self.max_seconds, self._flush_on_timer)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _cancel(self):
+        # Called with the lock held.
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def _flush_on_timer(self):
+        with self.lock:
+            self.timer = None
+        try:
+            self.flush()
+        finally:
+            # The timer thread opened its own connection.
+            connection.close()
+
+    def flush(self, blocking=True):
+        # The rows are taken out under the lock and written outside it, so
+        # other requests keep buffering while a COPY runs. A request that
+        # finds a flush already running leaves its rows to the timer rather
+        # than wait for it.
+        if not self.flush_lock.acquire(blocking=blocking):
+            with self.lock:
+                self._schedule()
+            return 0
+        try:
+            with self.lock:
+                rows, self.rows = self.rows, []
+                self._cancel()
+            try:
+                with transaction.atomic():
+                    return copy_rows(rows)
+            except Exception:
+                logger.exception('Could not write %d shot events; keeping them for the next flush.', len(rows))
+                with self.lock:
+                    self.rows[:0] = rows
+                    dropped = len(self.rows) - self.max_rows * PENDING_FACTOR
+                    if dropped > 0:
+                        del self.rows[:dropped]
+                        logger.error('Dropped the %d oldest unwritten shot events.', dropped)
+                    self.oldest = time.monotonic()
+                    self._schedule()
+                return 0
+        finally:
+            self.flush_lock.release()
+
+    def close(self):
+        with self.lock:
+            self._cancel()
+
+    def __len__(self):
+        return len(self.rows)
+
+
+_buffer = None
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        _buffer = ShotEventBuffer(
+            max_rows=getattr(settings, 'SNOOKER_SHOT_EVENT_BUFFER', DEFAULT_MAX_ROWS),
+            max_seconds=getattr(settings, 'SNOOKER_SHOT_EVENT_FLUSH_SECONDS', DEFAULT_MAX_SECONDS),
+        )
+        atexit.register(_buffer.flush)
+    return _buffer
+
+
+def set_buffer(buffer):
+    global _buffer
+    _buffer = buffer
+
+
+def log_events(rows):
+    get_buffer().add(rows)
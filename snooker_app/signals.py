@@ -0,0 +1,120 @@
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from snooker_app.models import (Match, MatchResult, MatchPlayer, Frame, Competition, GroupStage, KnockoutStage,
+                                Achievement, Player, DENORMALIZED_MATCH_FIELDS, refresh_denormalized_fields)
+from snooker_app import achievements, head_to_head, page_cache, player_stats, ratings
+
+
+def _sync_match_relations(instance, action, reverse, pk_set):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_match_ids = list(instance.match_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action != 'post_clear' and not pk_set:
+        return
+
+    if not reverse:
+        refreshed, = refresh_denormalized_fields([instance.pk])
+        for field in DENORMALIZED_MATCH_FIELDS:
+            setattr(instance, field, getattr(refreshed, field))
+    elif action == 'post_clear':
+        refresh_denormalized_fields(instance.__dict__.pop('_cleared_match_ids', []))
+    else:
+        refresh_denormalized_fields(pk_set)
+
+
+def _changed_match_ids(instance, action, reverse, pk_set):
+    if not reverse:
+        return [instance.pk]
+    if action == 'pre_clear':
+        return list(instance.match_set.values_list('pk', flat=True))
+    return pk_set or ()
+
+
+@receiver(m2m_changed, sender=Match.players.through)
+def match_players_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        page_cache.invalidate_matches(_changed_match_ids(instance, action, reverse, pk_set), deferred=False)
+    _sync_match_relations(instance, action, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Match.referees.through)
+def match_referees_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    _sync_match_relations(instance, action, reverse, pk_set)
+
+
+@receiver(post_save, sender=MatchResult)
+def match_result_recorded(sender, instance, created, **kwargs):
+    if created:
+        player_stats.record_match(instance.match_id)
+        achievements.record_match(instance.match_id)
+        head_to_head.record_match(instance.match_id)
+        ratings.record_match(instance.match_id)
+
+
+@receiver(m2m_changed, sender=Competition.matches.through)
+@receiver(m2m_changed, sender=Competition.players.through)
+def competition_links_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        page_cache.invalidate_competitions([instance.pk])
+    elif action == 'pre_clear':
+        page_cache.invalidate_competitions(instance.competitions.values_list('pk', flat=True))
+    else:
+        page_cache.invalidate_competitions(pk_set or ())
+
+
+@receiver(post_save, sender=Competition)
+@receiver(post_delete, sender=Competition)
+def competition_changed(sender, instance, **kwargs):
+    page_cache.invalidate_competitions([instance.pk])
+
+
+@receiver(post_save, sender=GroupStage)
+@receiver(post_delete, sender=GroupStage)
+@receiver(post_save, sender=KnockoutStage)
+@receiver(post_delete, sender=KnockoutStage)
+def stage_changed(sender, instance, **kwargs):
+    page_cache.invalidate_competitions([instance.competition_id])
+
+
+@receiver(post_save, sender=Match)
+def match_saved(sender, instance, **kwargs):
+    page_cache.invalidate_matches([instance.pk])
+
+
+@receiver(pre_delete, sender=Match)
+def match_deleted(sender, instance, **kwargs):
+    page_cache.invalidate_matches([instance.pk], deferred=False)
+
+
+@receiver(post_save, sender=MatchPlayer)
+@receiver(post_delete, sender=MatchPlayer)
+def match_player_changed(sender, instance, signal, **kwargs):
+    page_cache.invalidate_matches([instance.match_id], deferred=signal is post_save)
+
+
+@receiver(post_save, sender=Frame)
+@receiver(post_delete, sender=Frame)
+def frame_changed(sender, instance, signal, **kwargs):
+    match_ids = MatchPlayer.objects.filter(pk=instance.match_player_id).values_list('match_id', flat=True)
+    page_cache.invalidate_matches(match_ids, deferred=signal is post_save)
+
+
+@receiver(post_save, sender=Achievement)
+@receiver(post_delete, sender=Achievement)
+def achievement_changed(sender, instance, **kwargs):
+    page_cache.invalidate_on_commit(page_cache.ACHIEVEMENTS)
+
+
+@receiver(post_save, sender=Player)
+@receiver(pre_delete, sender=Player)
+def player_changed(sender, instance, created=False, **kwargs):
+    # A new player appears on no cached page until they are linked to something.
+    if created:
+        return
+    scopes = [page_cache.competition_scope(pk) for pk in page_cache.competition_ids_for_player(instance.pk)]
+    page_cache.invalidate_on_commit(page_cache.ACHIEVEMENTS, *scopes)
@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+from django.db.models import Count
+
+from snooker_app.models import Match, Frame, Player
+
+POINTS_FOR_WIN = 3
+POINTS_FOR_DRAW = 1
+
+
+def is_decided(number_of_frames, frames):
+    # A match is over once someone has won more than half of the frames or
+    # every frame has been played (which is how drawn group matches happen).
+    return sum(frames) >= number_of_frames or max(frames, default=0) * 2 > number_of_frames
+
+
+def _empty_row(player):
+    return {
+        'player': player,
+        'played': 0,
+        'won': 0,
+        'drawn': 0,
+        'lost': 0,
+        'frames_won': 0,
+        'frames_lost': 0,
+        'points': 0,
+    }
+
+
+def _sort_key(row):
+    return (-row['points'], -(row['frames_won'] - row['frames_lost']), -row['frames_won'], str(row['player']))
+
+
+def compute_group_standings(group_stages):
+    # Returns {stage_id: {group_name: [row, ...]}}. The query count is fixed
+    # (memberships, frame tallies, players) however large the competition is.
+    stage_ids = [stage.pk for stage in group_stages]
+    if not stage_ids:
+        return {}
+
+    memberships = (Match.players.through.objects
+                   .filter(match__group_stage_id__in=stage_ids)
+                   .values_list('match_id', 'match__group_stage_id', 'match__group_name',
+                                'match__number_of_frames', 'player_id'))
+    frame_counts = (Frame.objects
+                    .filter(match_player__match__group_stage_id__in=stage_ids, winner__isnull=False)
+                    .values_list('match_player__match_id', 'winner_id')
+                    .annotate(frames=Count('frame_number', distinct=True))
+                    .order_by())
+
+    won_frames = defaultdict(int)
+    for match_id, winner_id, frames in frame_counts:
+        won_frames[(match_id, winner_id)] = frames
+
+    matches = {}
+    tables = defaultdict(lambda: defaultdict(dict))
+    player_ids_seen = set()
+    for match_id, stage_id, group_name, number_of_frames, player_id in memberships:
+        matches.setdefault(match_id, (stage_id, group_name or '', number_of_frames, []))[3].append(player_id)
+        player_ids_seen.add(player_id)
+
+    player_objects = Player.objects.in_bulk(player_ids_seen)
+    for match_id, (stage_id, group_name, number_of_frames, player_ids) in matches.items():
+        table = tables[stage_id][group_name]
+        for player_id in player_ids:
+            if player_id not in table:
+                table[player_id] = _empty_row(player_objects[player_id])
+
+        if len(player_ids) != 2:
+            continue
+        frames = [won_frames[(match_id, player_id)] for player_id in player_ids]
+        if not is_decided(number_of_frames, frames):
+            continue
+
+        for player_id, own, other in ((player_ids[0], frames[0], frames[1]),
+                                      (player_ids[1], frames[1], frames[0])):
+            row = table[player_id]
+            row['played'] += 1
+            row['frames_won'] += own
+            row['frames_lost'] += other
+            if own > other:
+                row['won'] += 1
+            elif own == other:
+                row['drawn'] += 1
+            else:
+                row['lost'] += 1
+
+    standings = {stage_id: {} for stage_id in stage_ids}
+    for stage_id, groups in tables.items():
+        for group_name in sorted(groups):
+            rows = list(groups[group_name].values())
+            for row in rows:
+                row['points'] = row['won'] * POINTS_FOR_WIN + row['drawn'] * POINTS_FOR_DRAW
+            rows.sort(key=_sort_key)
+            standings[stage_id][group_name] = rows
+    return standings
@@ -7,6 +7,106 @@ let timerRunning = false;
 let pointsOnTable = 147;
 let maxPossibleBreak = 147;
 let actionHistory = [];
+let currentFrame = 1;
+let eventsUrl = null;
+let eventSeq = 0;
+let pendingEvents = [];
+let inFlightBatch = null;
+let flushTimeout = null;
+const FLUSH_DELAY_MS = 300;
+
+
+function getCookie(name) {
+    const match = document.cookie.match(new RegExp('(^|;\\s*)' + name + '=([^;]*)'));
+    return match ? decodeURIComponent(match[2]) : null;
+}
+
+
+function frameEventsUrl() {
+    return eventsUrl.replace('/frames/0/', `/frames/${currentFrame}/`);
+}
+
+
+function queueEvent(event) {
+    if (!eventsUrl) {
+        return;
+    }
+    pendingEvents.push(event);
+    if (!flushTimeout) {
+        flushTimeout = setTimeout(flushEvents, FLUSH_DELAY_MS);
+    }
+}
+
+
+function flushEvents() {
+    flushTimeout = null;
+    if (inFlightBatch || pendingEvents.length === 0) {
+        return;
+    }
+    inFlightBatch = {seq: ++eventSeq, events: pendingEvents};
+    pendingEvents = [];
+
+    fetch(frameEventsUrl(), {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json', 'X-CSRFToken': getCookie('csrftoken')},
+        body: JSON.stringify(inFlightBatch)
+    })
+        .then(response => response.ok ? response.json() : Promise.reject(response.status))
+        .then(state => {
+            inFlightBatch = null;
+            renderState(state);
+            if (pendingEvents.length > 0) {
+                flushTimeout = setTimeout(flushEvents, FLUSH_DELAY_MS);
+            }
+        })
+        .catch(error => {
+            console.error('Could not send events, retrying:', error);
+            // Resend the same batch with the same seq; the server ignores it if already applied.
+            const batch = inFlightBatch;
+            inFlightBatch = null;
+            pendingEvents = batch.events.concat(pendingEvents);
+            eventSeq = batch.seq - 1;
+            flushTimeout = setTimeout(flushEvents, FLUSH_DELAY_MS * 10);
+        });
+}
+
+
+function loadState() {
+    if (!eventsUrl) {
+        return;
+    }
+    fetch(frameEventsUrl())
+        .then(response => response.json())
+        .then(state => {
+            eventSeq = state.seq;
+            renderState(state);
+        });
+}
+
+
+function renderState(state) {
+    if (pendingEvents.length > 0) {
+        return;
+    }
+    scores = state.scores.slice();
+    document.querySelectorAll('.player-score').forEach((el, index) => el.value = scores[index]);
+    pointsOnTable = state.points_on_table;
+    document.getElementById('points-on-table').textContent = pointsOnTable;
+    setActivePlayer(state.active_player);
+    maxPossibleBreak = pointsOnTable + state.current_break;
+    document.getElementById('max-possible-break').textContent = maxPossibleBreak;
+    document.getElementById('frame-number').textContent = state.frame;
+    actionHistory = [];
+}
+
+
+function newFrame() {
+    flushEvents();
+    currentFrame += 1;
+    eventSeq = 0;
+    resetGame();
+    loadState();
+}
 
 
 function addToHistory(action) {
@@ -40,6 +140,7 @@ function updateScore(points) {
     maxPossibleBreak = pointsOnTable + scores[activePlayer - 1];
     document.getElementById('max-possible-break').textContent = maxPossibleBreak;
 
+    queueEvent({type: 'pot', value: points});
     addToHistory({
         type: 'updateScore',
         player: activePlayer,
@@ -52,6 +153,7 @@ function updateScore(points) {
 
 function reverse() {
     console.log('Reverse function called');
+    queueEvent({type: 'undo'});
     if (actionHistory.length === 0) {
         console.log('No actions to reverse');
         return;
@@ -102,6 +204,7 @@ function reverse() {
 function miss() {
     let previousPlayer = activePlayer;
     let previousMaxPossibleBreak = maxPossibleBreak;
+    queueEvent({type: 'miss'});
     setActivePlayer(activePlayer === 1 ? 2 : 1);
     resetMaxPossibleBreak();
     addToHistory({
@@ -115,6 +218,7 @@ function miss() {
 function safetyShot() {
     let previousPlayer = activePlayer;
     let previousMaxPossibleBreak = maxPossibleBreak;
+    queueEvent({type: 'safety'});
     setActivePlayer(activePlayer === 1 ? 2 : 1);
     resetMaxPossibleBreak();
     addToHistory({
@@ -156,6 +260,7 @@ function foul(points) {
     let previousPointsOnTable = pointsOnTable;
     let currentPlayerScore = scores[activePlayer - 1];
 
+    queueEvent({type: 'foul', points: points});
     scores[opponent - 1] += points;
     document.querySelectorAll('.player-score')[opponent - 1].value = scores[opponent - 1];
 
@@ -223,8 +328,15 @@ function resetTimer() {
 
 
 document.addEventListener('DOMContentLoaded', function () {
+    const scoreboard = document.getElementById('scoreboard');
+    if (scoreboard) {
+        eventsUrl = scoreboard.dataset.eventsUrl;
+        currentFrame = parseInt(scoreboard.dataset.frame);
+    }
+
     document.querySelectorAll('.set-active-player').forEach(button => {
         button.addEventListener('click', function () {
+            queueEvent({type: 'set_player', player: parseInt(this.dataset.player)});
             setActivePlayer(this.dataset.player);
         });
     });
@@ -244,4 +356,5 @@ document.addEventListener('DOMContentLoaded', function () {
     }
     setActivePlayer(1);
     resetGame();
+    loadState();
 });
@@ -0,0 +1,76 @@
+// Autocomplete for SearchSelectWidget: looks rows up as the user types and
+// adds the chosen ones to the widget's select, whose ids are what gets posted.
+document.addEventListener('DOMContentLoaded', function () {
+    const SEARCH_DELAY_MS = 200;
+
+    document.querySelectorAll('.search-select').forEach(box => {
+        const input = box.querySelector('.search-select-input');
+        const results = box.querySelector('.search-select-results');
+        const selected = box.querySelector('.search-select-selected');
+        let timer = null;
+        let latest = 0;
+
+        function searchUrl(cursor) {
+            const url = new URL(box.dataset.searchUrl, window.location.href);
+            url.searchParams.set('q', input.value.trim());
+            if (cursor) {
+                url.searchParams.set('cursor', cursor);
+            }
+            return url;
+        }
+
+        function addResult(item) {
+            if (selected.querySelector(`option[value="${item.id}"]`)) {
+                return;
+            }
+            const choice = document.createElement('button');
+            choice.type = 'button';
+            choice.className = 'list-group-item list-group-item-action';
+            choice.textContent = item.text;
+            choice.addEventListener('click', () => {
+                selected.add(new Option(item.text, item.id, true, true));
+                choice.remove();
+            });
+            results.appendChild(choice);
+        }
+
+        function load(cursor) {
+            // Only the newest search may draw, however the responses arrive.
+            const request = ++latest;
+            fetch(searchUrl(cursor))
+                .then(response => response.ok ? response.json() : Promise.reject(response.status))
+                .then(page => {
+                    if (request !== latest) {
+                        return;
+                    }
+                    if (!cursor) {
+                        results.innerHTML = '';
+                    }
+                    results.querySelectorAll('.search-select-more').forEach(more => more.remove());
+                    page.results.forEach(addResult);
+                    if (page.next) {
+                        const more = document.createElement('button');
+                        more.type = 'button';
+                        more.className = 'list-group-item list-group-item-light search-select-more';
+                        more.textContent = 'More…';
+                        more.addEventListener('click', () => load(page.next));
+                        results.appendChild(more);
+                    }
+                })
+                .catch(error => console.error('Could not search:', error));
+        }
+
+        input.addEventListener('input', () => {
+            clearTimeout(timer);
+            timer = setTimeout(() => load(null), SEARCH_DELAY_MS);
+        });
+        selected.addEventListener('dblclick', event => {
+            if (event.target.tagName === 'OPTION') {
+                event.target.remove();
+            }
+        });
+        selected.form.addEventListener('submit', () => {
+            Array.from(selected.options).forEach(option => { option.selected = true; });
+        });
+    });
+});
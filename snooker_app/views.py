@@ -1,17 +1,34 @@
+import json
+
+from django.db import transaction
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse_lazy, reverse
 from django.views.generic import DeleteView
 from django.contrib import messages
-from django.db.models import Count, Sum, F, Case, When, IntegerField
 from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import PasswordChangeForm
+from django.utils.dateparse import parse_date
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.http import condition, require_http_methods
 
 from snooker_app.forms import (PlayerForm, PlayerEditForm, RefereeForm, VenueForm,
-                               MatchForm, CompetitionForm, AddMatchesToCompetitionForm,
+                               MatchForm, CompetitionForm, AddMatchesToCompetitionForm, AddPlayersToCompetitionForm,
                                GroupStageForm, SignUpForm, KnockoutStageForm)
 from snooker_app.models import (Player, Referee, Venue, Match, Competition, GroupStage, KnockoutStage,
-                                TemporaryPlayer, MatchPlayer, Achievement)
+                                TemporaryPlayer, Achievement, Frame, filter_matches)
+from snooker_app.achievements import chart_series
+from snooker_app.break_analytics import player_breaks, competition_breaks
+from snooker_app import page_cache
+from snooker_app.exports import EXPORTS, FORMATS, InvalidExport, encode, export_rows
+from snooker_app.finalization import finalize_match
+from snooker_app.head_to_head import opponents, pair_record
+from snooker_app.live import event_stream, match_channel, competition_channel
+from snooker_app.pagination import keyset_page, InvalidCursor
+from snooker_app.search import search_players, search_referees, search_matches
+from snooker_app.scoring import apply_events, current_state, ScoringError
+from snooker_app.standings import compute_group_standings
 
 # Create your views here.
 
@@ -33,9 +50,76 @@ def add_player(request):
     return render(request, 'add_player.html', {'form': form})
 
 
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+
+def _search_page(request, items, fields, describe=None):
+    # One page of an autocomplete endpoint, in keyset order by `fields`.
+    per_page = _page_size(request, SEARCH_PAGE_SIZE, SEARCH_MAX_PAGE_SIZE)
+    try:
+        page, next_cursor = keyset_page(items, fields, request.GET.get('cursor'), per_page)
+    except InvalidCursor:
+        return JsonResponse({'error': 'Invalid cursor.'}, status=400)
+    return JsonResponse({
+        'results': [{'id': item.pk, 'text': str(item), **(describe(item) if describe else {})} for item in page],
+        'next': next_cursor,
+    })
+
+
+@require_http_methods(['GET'])
+def player_search(request):
+    # Autocomplete for player pickers: players whose names start with every
+    # word of ?q=, highest rated first.
+    players = search_players(request.GET.get('q', '')).only('first_name', 'last_name', 'nickname', 'rating')
+    exclude_competition = _int_param(request, 'exclude_competition')
+    if exclude_competition is not None:
+        players = players.exclude(competitions=exclude_competition)
+    return _search_page(request, players, ['rating', 'pk'], lambda player: {'rating': round(player.rating)})
+
+
+PLAYER_RATING_HISTORY_SIZE = 10
+
+
 def player_detail(request, pk):
     player = get_object_or_404(Player, pk=pk)
-    return render(request, 'player_detail.html', {'player': player})
+    rating_history = (player.rating_history.select_related('match')
+                      .order_by('-played_on', '-match_id')[:PLAYER_RATING_HISTORY_SIZE])
+    return render(request, 'player_detail.html', {'player': player, 'rating_history': rating_history})
+
+
+def player_stats(request, pk):
+    player = get_object_or_404(Player, pk=pk)
+    season = _int_param(request, 'season')
+    return render(request, 'break_stats.html', {
+        'subject': player,
+        'season': season,
+        'stats': player_breaks(player, season=season).summary(),
+        'back_url': reverse('player_detail', kwargs={'pk': player.pk}),
+    })
+
+
+def head_to_head(request, pk):
+    # One indexed query; the player is only looked up when they have no
+    # opponents, to tell "never played" from "doesn't exist".
+    records = opponents(pk)
+    if not records and not Player.objects.filter(pk=pk).exists():
+        raise Http404('No Player matches the given query.')
+    return JsonResponse({'player_id': pk, 'opponents': records})
+
+
+def head_to_head_pair(request, pk, opponent_pk):
+    if pk == opponent_pk:
+        return JsonResponse({'error': 'A player has no head-to-head record with themselves.'}, status=400)
+    record = pair_record(pk, opponent_pk)
+    if record is None:
+        players = Player.objects.in_bulk([pk, opponent_pk])
+        if len(players) != 2:
+            raise Http404('No Player matches the given query.')
+        record = {'opponent_id': opponent_pk, 'opponent': str(players[opponent_pk]), 'matches': 0, 'wins': 0,
+                  'losses': 0, 'draws': 0, 'frames_won': 0, 'frames_lost': 0, 'highest_break': 0,
+                  'opponent_highest_break': 0, 'last_played': None}
+    return JsonResponse({'player_id': pk, **record})
 
 
 def player_edit(request, pk):
@@ -60,6 +144,12 @@ class PlayerDeleteView(DeleteView):
         return get_object_or_404(Player, pk=self.kwargs['pk'])
 
 
+@require_http_methods(['GET'])
+def referee_search(request):
+    referees = search_referees(request.GET.get('q', '')).only('first_name', 'last_name', 'license_number')
+    return _search_page(request, referees, ['pk'])
+
+
 def referee_list(request):
     referees = Referee.objects.all()
     return render(request, 'referee_list.html', {'referees': referees})
@@ -162,9 +252,76 @@ def venue_detail(request, pk):
     return render(request, 'venue_detail.html', {'venue': venue})
 
 
+MATCH_LIST_PAGE_SIZE = 50
+MATCH_LIST_MAX_PAGE_SIZE = 200
+
+
+def _int_param(request, name):
+    try:
+        return int(request.GET[name])
+    except (KeyError, ValueError):
+        return None
+
+
+def _page_size(request, default, maximum):
+    return max(1, min(_int_param(request, 'per_page') or default, maximum))
+
+
 def match_list(request):
-    matches = Match.objects.all()
-    return render(request, 'match_list.html', {'matches': matches})
+    filters = {
+        'venue_id': _int_param(request, 'venue'),
+        'competition_id': _int_param(request, 'competition'),
+        'player_id': _int_param(request, 'player'),
+    }
+    per_page = _page_size(request, MATCH_LIST_PAGE_SIZE, MATCH_LIST_MAX_PAGE_SIZE)
+    matches = (filter_matches(Match.objects.all(), **filters)
+               .select_related('venue')
+               .prefetch_related('players', 'referees'))
+    try:
+        page, next_cursor = keyset_page(matches, ['date', 'time', 'pk'], request.GET.get('cursor'), per_page)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor.')
+
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_query = params.urlencode()
+
+    return render(request, 'match_list.html', {
+        'matches': page,
+        'next_query': next_query,
+        'venues': Venue.objects.all(),
+        'competitions': Competition.objects.all(),
+        'filters': filters,
+    })
+
+
+def _date_param(request, name):
+    value = request.GET.get(name)
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise InvalidExport(f'Invalid {name}: {value!r}')
+    return parsed
+
+
+@login_required
+def export_results(request, kind):
+    fmt = request.GET.get('format', 'csv')
+    try:
+        rows = export_rows(kind, competition_id=_int_param(request, 'competition'),
+                           date_from=_date_param(request, 'date_from'), date_to=_date_param(request, 'date_to'))
+        lines = encode(rows, EXPORTS[kind], fmt)
+    except InvalidExport as e:
+        return HttpResponseBadRequest(str(e))
+    response = StreamingHttpResponse(lines, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
 
 
 def add_match(request):
@@ -181,6 +338,17 @@ def add_match(request):
     return render(request, 'add_match.html', {'form': form})
 
 
+@require_http_methods(['GET'])
+def match_search(request):
+    # Autocomplete for match pickers, newest first.
+    matches = search_matches(request.GET.get('q', '')).only('date', 'time', 'player_names')
+    exclude_competition = _int_param(request, 'exclude_competition')
+    if exclude_competition is not None:
+        matches = matches.exclude(competitions=exclude_competition)
+    return _search_page(request, matches, ['date', 'time', 'pk'],
+                        lambda match: {'text': f'{match}: {match.player_names}'} if match.player_names else {})
+
+
 def match_detail(request, match_id):
     match = get_object_or_404(Match, pk=match_id)
     return render(request, 'match_detail.html', {'match': match})
@@ -211,19 +379,72 @@ class MatchDeleteView(DeleteView):
 
 def start_game(request, match_id):
     match = get_object_or_404(Match, id=match_id)
-    players = match.players.all()
+    players = match.players.order_by('pk')
     if request.method == 'POST':
         return redirect('match_detail', match_id=match_id)
 
+    last_frame = Frame.objects.filter(match_player__match=match).order_by('-frame_number').first()
     context = {
         'match': match,
         'players': players,
-        'match_id': match_id
+        'match_id': match_id,
+        'frame_number': last_frame.frame_number if last_frame else 1
     }
 
     return render(request, 'start_game.html', context)
 
 
+@ensure_csrf_cookie
+@require_http_methods(['GET', 'POST'])
+def frame_events(request, match_id, frame_number):
+    match = get_object_or_404(Match, id=match_id)
+    try:
+        if request.method == 'POST':
+            payload = json.loads(request.body)
+            if not isinstance(payload, dict):
+                raise ScoringError('Expected {"seq": <int>, "events": [...]}.')
+            events = payload.get('events', [])
+            seq = payload.get('seq')
+            if not isinstance(events, list) or not (seq is None or type(seq) is int):
+                raise ScoringError('Expected {"seq": <int>, "events": [...]}.')
+            state = apply_events(match, frame_number, events, seq)
+        else:
+            state = current_state(match, frame_number)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(state)
+
+
+@require_http_methods(['POST'])
+def finish_match(request, match_id):
+    get_object_or_404(Match, id=match_id)
+    try:
+        report = finalize_match(match_id)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    report.pop('sql')
+    return JsonResponse(report)
+
+
+def _event_stream_response(channel):
+    response = StreamingHttpResponse(event_stream(channel), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+async def live_match(request, match_id):
+    if not await Match.objects.filter(pk=match_id).aexists():
+        raise Http404('No Match matches the given query.')
+    return _event_stream_response(match_channel(match_id))
+
+
+async def live_competition(request, pk):
+    if not await Competition.objects.filter(pk=pk).aexists():
+        raise Http404('No Competition matches the given query.')
+    return _event_stream_response(competition_channel(pk))
+
+
 def add_competition(request):
     if request.method == 'POST':
         form = CompetitionForm(request.POST)
@@ -249,6 +470,11 @@ def edit_competition(request, pk):
     return render(request, 'edit_competition.html', {'form': form, 'competition': competition})
 
 
+def _competition_scopes(pk):
+    return [page_cache.competition_scope(pk)]
+
+
+@page_cache.cached_page('competition_stages', _competition_scopes)
 def competition_stages(request, pk):
     competition = get_object_or_404(Competition, pk=pk)
     group_stages = competition.groupstage_stages.all()
@@ -277,44 +503,27 @@ def competition_list(request):
     return render(request, 'competition_list.html', {'competitions': competitions})
 
 
+@page_cache.cached_page('competition_detail', _competition_scopes)
 def competition_detail(request, pk):
     competition = get_object_or_404(Competition, pk=pk)
-    group_stages = competition.groupstage_stages.all().prefetch_related('matches')
-    knockout_stages = competition.knockoutstage_stages.all().prefetch_related('matches')
+    group_stages = list(competition.groupstage_stages.all().prefetch_related('matches__players'))
+    knockout_stages = competition.knockoutstage_stages.all().prefetch_related('matches__players')
+    standings = compute_group_standings(group_stages)
 
     group_data = []
     for group_stage in group_stages:
-        matches = group_stage.matches.all()
-        players = Player.objects.filter(matchplayer__match__in=matches).distinct()
-
-        player_stats = []
-        for player in players:
-            stats = MatchPlayer.objects.filter(
-                match__in=matches,
-                player=player).aggregate(
-                played=Count('match'),
-                won=Sum(Case(When(points_scored__gt=F('match__matchplayer__points_scored'), then=1), default=0,
-                             output_field=IntegerField())),
-                drawn=Sum(Case(When(points_scored=F('match__matchplayer__points__scored'), then=1), default=0,
-                               output_field=IntegerField())),
-                frames_won=Sum('points_scored'),
-                frames_lost=Sum('match__matchplayer__points_scored') - Sum('points_scored')
-            )
-            stats['player'] = player
-            stats['points'] = stats['won'] * 3 + stats['drawn']
-            player_stats.append(stats)
-
-        player_stats.sort(key=lambda x: (x['points'], x['frames_won'] - x['frames_lost']), reverse=True)
-
+        groups = [{'name': name, 'player_stats': rows} for name, rows in standings[group_stage.pk].items()]
         group_data.append({
             'stage': group_stage,
-            'matches': matches,
-            'player_stats': player_stats
+            'matches': group_stage.matches.all(),
+            'groups': groups,
+            'player_stats': [row for group in groups for row in group['player_stats']]
         })
 
     knockout_data = []
     for knockout_stage in knockout_stages:
-        matches = knockout_stage.matches.all().order_by('group_name')
+        matches = sorted(knockout_stage.matches.all(),
+                         key=lambda match: (match.bracket_round or 0, match.bracket_slot or 0))
         knockout_data.append({
             'stage': knockout_stage,
             'matches': matches
@@ -328,6 +537,17 @@ def competition_detail(request, pk):
     })
 
 
+def competition_stats(request, pk):
+    competition = get_object_or_404(Competition, pk=pk)
+    season = _int_param(request, 'season')
+    return render(request, 'break_stats.html', {
+        'subject': competition,
+        'season': season,
+        'stats': competition_breaks(competition, season=season).summary(),
+        'back_url': reverse('competition_detail', kwargs={'pk': competition.pk}),
+    })
+
+
 class CompetitionDeleteView(DeleteView):
     model = Competition
     template_name = 'delete_competition.html'
@@ -372,14 +592,14 @@ def create_temporary_match(request):
     if request.method == 'POST':
         form = MatchForm(request.POST)
         if form.is_valid():
-            temp_player1 = TemporaryPlayer.objects.create(name=f'Player {TemporaryPlayer.objects.count() + 1}')
-            temp_player2 = TemporaryPlayer.objects.create(name=f'Player {TemporaryPlayer.objects.count() + 2}')
-            match = form.save(commit=False)
-            match.temp_player1 = temp_player1
-            match.temp_player2 = temp_player2
-            match.is_temporary = True
-            match.save()
-            return redirect('match_detail', pk=match.pk)
+            with transaction.atomic():
+                temp_player1, temp_player2 = TemporaryPlayer.create_numbered(2)
+                match = form.save(commit=False)
+                match.temp_player1 = temp_player1
+                match.temp_player2 = temp_player2
+                match.is_temporary = True
+                match.save()
+            return redirect('match_detail', match_id=match.pk)
     else:
         form = MatchForm()
 
@@ -399,7 +619,8 @@ def create_group_stage(request, competition_id):
             group_stage = form.save(commit=False)
             group_stage.competition = competition
             group_stage.save()
-            group_stage.create_groups_and_matches(form.cleaned_data['default_frames'])
+            report = group_stage.create_groups_and_matches(form.cleaned_data['default_frames'])
+            messages.success(request, f"Generated {report['matches']} matches in {report['seconds']:.2f}s.")
             return redirect('competition_detail', pk=competition.id)
     else:
         form = GroupStageForm()
@@ -416,7 +637,8 @@ def create_knockout_stage(request, competition_id):
             knockout_stage = form.save(commit=False)
             knockout_stage.competition = competition
             knockout_stage.save()
-            knockout_stage.create_knockout_matches()
+            report = knockout_stage.create_knockout_matches()
+            messages.success(request, f"Generated {report['matches']} matches in {report['seconds']:.2f}s.")
             return redirect('competition_detail', pk=competition.id)
 
     else:
@@ -484,16 +706,16 @@ def custom_logout(request):
 def add_players_to_competition(request, pk):
     competition = get_object_or_404(Competition, id=pk)
     if request.method == 'POST':
-        player_ids = request.POST.getlist('players')
-        players = Player.objects.filter(id__in=player_ids)
-        competition.players.add(*players)
-        return redirect('competition_detail', pk=competition.id)
+        form = AddPlayersToCompetitionForm(request.POST, competition=competition)
+        if form.is_valid():
+            competition.players.add(*form.cleaned_data['players'])
+            return redirect('competition_detail', pk=competition.id)
     else:
-        available_players = Player.objects.exclude(competitions=competition)
-        return render(request, 'add_players_to_competition.html', {
-            'competition': competition,
-            'available_players': available_players
-        })
+        form = AddPlayersToCompetitionForm(competition=competition)
+    return render(request, 'add_players_to_competition.html', {
+        'competition': competition,
+        'form': form,
+    })
 
 
 # =======================================================
@@ -501,9 +723,77 @@ def add_players_to_competition(request, pk):
 # =======================================================
 # =======================================================
 
+ACHIEVEMENT_LIST_PAGE_SIZE = 50
+ACHIEVEMENT_LIST_MAX_PAGE_SIZE = 200
+ACHIEVEMENT_CHART_DEFAULT_LIMIT = 10
+ACHIEVEMENT_CHART_MAX_LIMIT = 100
+
+
+@page_cache.cached_page('achievement_list', lambda: [page_cache.ACHIEVEMENTS])
 def achievement_list(request):
-    achievements = Achievement.objects.all()
+    per_page = _page_size(request, ACHIEVEMENT_LIST_PAGE_SIZE, ACHIEVEMENT_LIST_MAX_PAGE_SIZE)
+    achievements = Achievement.objects.select_related('player')
+    try:
+        page, next_cursor = keyset_page(achievements, ['matches_won', 'frames_won', 'pk'],
+                                        request.GET.get('cursor'), per_page)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor.')
+
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_query = params.urlencode()
+
     context = {
-        'achievements': achievements
+        'achievements': page,
+        'next_query': next_query,
     }
     return render(request, 'achievement_list.html', context)
+
+
+def _chart_params(request):
+    limit = _int_param(request, 'limit') or ACHIEVEMENT_CHART_DEFAULT_LIMIT
+    return request.GET.get('column', 'matches_won'), max(1, min(limit, ACHIEVEMENT_CHART_MAX_LIMIT))
+
+
+def _achievement_chart_etag(request):
+    # Changes whenever achievements are written, so unchanged charts are
+    # answered with a 304 without touching the database.
+    generation, = page_cache.generations([page_cache.ACHIEVEMENTS])
+    column, limit = _chart_params(request)
+    return f'{generation}-{column}-{limit}'
+
+
+@require_http_methods(['GET'])
+@condition(etag_func=_achievement_chart_etag)
+def achievement_chart_data(request):
+    column, limit = _chart_params(request)
+    try:
+        series = chart_series(column, limit)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    response = JsonResponse(series)
+    response['Cache-Control'] = 'no-cache'
+    return response
+
+
+RANKINGS_PAGE_SIZE = 50
+RANKINGS_MAX_PAGE_SIZE = 200
+
+
+def rankings(request):
+    per_page = _page_size(request, RANKINGS_PAGE_SIZE, RANKINGS_MAX_PAGE_SIZE)
+    players = Player.objects.filter(rated_matches__gt=0)
+    try:
+        page, next_cursor = keyset_page(players, ['rating', 'pk'], request.GET.get('cursor'), per_page)
+    except InvalidCursor:
+        return HttpResponseBadRequest('Invalid cursor.')
+
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_query = params.urlencode()
+
+    return render(request, 'rankings.html', {'players': page, 'next_query': next_query})
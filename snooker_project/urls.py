@@ -23,11 +23,17 @@ from snooker_app.views import PlayerDeleteView, VenueDeleteView
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('players/', views.player_list, name='player_list'),
+    path('players/rankings/', views.rankings, name='rankings'),
+    path('players/search/', views.player_search, name='player_search'),
     path('players/add/', views.add_player, name='add_player'),
     path('players/<int:pk>/', views.player_detail, name='player_detail'),
+    path('players/<int:pk>/stats/', views.player_stats, name='player_stats'),
+    path('players/<int:pk>/head-to-head/', views.head_to_head, name='head_to_head'),
+    path('players/<int:pk>/head-to-head/<int:opponent_pk>/', views.head_to_head_pair, name='head_to_head_pair'),
     path('players/<int:pk>/edit/', views.player_edit, name='player_edit'),
     path('player/<int:pk>/delete/', PlayerDeleteView.as_view(), name='player_delete'),
     path('referees/', views.referee_list, name='referee_list'),
+    path('referees/search/', views.referee_search, name='referee_search'),
     path('referees/add/', views.add_referee, name='add_referee'),
     path('referees/<int:pk>/edit/', views. edit_referee, name='edit_referee'),
     path('referees/<int:pk>/delete/', views.delete_referee, name='delete_referee'),
@@ -38,17 +44,24 @@ urlpatterns = [
     path('venues/delete/<int:pk>/', VenueDeleteView.as_view(), name='delete_venue'),
     path('venues/<int:pk>', views.venue_detail, name='venue_detail'),
     path('matches/', views.match_list, name='match_list'),
+    path('exports/<str:kind>/', views.export_results, name='export_results'),
     path('match/add/', views.add_match, name='add_match'),
+    path('match/search/', views.match_search, name='match_search'),
     path('match/<int:match_id>/', views.match_detail, name='match_detail'),
     path('match/<int:pk>/edit/', views.edit_match, name='edit_match'),
     path('match/<int:pk>/delete/', views.MatchDeleteView.as_view(), name='delete_match'),
     path('match/<int:match_id>/start/', views.start_game, name='start_game'),
+    path('match/<int:match_id>/frames/<int:frame_number>/events/', views.frame_events, name='frame_events'),
+    path('match/<int:match_id>/finish/', views.finish_match, name='finish_match'),
+    path('match/<int:match_id>/live/', views.live_match, name='live_match'),
     path('competitions/', views.competition_list, name='competition_list'),
     path('competitions/add/', views.add_competition, name='add_competition'),
     path('competitions/<int:pk>', views.competition_detail, name='competition_detail'),
     path('competitions/<int:pk>/edit/', views.edit_competition, name='edit_competition'),
     path('competitions/<int:pk>/delete/', views.CompetitionDeleteView.as_view(), name='delete_competition'),
     path('competitions/<int:pk>/stages/', views.competition_stages, name='competition_stages'),
+    path('competitions/<int:pk>/stats/', views.competition_stats, name='competition_stats'),
+    path('competitions/<int:pk>/live/', views.live_competition, name='live_competition'),
     path('competitions/<int:competition_id>/add-matches/', views.add_matches_to_competition,
          name='add_matches_to_competition'),
     path('login/', auth_views.LoginView.as_view(template_name='login.html'), name='login'),
@@ -62,4 +75,5 @@ urlpatterns = [
          name='create_knockout_stage'),
     path('competitions/<int:pk>/add-players/', views.add_players_to_competition, name='add_players_to_competition'),
     path('achievements/',views.achievement_list, name='achievement_list'),
+    path('achievements/chart/', views.achievement_chart_data, name='achievement_chart_data'),
 ]
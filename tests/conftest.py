@@ -0,0 +1,24 @@
+import pytest
+from django.core.cache import cache
+
+from snooker_app.shot_log import ShotEventBuffer, set_buffer
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Cached pages are invalidated on commit, which never happens inside a
+    # test transaction, so each test starts from an empty cache instead.
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def shot_buffer():
+    # A fresh buffer per test that only flushes when told to, so events
+    # committed in one test never reach the database in another.
+    buffer = ShotEventBuffer(max_rows=10_000, max_seconds=3600)
+    set_buffer(buffer)
+    yield buffer
+    buffer.close()
+    set_buffer(None)
@@ -0,0 +1,83 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from snooker_app import achievements
+from snooker_app.models import Player, Match, MatchPlayer, MatchResult, Frame, Achievement
+
+
+def play_match(day, player1, player2, winners, durations=None, breaks1=(), breaks2=(), record=True):
+    match = Match.objects.create(date=f'2024-07-{day:02}', time='15:30:00', number_of_frames=len(winners))
+    line = MatchPlayer.objects.create(match=match, player=player1, position=1)
+    MatchPlayer.objects.create(match=match, player=player2, position=2)
+    for number, winner in enumerate(winners, start=1):
+        Frame.objects.create(match_player=line, frame_number=number, winner=winner,
+                             time_duration=(durations or {}).get(number),
+                             break_points_player1=list(breaks1) if number == 1 else [],
+                             break_points_player2=list(breaks2) if number == 1 else [])
+    if record:
+        MatchResult.objects.create(match=match)
+    return match
+
+
+@pytest.fixture
+def players():
+    return Player.objects.create(first_name='Ronnie'), Player.objects.create(first_name='Judd')
+
+
+@pytest.mark.django_db
+def test_results_update_achievements_incrementally(players):
+    ronnie, judd = players
+    play_match(1, ronnie, judd, [ronnie, ronnie, judd, ronnie],
+               durations={1: timedelta(minutes=9), 2: timedelta(minutes=30)}, breaks1=[147, 55], breaks2=[12])
+    play_match(2, ronnie, judd, [ronnie, ronnie, ronnie])
+    play_match(3, judd, ronnie, [judd, ronnie, judd])
+
+    ronnie_achievement = Achievement.objects.get(player=ronnie)
+    judd_achievement = Achievement.objects.get(player=judd)
+    assert ronnie_achievement.frames_won == 7
+    assert ronnie_achievement.frames_lost == 3
+    assert ronnie_achievement.consecutive_frames_won == 4
+    assert ronnie_achievement.matches_won == 2
+    assert ronnie_achievement.consecutive_matches_won == 2
+    assert ronnie_achievement.current_match_streak == 0
+    assert ronnie_achievement.fastest_frame_won == timedelta(minutes=9)
+    assert ronnie_achievement.longest_frame_won == timedelta(minutes=30)
+    assert ronnie_achievement.breaks == {'highest': 147, 'half_centuries': 1, 'centuries': 1, 'maximums': 1}
+    assert judd_achievement.current_match_streak == 1
+    assert judd_achievement.breaks['highest'] == 12
+
+
+@pytest.mark.django_db
+def test_backfill_matches_incremental_results(players):
+    ronnie, judd = players
+    play_match(2, ronnie, judd, [judd, judd, ronnie], record=False)
+    play_match(1, ronnie, judd, [ronnie, ronnie], record=False)
+    play_match(3, ronnie, judd, [ronnie], record=False)
+    Achievement.objects.create(player=ronnie, tournaments_won=3, frames_won=99)
+    MatchResult.objects.bulk_create([MatchResult(match=match) for match in Match.objects.all()])
+
+    call_command('backfill_achievements', chunk_size=2, stdout=StringIO())
+
+    ronnie_achievement = Achievement.objects.get(player=ronnie)
+    assert ronnie_achievement.tournaments_won == 3
+    assert ronnie_achievement.frames_won == 4
+    assert ronnie_achievement.consecutive_frames_won == 2
+    assert ronnie_achievement.current_frame_streak == 2
+    assert ronnie_achievement.consecutive_matches_won == 1
+    assert Achievement.objects.get(player=judd).consecutive_frames_won == 2
+    assert not MatchPlayer.objects.filter(achievements_recorded=False).exists()
+
+
+@pytest.mark.django_db
+def test_record_match_counts_a_match_once(players):
+    ronnie, judd = players
+    match = play_match(1, ronnie, judd, [ronnie, judd, ronnie])
+    assert achievements.record_match(match) == 0
+
+    engine = achievements.AchievementEngine()
+    engine.load([ronnie.pk, ronnie.pk])
+    assert engine.achievements[ronnie.pk].pk is not None
+    assert Achievement.objects.get(player=ronnie).frames_won == 2
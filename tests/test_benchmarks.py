@@ -0,0 +1,32 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from snooker_app.benchmarks import run_suite
+from snooker_app.models import Match
+
+
+@pytest.mark.django_db
+def test_benchmark_suite_stays_within_query_budgets():
+    report = run_suite('tiny', repeat=1)
+
+    assert report['dataset']['matches'] == 200
+    assert report['dataset']['competitions'] == 2
+    assert not Match.objects.exists()
+    over = {result['name']: result['queries'] for result in report['results'] if not result['within_budget']}
+    assert over == {}
+    assert {'view:competition_detail', 'view:match_list', 'model:create_groups_and_matches'} <= {
+        result['name'] for result in report['results']}
+
+
+@pytest.mark.django_db
+def test_run_benchmarks_command_writes_json(tmp_path):
+    output = tmp_path / 'bench.json'
+    call_command('run_benchmarks', '--scale=tiny', '--repeat=1', '--only', 'view:match_list',
+                 f'--output={output}', stderr=StringIO())
+
+    report = json.loads(output.read_text())
+    assert [result['name'] for result in report['results']] == ['view:match_list']
+    assert set(report['results'][0]['ms']) == {'min', 'median', 'max'}
@@ -0,0 +1,59 @@
+import pytest
+from mixer.backend.django import mixer
+
+from snooker_app.brackets import seed_order, build_bracket, bracket_index, feeders, advance_winner, BracketError
+from snooker_app.models import Player, Competition, KnockoutStage
+
+
+@pytest.fixture
+def competition():
+    return mixer.blend(Competition)
+
+
+def test_seed_order():
+    assert seed_order(2) == [1, 2]
+    assert seed_order(8) == [1, 8, 4, 5, 2, 7, 3, 6]
+    assert sorted(seed_order(64)) == list(range(1, 65))
+
+
+@pytest.mark.django_db
+def test_build_bracket_with_byes(competition):
+    stage = KnockoutStage.objects.create(competition=competition, name='KO', num_rounds=3, frames_per_match=5)
+    players = [Player.objects.create(first_name=f'Seed{i}') for i in range(1, 6)]
+
+    matches = build_bracket(stage, players)
+    index = bracket_index(stage)
+
+    assert len(matches) == len(index) == 7
+    assert [len(index[(1, slot)].players.all()) for slot in range(4)] == [1, 2, 1, 1]
+    assert set(index[(2, 0)].players.all()) == {players[0]}
+    assert set(index[(2, 1)].players.all()) == {players[1], players[2]}
+    assert index[(3, 0)].next_match is None
+    assert feeders(index, 3, 0) == [index[(2, 0)], index[(2, 1)]]
+    assert set(index[(3, 0)].feeder_matches.all()) == {index[(2, 0)], index[(2, 1)]}
+    assert index[(1, 1)].next_match_id == index[(2, 0)].pk
+    assert index[(1, 1)].knockout_name == 'Round 1'
+
+    next_match = advance_winner(index[(1, 1)], players[3])
+    assert next_match == index[(2, 0)]
+    assert set(next_match.players.all()) == {players[0], players[3]}
+
+    # Correcting the result swaps the advanced player instead of adding one.
+    opponent, = set(index[(1, 1)].players.all()) - {players[3]}
+    advance_winner(index[(1, 1)], opponent)
+    assert set(next_match.players.all()) == {players[0], opponent}
+    with pytest.raises(BracketError):
+        advance_winner(index[(1, 1)], players[0])
+
+
+@pytest.mark.django_db
+def test_build_bracket_query_budget(competition, django_assert_max_num_queries):
+    stage = KnockoutStage.objects.create(competition=competition, name='KO', num_rounds=8, frames_per_match=5)
+    players = mixer.cycle(200).blend(Player)
+
+    with django_assert_max_num_queries(12):
+        matches = build_bracket(stage, players)
+
+    assert len(matches) == 255
+    assert stage.matches.filter(bracket_round=1).count() == 128
+    assert Player.objects.filter(match__knockout_stage=stage, match__bracket_round=2).count() == 56
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from django.urls import reverse
+
+from snooker_app.break_analytics import BreakSet, player_breaks, competition_breaks
+from snooker_app.models import Player, Match, MatchPlayer, Frame, Competition
+
+
+def play_frames(date, player1, player2, frames, competition=None):
+    match = Match.objects.create(date=date, time='15:30:00', number_of_frames=len(frames))
+    line = MatchPlayer.objects.create(match=match, player=player1, position=1)
+    MatchPlayer.objects.create(match=match, player=player2, position=2)
+    for number, (points1, breaks1, points2, breaks2) in enumerate(frames, start=1):
+        Frame.objects.create(match_player=line, frame_number=number,
+                             points_scored_player1=points1, break_points_player1=breaks1,
+                             points_scored_player2=points2, break_points_player2=breaks2)
+    if competition is not None:
+        competition.matches.add(match)
+    return match
+
+
+@pytest.fixture
+def competition():
+    return Competition.objects.create(name='Open', start_date='2024-07-01', end_date='2024-07-02',
+                                      competition_type='Qualifiers')
+
+
+@pytest.fixture
+def players():
+    return Player.objects.create(first_name='Ronnie'), Player.objects.create(first_name='Judd')
+
+
+def test_break_set_summary():
+    breaks = BreakSet.from_sides([([147], 147), ([55, 12], 80), ([], 0), (None, 30), ([100], 100)])
+    summary = breaks.summary()
+
+    assert summary['count'] == 4
+    assert summary['frames'] == 5
+    assert summary['highest'] == 147
+    assert (summary['half_centuries'], summary['centuries'], summary['maximums']) == (1, 2, 1)
+    assert summary['percentiles'][50] == 77.5
+    assert sum(bucket['count'] for bucket in summary['distribution']) == 4
+    assert summary['distribution'][-2] == {'low': 140, 'high': 149, 'count': 1}
+    # 147/147, 67/80, 0/30 and 100/100 of the sides that scored.
+    assert summary['break_share']['overall'] == round(314 / 357 * 100, 1)
+    assert summary['break_share']['mean'] == round(np.mean([1, 67 / 80, 0, 1]) * 100, 1)
+
+
+def test_empty_break_set():
+    summary = BreakSet.from_sides([]).summary()
+    assert summary['count'] == 0
+    assert summary['percentiles'] == {}
+    assert summary['break_share'] == {'mean': 0.0, 'overall': 0.0}
+
+
+@pytest.mark.django_db
+def test_player_and_competition_breaks(players, competition):
+    ronnie, judd = players
+    play_frames('2024-07-01', ronnie, judd, [(120, [100, 20], 10, []), (30, [], 75, [60])], competition)
+    play_frames('2023-05-01', judd, ronnie, [(147, [147], 0, [])])
+
+    assert sorted(player_breaks(ronnie).breaks.tolist()) == [20, 100]
+    assert player_breaks(judd).breaks.tolist() == [60, 147]
+    assert player_breaks(judd, season=2024).breaks.tolist() == [60]
+    assert player_breaks(judd).summary()['frames'] == 3
+
+    summary = competition_breaks(competition).summary()
+    assert summary['count'] == 3
+    assert summary['frames'] == 4
+    assert summary['maximums'] == 0
+
+
+@pytest.mark.django_db
+def test_stats_views(client, players, competition, django_assert_max_num_queries):
+    ronnie, judd = players
+    play_frames('2024-07-01', ronnie, judd, [(120, [100, 20], 10, [])], competition)
+
+    with django_assert_max_num_queries(2):
+        response = client.get(reverse('player_stats', args=[ronnie.pk]))
+    assert response.status_code == 200
+    assert response.context['stats']['centuries'] == 1
+
+    response = client.get(reverse('competition_stats', args=[competition.pk]), {'season': 2023})
+    assert response.status_code == 200
+    assert response.context['stats']['count'] == 0
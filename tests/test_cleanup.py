@@ -0,0 +1,70 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from snooker_app import page_cache
+from snooker_app.cleanup import purge_expired_temporary
+from snooker_app.models import Player, Match, MatchPlayer, MatchResult, Frame, TemporaryPlayer, Competition
+
+
+def temporary_match(age_days):
+    created = timezone.now() - timedelta(days=age_days)
+    temp_player1 = TemporaryPlayer.objects.create(name='Player 1')
+    temp_player2 = TemporaryPlayer.objects.create(name='Player 2')
+    match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=1, is_temporary=True,
+                                 temp_player1=temp_player1, temp_player2=temp_player2)
+    Match.objects.filter(pk=match.pk).update(created_at=created)
+    TemporaryPlayer.objects.filter(pk__in=[temp_player1.pk, temp_player2.pk]).update(created_at=created)
+    return match
+
+
+@pytest.mark.django_db
+def test_purge_deletes_expired_temporary_matches_in_batches():
+    player = Player.objects.create(first_name='Ronnie')
+    expired = [temporary_match(40) for _ in range(3)]
+    recent = temporary_match(2)
+    regular = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=1)
+    Match.objects.filter(pk=regular.pk).update(created_at=timezone.now() - timedelta(days=90))
+    expired[0].players.add(player)
+    line = MatchPlayer.objects.create(match=expired[0], player=player, position=1)
+    Frame.objects.create(match_player=line, frame_number=1)
+    MatchResult.objects.create(match=expired[0])
+    orphan = TemporaryPlayer.objects.create(name='Unused')
+    TemporaryPlayer.objects.filter(pk=orphan.pk).update(created_at=timezone.now() - timedelta(days=40))
+    reports = []
+
+    totals = purge_expired_temporary(batch_size=2, pause=0, report=lambda totals: reports.append(dict(totals)))
+
+    assert totals['matches'] == 3
+    assert totals['temporary_players'] == 7
+    assert [report['matches'] for report in reports] == [2, 3, 3, 3, 3, 3]
+    assert set(Match.objects.values_list('pk', flat=True)) == {recent.pk, regular.pk}
+    assert set(TemporaryPlayer.objects.all()) == {recent.temp_player1, recent.temp_player2}
+    assert Player.objects.filter(pk=player.pk).exists()
+    assert not Frame.objects.exists()
+    assert not MatchResult.objects.exists()
+
+
+@pytest.mark.django_db
+def test_purge_command_reports_counts():
+    temporary_match(31)
+    out = StringIO()
+    call_command('purge_temporary_matches', '--pause=0', stdout=out)
+    assert 'deleted 1 matches and 2 temporary players' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_purge_invalidates_competitions_that_listed_the_match(django_capture_on_commit_callbacks):
+    match = temporary_match(40)
+    competition = Competition.objects.create(name='Masters', start_date='2024-07-01', end_date='2024-07-07')
+    competition.matches.add(match)
+    before = page_cache.generations([page_cache.competition_scope(competition.pk)])
+
+    with django_capture_on_commit_callbacks(execute=True):
+        purge_expired_temporary(pause=0)
+
+    assert not competition.matches.exists()
+    assert page_cache.generations([page_cache.competition_scope(competition.pk)]) != before
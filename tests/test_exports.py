@@ -0,0 +1,69 @@
+import csv
+import json
+from io import StringIO
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+
+from snooker_app.models import Player, Match, MatchPlayer, Frame, Competition, GroupStage, Venue
+
+
+@pytest.fixture
+def results():
+    venue = Venue.objects.create(name='Crucible')
+    competition = Competition.objects.create(name='Open', start_date='2024-07-01', end_date='2024-07-02',
+                                             competition_type='Qualifiers')
+    stage = GroupStage.objects.create(competition=competition, name='Groups', num_groups=1, players_per_group=2)
+    ronnie, judd = Player.objects.create(first_name='Ronnie'), Player.objects.create(first_name='Judd')
+    group_match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=3, venue=venue,
+                                       group_stage=stage, group_name='A')
+    friendly = Match.objects.create(date='2023-01-10', time='12:00:00', number_of_frames=1)
+    for match in (group_match, friendly):
+        match.players.add(ronnie, judd)
+        line = MatchPlayer.objects.create(match=match, player=ronnie, position=1)
+        MatchPlayer.objects.create(match=match, player=judd, position=2)
+    line = MatchPlayer.objects.get(match=group_match, position=1)
+    Frame.objects.create(match_player=line, frame_number=1, winner=ronnie, break_points_player1=[55, 12])
+    Frame.objects.create(match_player=line, frame_number=2, winner=ronnie)
+    return competition, group_match, ronnie
+
+
+@pytest.mark.django_db
+def test_export_views_stream_csv_and_jsonl(client, results):
+    competition, group_match, ronnie = results
+    client.force_login(User.objects.create_user('operator', password='secret'))
+
+    response = client.get(reverse('export_results', args=['matches']), {'date_from': '2024-01-01'})
+    assert response.streaming
+    assert response['Content-Type'] == 'text/csv'
+    rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+    assert [row['id'] for row in rows] == [str(group_match.pk)]
+    assert rows[0]['venue'] == 'Crucible'
+    assert rows[0]['players'] == 'Ronnie, Judd'
+
+    response = client.get(reverse('export_results', args=['frames']),
+                          {'format': 'jsonl', 'competition': competition.pk})
+    frames = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert [frame['frame_number'] for frame in frames] == [1, 2]
+    assert frames[0]['break_points_player1'] == [55, 12]
+    assert frames[0]['winner_id'] == ronnie.pk
+
+    assert client.get(reverse('export_results', args=['players'])).status_code == 400
+    assert client.get(reverse('export_results', args=['matches']), {'date_to': 'soon'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_export_standings_command(results, tmp_path):
+    competition, _, ronnie = results
+    output = tmp_path / 'standings.jsonl'
+    call_command('export_results', 'standings', '--format=jsonl', f'--output={output}',
+                 f'--competition={competition.pk}', stderr=StringIO())
+
+    rows = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [(row['rank'], row['player'], row['points']) for row in rows] == [(1, 'Ronnie', 3), (2, 'Judd', 0)]
+
+    out = StringIO()
+    call_command('export_results', 'matches', '--date-to=2023-12-31', stdout=out)
+    assert len(out.getvalue().splitlines()) == 2
@@ -0,0 +1,171 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from snooker_app.finalization import finalize_match, FinalizationError
+from snooker_app.models import (Player, Match, MatchPlayer, MatchResult, Frame, Achievement, HeadToHead,
+                                PlayerStatistics, RatingHistory)
+from tests.test_achievements import play_match
+
+
+@pytest.fixture
+def players():
+    return [Player.objects.create(first_name=name) for name in ('Ronnie', 'Judd', 'Mark', 'Neil')]
+
+
+def scored_match(player1, player2, scores, number_of_frames=None):
+    # Frames with scores but no winner yet, as scoring leaves them.
+    match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=number_of_frames or len(scores))
+    line = MatchPlayer.objects.create(match=match, player=player1, position=1)
+    MatchPlayer.objects.create(match=match, player=player2, position=2)
+    for number, (points1, points2) in enumerate(scores, start=1):
+        Frame.objects.create(match_player=line, frame_number=number, points_scored_player1=points1,
+                             points_scored_player2=points2, total_shots_player1=10, misses_player1=3,
+                             player2_fouls=1, foul_points_player2=4, max_break_player1=points1,
+                             break_points_player1=[points1])
+    return match
+
+
+def derived(player):
+    achievement = Achievement.objects.filter(player=player).values(
+        'frames_won', 'frames_lost', 'matches_won', 'consecutive_frames_won', 'breaks').first()
+    statistics = PlayerStatistics.objects.filter(player=player).values(
+        'matches_played', 'attempts', 'successful_pots', 'fouls', 'highest_break').first()
+    player = Player.objects.get(pk=player.pk)
+    return achievement, statistics, round(player.rating, 6), player.rated_matches, player.highest_break
+
+
+@pytest.mark.django_db
+def test_finalize_matches_the_signal_path(players):
+    ronnie, judd, mark, neil = players
+    play_match(1, ronnie, judd, [ronnie, judd, ronnie], breaks1=[147], breaks2=[60])
+    play_match(2, mark, neil, [mark, neil, mark], breaks1=[147], breaks2=[60], record=False)
+
+    report = finalize_match(Match.objects.get(date='2024-07-02'))
+
+    assert report['created'] and report['score'] == '2-1' and report['winner_id'] == mark.pk
+    assert report['recorded'] == ['stats', 'achievements', 'head_to_head', 'rating']
+    assert derived(mark) == derived(ronnie)
+    assert derived(neil) == derived(judd)
+    record = HeadToHead.objects.get(player1__in=[mark, neil])
+    assert (record.matches, record.player1_frames + record.player2_frames) == (1, 3)
+
+
+@pytest.mark.django_db
+def test_finalize_decides_frames_and_is_idempotent(players):
+    ronnie, judd, _, _ = players
+    match = scored_match(ronnie, judd, [(70, 20), (10, 60), (52, 0), (26, 30)], number_of_frames=3)
+
+    report = finalize_match(match.pk)
+    assert report['frame_winners_set'] == 3
+    assert list(Frame.objects.filter(match_player__match=match).order_by('frame_number')
+                .values_list('winner', flat=True)) == [ronnie.pk, judd.pk, ronnie.pk, None]
+    result = MatchResult.objects.get(match=match)
+    assert result.match_score == '2-1'
+    assert result.frames[1] == {'frame': 2, 'winner_id': judd.pk, 'scores': [14, 60]}
+    assert (result.player1_fouls, result.player2_fouls, result.total_fouls) == (0, 4, 4)
+    assert result.player1_breaks == {'breaks': [70, 10, 52, 26], 'highest': 70}
+    assert result.match_duration is not None
+    line = MatchPlayer.objects.get(match=match, player=ronnie)
+    assert (line.points_scored, line.max_break, line.attempts, line.successful_pots) == (158, 70, 40, 28)
+    assert line.stats_recorded and line.rating_recorded
+    before = derived(ronnie), derived(judd)
+
+    again = finalize_match(match.pk)
+    assert not again['created'] and again['recorded'] == [] and again['frame_winners_set'] == 0
+    assert (derived(ronnie), derived(judd)) == before
+    assert MatchResult.objects.filter(match=match).count() == 1
+    assert RatingHistory.objects.filter(match=match).count() == 2
+    assert MatchResult.objects.get(match=match).match_end_time == result.match_end_time
+
+
+@pytest.mark.django_db
+def test_finalize_reports_its_queries(players, django_assert_num_queries):
+    ronnie, judd, mark, _ = players
+    play_match(1, ronnie, judd, [ronnie, judd])
+    match = scored_match(ronnie, mark, [(70, 20)] * 9)
+
+    with django_assert_num_queries(21) as captured:
+        report = finalize_match(match)
+    # The count doesn't grow with the frames, and the report saw all of it.
+    assert report['queries'] == len(captured)
+    assert len(report['sql']) == report['queries']
+    assert finalize_match(match)['queries'] < report['queries']
+
+
+@pytest.mark.django_db
+def test_finalize_rejects_unfinished_matches(players):
+    ronnie, _, _, _ = players
+    match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=3)
+    MatchPlayer.objects.create(match=match, player=ronnie, position=1)
+    with pytest.raises(FinalizationError):
+        finalize_match(match)
+    with pytest.raises(FinalizationError):
+        finalize_match(match.pk + 1)
+    assert not MatchResult.objects.exists()
+
+
+@pytest.mark.django_db
+def test_finalize_rejects_undecided_matches(players):
+    ronnie, judd, _, _ = players
+    match = scored_match(ronnie, judd, [(70, 20)], number_of_frames=7)
+    with pytest.raises(FinalizationError, match='1-0 of 7'):
+        finalize_match(match)
+    assert not MatchResult.objects.exists()
+    assert not Frame.objects.filter(winner__isnull=False).exists()
+    assert not RatingHistory.objects.exists()
+
+    level = scored_match(ronnie, judd, [(70, 20), (10, 60)], number_of_frames=2)
+    assert finalize_match(level)['winner_id'] is None
+
+
+@pytest.mark.django_db
+def test_inconsistent_frame_counts_stop_at_zero(players):
+    ronnie, judd, _, _ = players
+    match = scored_match(ronnie, judd, [(70, 20)])
+    Frame.objects.update(total_shots_player1=4, safety_shot_player1=2, misses_player1=5)
+    finalize_match(match)
+    line = MatchPlayer.objects.get(match=match, position=1)
+    assert (line.attempts, line.successful_pots) == (2, 0)
+
+
+@pytest.mark.django_db
+def test_finalize_only_folds_in_lines_not_yet_recorded(players):
+    ronnie, judd, _, _ = players
+    play_match(1, ronnie, judd, [ronnie, judd, ronnie])
+    expected = derived(ronnie), derived(judd)
+    match = Match.objects.get()
+    MatchPlayer.objects.filter(match=match, player=judd).update(stats_recorded=False, achievements_recorded=False,
+                                                                head_to_head_recorded=False, rating_recorded=False)
+    judd_stats = PlayerStatistics.objects.get(player=judd)
+    judd_stats.matches_played = 0
+    judd_stats.attempts = judd_stats.successful_pots = judd_stats.fouls = 0
+    judd_stats.save()
+    Achievement.objects.filter(player=judd).delete()
+
+    report = finalize_match(match)
+    assert report['recorded'] == ['stats', 'achievements']
+    assert (derived(ronnie), derived(judd)) == expected
+    assert HeadToHead.objects.get().matches == 1
+    assert RatingHistory.objects.filter(match=match).count() == 2
+    assert not MatchPlayer.objects.filter(match=match, rating_recorded=False).exists()
+
+
+@pytest.mark.django_db
+def test_finish_match_view_and_command(client, players):
+    ronnie, judd, _, _ = players
+    match = scored_match(ronnie, judd, [(70, 20)])
+    assert client.get(reverse('finish_match', args=[match.pk])).status_code == 405
+
+    response = client.post(reverse('finish_match', args=[match.pk]))
+    assert response.status_code == 200
+    assert response.json()['winner_id'] == ronnie.pk and 'sql' not in response.json()
+
+    out = StringIO()
+    call_command('finalize_match', match.pk, stdout=out)
+    assert 'recorded nothing new' in out.getvalue()
+
+    empty = Match.objects.create(date='2024-07-02', time='15:30:00', number_of_frames=1)
+    assert client.post(reverse('finish_match', args=[empty.pk])).status_code == 400
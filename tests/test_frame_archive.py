@@ -0,0 +1,112 @@
+import os
+from datetime import date, timedelta
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from mixer.backend.django import mixer
+
+from snooker_app.break_analytics import competition_breaks, player_breaks
+from snooker_app.frame_archive import ArchiveError, FrameArchive
+from snooker_app.models import Player, Match, MatchPlayer, Frame, Competition, GroupStage
+
+
+def play(competition, day, player1, player2, frames, stage=None):
+    match = Match.objects.create(date=date(2023, 5, day), time='15:30:00', number_of_frames=len(frames),
+                                 group_stage=stage)
+    if stage is None:
+        competition.matches.add(match)
+    line = MatchPlayer.objects.create(match=match, player=player1, position=1)
+    MatchPlayer.objects.create(match=match, player=player2, position=2)
+    for number, (winner, breaks1, breaks2) in enumerate(frames, start=1):
+        Frame.objects.create(match_player=line, frame_number=number, winner=winner,
+                             time_duration=timedelta(minutes=10 + number),
+                             points_scored_player1=sum(breaks1) + 5, points_scored_player2=sum(breaks2),
+                             break_points_player1=breaks1, break_points_player2=breaks2)
+    return match
+
+
+@pytest.fixture
+def history():
+    ronnie, judd, mark = (Player.objects.create(first_name=name) for name in ('Ronnie', 'Judd', 'Mark'))
+    finished = mixer.blend(Competition, start_date=date(2023, 5, 1), end_date=date(2023, 5, 10))
+    other = mixer.blend(Competition, start_date=date(2023, 5, 1), end_date=date(2023, 5, 10))
+    running = mixer.blend(Competition, start_date=date(2023, 5, 1), end_date=date(2030, 1, 1))
+    stage = GroupStage.objects.create(competition=other, name='Groups', num_groups=1, players_per_group=3)
+    play(finished, 2, ronnie, judd, [(ronnie, [147], []), (judd, [12, 55], [101]), (ronnie, [], [])])
+    play(finished, 3, judd, mark, [(mark, [], [64, 30])])
+    play(other, 4, mark, ronnie, [(ronnie, [20], [130, 11])], stage=stage)
+    play(running, 5, ronnie, judd, [(judd, [99], [88])])
+    return ronnie, judd, mark, finished, other
+
+
+@pytest.mark.django_db
+def test_archive_holds_completed_competitions(history, tmp_path):
+    ronnie, judd, mark, finished, other = history
+    path = str(tmp_path / 'frames')
+    call_command('archive_frames', path, today='2024-01-01', chunk_size=2, stdout=StringIO())
+
+    archive = FrameArchive(path)
+    assert len(archive) == 5
+    assert archive.column('competition_id').tolist() == [finished.pk] * 4 + [other.pk]
+    assert archive.column('frame_number').tolist() == [1, 2, 3, 1, 1]
+    assert archive.column('winner_id').tolist() == [ronnie.pk, judd.pk, ronnie.pk, mark.pk, ronnie.pk]
+    assert archive.column('duration_seconds')[0] == 660
+    assert archive.column('safety_shot_player1').tolist() == [-1] * 5
+    assert isinstance(archive.column('player1_id'), np.memmap)
+
+    values, offsets = archive.breaks(1)
+    assert offsets.tolist() == [0, 1, 3, 3, 3, 4]
+    assert values.tolist() == [147, 12, 55, 20]
+
+
+@pytest.mark.django_db
+def test_archive_analytics_match_the_database(history, tmp_path):
+    ronnie, judd, mark, finished, other = history
+    path = str(tmp_path / 'frames')
+    call_command('archive_frames', path, today='2024-01-01', stdout=StringIO())
+    archive = FrameArchive(path)
+
+    assert (archive.break_set(archive.select(competition_id=finished.pk)).summary() ==
+            competition_breaks(finished).summary())
+    # Ronnie's frame in the running competition is not archived yet.
+    from_archive = archive.break_set(archive.select(player_id=ronnie.pk), player_id=ronnie.pk).summary()
+    assert from_archive['count'] == player_breaks(ronnie).summary()['count'] - 1 == 5
+    assert from_archive['highest'] == 147
+    assert len(archive.select(season=2023)) == 5
+    assert len(archive.select(season=2022)) == 0
+    assert len(archive.select(date_from=date(2023, 5, 3), date_to=date(2023, 5, 3))) == 1
+
+
+@pytest.mark.django_db
+def test_rewriting_replaces_the_archive(history, tmp_path):
+    path = str(tmp_path / 'frames')
+    call_command('archive_frames', path, today='2023-01-01', stdout=StringIO())
+    assert len(FrameArchive(path)) == 0
+    assert len(FrameArchive(path).break_set()) == 0
+
+    empty = FrameArchive(path)
+    call_command('archive_frames', path, today='2024-01-01', stdout=StringIO())
+    assert len(FrameArchive(path)) == 5
+    # An archive opened before the rewrite keeps reading its own version.
+    assert len(empty) == 0 and len(empty.column('frame_id')) == 0
+
+    call_command('archive_frames', path, today='2024-01-01', stdout=StringIO())
+    names = sorted(p.name for p in tmp_path.iterdir())
+    assert names[0] == 'frames' and len(names) == 3
+    assert os.path.islink(path) and os.readlink(path) in names
+
+    with pytest.raises(ArchiveError):
+        FrameArchive(str(tmp_path / 'missing'))
+
+
+@pytest.mark.django_db
+def test_rewriting_takes_over_an_unversioned_archive(history, tmp_path):
+    path = tmp_path / 'frames'
+    path.mkdir()
+    (path / 'meta.json').write_text('{}')
+    call_command('archive_frames', str(path), today='2024-01-01', stdout=StringIO())
+    assert os.path.islink(path)
+    assert len(FrameArchive(str(path))) == 5
+    assert (tmp_path / 'frames.0' / 'meta.json').exists()
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from django.core.cache import cache
+
+from snooker_app import gpt_integration
+from snooker_app.gpt_integration import AnalysisService, AnalysisError, StubBackend, prompt_key
+
+
+class SlowBackend(StubBackend):
+    def __init__(self, delay=0.05):
+        super().__init__()
+        self.delay = delay
+        self.active = 0
+        self.most_active = 0
+
+    async def complete(self, prompts):
+        self.active += 1
+        self.most_active = max(self.most_active, self.active)
+        await asyncio.sleep(self.delay)
+        self.active -= 1
+        return await super().complete(prompts)
+
+
+class FailingBackend(StubBackend):
+    async def complete(self, prompts):
+        self.batches.append(list(prompts))
+        raise RuntimeError('backend down')
+
+
+class ShortBackend(StubBackend):
+    async def complete(self, prompts):
+        return (await super().complete(prompts))[:-1]
+
+
+@pytest.fixture
+def service():
+    services = []
+
+    def make(backend, **options):
+        services.append(AnalysisService(backend, cache=cache, **options))
+        return services[-1]
+    yield make
+    for running in services:
+        running.close()
+
+
+def test_identical_prompts_are_batched_and_deduplicated(service):
+    analysis = service(SlowBackend(), batch_wait=0.1)
+    futures = [analysis.submit(prompt) for prompt in ['a', 'b', 'a', 'c', 'b']]
+
+    assert [future.result(5) for future in futures] == [f'Analysis: {p}' for p in 'abacb']
+    assert analysis.backend.batches == [['a', 'b', 'c']]
+
+
+def test_results_are_cached_by_content(service):
+    analysis = service(StubBackend(), ttl=60)
+    assert analysis.submit('147 break').result(5) == 'Analysis: 147 break'
+    assert cache.get(prompt_key(analysis.model, '147 break')) == 'Analysis: 147 break'
+
+    assert analysis.submit('147 break').result(5) == 'Analysis: 147 break'
+    assert analysis.backend.batches == [['147 break']]
+
+
+def test_concurrency_is_bounded(service):
+    analysis = service(SlowBackend(), concurrency=2, batch_size=1, batch_wait=0)
+    futures = [analysis.submit(f'prompt {i}') for i in range(6)]
+
+    assert len({future.result(5) for future in futures}) == 6
+    assert len(analysis.backend.batches) == 6
+    assert analysis.backend.most_active == 2
+
+
+def test_failures_are_not_cached(service):
+    analysis = service(FailingBackend())
+    with pytest.raises(RuntimeError, match='backend down'):
+        analysis.submit('century').result(5)
+    with pytest.raises(RuntimeError):
+        analysis.submit('century').result(5)
+    assert len(analysis.backend.batches) == 2
+
+
+def test_short_answers_fail_the_whole_batch(service):
+    analysis = service(ShortBackend(), batch_wait=0.1)
+    futures = [analysis.submit(prompt) for prompt in ['a', 'b', 'c']]
+    for future in futures:
+        with pytest.raises(AnalysisError, match='Expected 3'):
+            future.result(5)
+    assert not analysis.in_flight
+    assert cache.get(prompt_key(analysis.model, 'a')) is None
+
+
+def test_module_helpers_use_the_configured_service(service):
+    gpt_integration.set_service(service(StubBackend()))
+    try:
+        assert gpt_integration.analyze_achievement('maximum') == 'Analysis: maximum'
+        assert asyncio.run(gpt_integration.analyze_achievement_async('maximum')) == 'Analysis: maximum'
+
+        gpt_integration.set_service(service(FailingBackend()))
+        assert gpt_integration.analyze_achievement('maximum') == 'Error: backend down'
+    finally:
+        gpt_integration.set_service(None)
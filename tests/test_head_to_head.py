@@ -0,0 +1,96 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+
+from snooker_app.head_to_head import HeadToHeadEngine, ordered_pair
+from snooker_app.models import Player, Match, MatchResult, HeadToHead
+from tests.test_achievements import play_match
+
+
+@pytest.fixture
+def players():
+    return (Player.objects.create(first_name='Ronnie'), Player.objects.create(first_name='Judd'),
+            Player.objects.create(first_name='Mark'))
+
+
+def stored(player1, player2):
+    return list(HeadToHead.objects.order_by('player1', 'player2').filter(player1__in=[player1, player2],
+                                                                          player2__in=[player1, player2])
+                .values_list('matches', 'player1_wins', 'player2_wins', 'player1_frames', 'player2_frames',
+                             'player1_highest_break', 'player2_highest_break'))
+
+
+@pytest.mark.django_db
+def test_results_update_head_to_head_incrementally(players):
+    ronnie, judd, mark = players
+    play_match(1, ronnie, judd, [ronnie, judd, ronnie], breaks1=[147], breaks2=[60])
+    play_match(2, judd, ronnie, [judd, judd])
+    play_match(3, judd, ronnie, [judd, ronnie])
+    play_match(4, mark, ronnie, [mark])
+
+    assert stored(ronnie, judd) == [(3, 1, 1, 3, 4, 147, 60)]
+    record = HeadToHead.objects.get(player1=ronnie, player2=judd)
+    assert str(record.last_played) == '2024-07-03'
+    assert HeadToHead.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_rebuild_matches_incremental_results(players):
+    ronnie, judd, mark = players
+    play_match(1, ronnie, judd, [ronnie, judd, ronnie], breaks1=[147], breaks2=[60])
+    play_match(2, judd, ronnie, [judd, judd])
+    play_match(3, mark, judd, [judd, judd])
+    expected = list(HeadToHead.objects.order_by('player1', 'player2').values())
+
+    play_match(4, ronnie, mark, [mark], record=False)
+    HeadToHead.objects.all().delete()
+    HeadToHead.objects.create(player1=ronnie, player2=mark, matches=9)
+    call_command('rebuild_head_to_head', chunk_size=2, stdout=StringIO())
+
+    rebuilt = list(HeadToHead.objects.order_by('player1', 'player2').values())
+    assert [{k: v for k, v in row.items() if k != 'id'} for row in rebuilt] == \
+           [{k: v for k, v in row.items() if k != 'id'} for row in expected]
+
+    MatchResult.objects.create(match=Match.objects.get(date='2024-07-04'))
+    assert stored(ronnie, mark) == [(1, 0, 1, 0, 1, 0, 0)]
+
+
+@pytest.mark.django_db
+def test_head_to_head_views(client, players, django_assert_num_queries):
+    ronnie, judd, mark = players
+    play_match(1, ronnie, judd, [ronnie, judd, ronnie], breaks1=[147])
+    play_match(2, ronnie, judd, [ronnie])
+    play_match(3, mark, judd, [mark])
+
+    with django_assert_num_queries(1):
+        response = client.get(reverse('head_to_head_pair', args=[judd.pk, ronnie.pk]))
+    assert response.json()['opponent'] == 'Ronnie'
+    assert response.json()['wins'] == 0
+    assert response.json()['losses'] == 2
+    assert response.json()['frames_won'] == 1
+    assert response.json()['opponent_highest_break'] == 147
+
+    with django_assert_num_queries(1):
+        response = client.get(reverse('head_to_head', args=[judd.pk]))
+    opponents = response.json()['opponents']
+    assert [(row['opponent'], row['matches'], row['wins']) for row in opponents] == [('Ronnie', 2, 0), ('Mark', 1, 0)]
+
+    response = client.get(reverse('head_to_head_pair', args=[ronnie.pk, mark.pk]))
+    assert response.json()['matches'] == 0
+    assert response.json()['opponent'] == 'Mark'
+    assert client.get(reverse('head_to_head_pair', args=[ronnie.pk, ronnie.pk])).status_code == 400
+    assert client.get(reverse('head_to_head_pair', args=[ronnie.pk, 0])).status_code == 404
+    assert client.get(reverse('head_to_head', args=[0])).status_code == 404
+
+
+@pytest.mark.django_db
+def test_load_creates_and_locks_rows_for_new_pairs(players):
+    ronnie, judd, _ = players
+    engine = HeadToHeadEngine()
+    engine.load([ordered_pair(ronnie.pk, judd.pk)])
+
+    record = engine.records[ordered_pair(ronnie.pk, judd.pk)]
+    assert record.pk is not None and record.matches == 0
+    assert HeadToHead.objects.count() == 1
@@ -0,0 +1,97 @@
+import json
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from snooker_app.models import Venue, Player, Referee, Match, MatchPlayer, MatchResult, Frame
+
+
+@pytest.fixture
+def history(tmp_path):
+    (tmp_path / 'venues.csv').write_text('id,name,capacity\nv1,Crucible,980\n')
+    (tmp_path / 'players.csv').write_text('id,first_name,last_name,nickname\n'
+                                          'p1,Ronnie,O\'Sullivan,Rocket\np2,Judd,Trump,\np1,Ronnie,Again,\n')
+    (tmp_path / 'referees.jsonl').write_text(json.dumps({'id': 'r1', 'first_name': 'Olivier', 'last_name': 'Marteel'}))
+    (tmp_path / 'matches.jsonl').write_text('\n'.join(json.dumps(row) for row in [
+        {'id': 'm1', 'date': '2024-05-06', 'time': '19:00:00', 'number_of_frames': 3, 'venue': 'v1',
+         'players': ['p1', 'p2'], 'referees': ['r1']},
+        {'id': 'm2', 'date': '2024-05-07', 'time': '13:00:00', 'number_of_frames': 1, 'players': ['p2', 'p1']},
+    ]))
+    (tmp_path / 'match_players.csv').write_text('match,player,position,points_scored\n'
+                                                'm1,p1,1,220\nm1,p2,2,75\nm2,p2,1,0\nm2,p1,2,0\n')
+    (tmp_path / 'frames.csv').write_text('match,frame_number,winner,time_duration,break_points_player1\n'
+                                         'm1,1,p1,540,147\nm1,2,p1,0:25:00,55;12\nm2,1,p2,,\n')
+    return tmp_path
+
+
+def import_history(path, *extra):
+    out = StringIO()
+    call_command('import_history', *[f'--{kind.replace("_", "-")}={path / name}' for kind, name in (
+        ('venues', 'venues.csv'), ('players', 'players.csv'), ('referees', 'referees.jsonl'),
+        ('matches', 'matches.jsonl'), ('match_players', 'match_players.csv'), ('frames', 'frames.csv'),
+    )], '--batch-size=2', *extra, stdout=out)
+    return out.getvalue()
+
+
+@pytest.mark.django_db
+def test_import_history(history):
+    output = import_history(history)
+
+    assert 'players: 2 imported, 1 skipped' in output
+    assert 'rows/s' in output
+    ronnie = Player.objects.get(first_name='Ronnie')
+    assert ronnie.nickname == 'Rocket'
+    match = Match.objects.get(date='2024-05-06')
+    assert match.venue == Venue.objects.get(name='Crucible')
+    assert set(match.players.all()) == set(Player.objects.all())
+    assert list(match.referees.all()) == [Referee.objects.get()]
+    assert match.referee_names == 'Olivier Marteel'
+    assert MatchPlayer.objects.get(match=match, player=ronnie).points_scored == 220
+
+    frames = Frame.objects.filter(match_player__match=match).order_by('frame_number')
+    assert [frame.time_duration for frame in frames] == [timedelta(seconds=540), timedelta(minutes=25)]
+    assert [frame.break_points_player1 for frame in frames] == [[147], [55, 12]]
+    assert all(frame.winner == ronnie for frame in frames)
+    assert Frame.objects.filter(match_player__match__date='2024-05-07', match_player__player__first_name='Judd').exists()
+
+    # Both matches are decided by their frames, so the rebuild commands see them.
+    assert 'results: 2 recorded' in output
+    result = MatchResult.objects.get(match=match)
+    assert result.match_score == '2-0'
+    assert result.player1_breaks == {'breaks': [147, 55, 12], 'highest': 147}
+    call_command('recompute_player_stats', stdout=StringIO())
+    call_command('replay_ratings', stdout=StringIO())
+    ronnie.refresh_from_db()
+    assert ronnie.statistics.matches_played == 2
+    assert ronnie.rated_matches == 2
+
+
+@pytest.mark.django_db
+def test_import_history_resumes_without_duplicates(history):
+    (history / 'frames.csv').write_text('match,frame_number,winner\nm1,1,p1\nm9,2,p1\n')
+    with pytest.raises(CommandError, match='m9'):
+        import_history(history, '--batch-size=1')
+
+    (history / 'frames.csv').write_text('match,frame_number,winner\nm1,1,p1\nm1,2,p2\n')
+    output = import_history(history)
+
+    assert 'matches: 0 imported, 2 skipped' in output
+    assert 'frames: 1 imported, 1 skipped' in output
+    assert Player.objects.count() == 2
+    assert Match.objects.count() == 2
+    assert Frame.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_import_history_refuses_rows_missing_required_columns(history):
+    (history / 'match_players.csv').write_text('match,player,points_scored\nm1,p1,220\n')
+    with pytest.raises(CommandError, match='Line 1: missing required column position'):
+        import_history(history)
+    assert not MatchPlayer.objects.exists()
+
+    (history / 'matches.jsonl').write_text(json.dumps({'id': 'm3', 'date': '2024-05-08', 'time': '13:00:00'}))
+    with pytest.raises(CommandError, match='Line 1: missing required column number_of_frames'):
+        import_history(history)
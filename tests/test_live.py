@@ -0,0 +1,105 @@
+import asyncio
+import json
+import threading
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from django.urls import reverse
+
+from snooker_app import live
+from snooker_app.live import Broker, InMemoryBackend, match_channel, competition_channel
+from snooker_app.models import Player, Match, Competition, GroupStage
+from snooker_app.scoring import apply_events
+
+
+class RecordingBackend:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, channel, message):
+        self.published.append((channel, json.loads(message)))
+        return 1
+
+
+@pytest.fixture
+def broker():
+    broker = Broker(InMemoryBackend())
+    live.set_broker(broker)
+    yield broker
+    live.set_broker(None)
+
+
+def test_in_memory_backend_fans_out_across_threads(broker):
+    async def scenario():
+        first = broker.subscribe('match:1')
+        second = broker.subscribe('match:1')
+        other = broker.subscribe('match:2')
+        publisher = threading.Thread(target=broker.publish, args=(['match:1'], {'scores': [1, 0]}))
+        publisher.start()
+        publisher.join()
+        received = [await first.get(timeout=1), await second.get(timeout=1)]
+        assert other.queue.empty()
+        for subscription in (first, second, other):
+            subscription.close()
+        return received
+
+    assert async_to_sync(scenario)() == ['{"scores":[1,0]}'] * 2
+    assert broker.backend.subscriber_count('match:1') == 0
+
+
+def test_slow_subscriber_keeps_latest_messages(broker):
+    async def scenario():
+        subscription = broker.subscribe('match:1')
+        for seq in range(live.SUBSCRIBER_QUEUE_SIZE + 5):
+            broker.publish(['match:1'], {'seq': seq})
+        await asyncio.sleep(0)
+        first = json.loads(await subscription.get(timeout=1))
+        subscription.close()
+        return first, subscription.queue.qsize()
+
+    first, remaining = async_to_sync(scenario)()
+    assert first == {'seq': 5}
+    assert remaining == live.SUBSCRIBER_QUEUE_SIZE - 1
+
+
+@pytest.mark.django_db
+def test_scoring_publishes_deltas(django_capture_on_commit_callbacks):
+    backend = RecordingBackend()
+    live.set_broker(Broker(backend))
+    competition = Competition.objects.create(name='Open', start_date='2024-07-01', end_date='2024-07-02',
+                                             competition_type='Qualifiers')
+    stage = GroupStage.objects.create(competition=competition, name='Groups', num_groups=1, players_per_group=2)
+    match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=5, group_stage=stage)
+    match.players.add(Player.objects.create(first_name='Mark'), Player.objects.create(first_name='John'))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        apply_events(match, 1, [{'type': 'pot', 'value': 1}], seq=1)
+    live.set_broker(None)
+
+    assert [channel for channel, _ in backend.published] == [match_channel(match.pk),
+                                                             competition_channel(competition.pk)]
+    assert backend.published[0][1] == {'match': match.pk, 'frame': 1, 'seq': 1, 'scores': [1, 0],
+                                       'active_player': 1, 'current_break': 1}
+
+
+@pytest.mark.django_db
+def test_live_match_streams_server_sent_events(broker):
+    match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=5)
+
+    async def scenario():
+        response = await AsyncClient().get(reverse('live_match', args=[match.pk]))
+        stream = response.streaming_content
+        chunks = [await anext(stream)]
+        broker.publish([match_channel(match.pk)], {'scores': [7, 0]})
+        chunks.append(await anext(stream))
+        await stream.aclose()
+        return response, chunks
+
+    response, chunks = async_to_sync(scenario)()
+    assert response['Content-Type'] == 'text/event-stream'
+    assert chunks[0] == b'retry: 3000\n\n'
+    assert chunks[1] == b'event: score\ndata: {"scores":[7,0]}\n\n'
+
+    missing = async_to_sync(AsyncClient().get)(reverse('live_match', args=[match.pk + 1]))
+    assert missing.status_code == 404
@@ -0,0 +1,76 @@
+import json
+import logging
+
+import pytest
+from django.contrib.auth.models import User
+from django.urls import reverse
+from mixer.backend.django import mixer
+
+from snooker_app.middleware import QueryRecorder
+from snooker_app.models import Player
+
+MIDDLEWARE = 'snooker_app.middleware.RequestMetricsMiddleware'
+
+
+@pytest.fixture
+def metrics(settings):
+    settings.MIDDLEWARE = [*settings.MIDDLEWARE, MIDDLEWARE]
+    settings.SNOOKER_SLOW_REQUEST_MS = 10_000
+
+
+def _logged(caplog, level):
+    return [record.metrics for record in caplog.records
+            if record.name == 'snooker_app.requests' and record.levelno == level]
+
+
+@pytest.mark.django_db
+def test_staff_get_metrics_headers(client, metrics, caplog):
+    mixer.cycle(3).blend(Player)
+    client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+
+    with caplog.at_level(logging.INFO, logger='snooker_app.requests'):
+        response = client.get(reverse('player_list'))
+
+    assert response['X-View-Name'] == 'player_list'
+    assert int(response['X-Query-Count']) >= 1
+    assert response['X-Duplicate-Query-Count'] == '0'
+    assert response['Server-Timing'].startswith('total;dur=')
+    [logged] = _logged(caplog, logging.INFO)
+    assert logged['view'] == 'player_list'
+    assert logged['status'] == 200
+    assert logged['queries'] == int(response['X-Query-Count'])
+
+
+@pytest.mark.django_db
+def test_others_get_no_headers(client, metrics):
+    response = client.get(reverse('player_list'))
+    assert 'X-Query-Count' not in response
+    assert 'Server-Timing' not in response
+
+    client.force_login(User.objects.create_user('user', password='x'))
+    assert 'X-Query-Count' not in client.get(reverse('player_list'))
+
+
+@pytest.mark.django_db
+def test_slow_requests_are_logged_with_their_sql(client, metrics, settings, caplog):
+    settings.SNOOKER_SLOW_REQUEST_MS = 0
+    player = mixer.blend(Player)
+
+    with caplog.at_level(logging.INFO, logger='snooker_app.requests'):
+        client.get(reverse('player_detail', args=[player.pk]))
+
+    [logged] = _logged(caplog, logging.WARNING)
+    assert logged['slow'] is True
+    assert logged['view'] == 'player_detail'
+    assert len(logged['sql']) == logged['queries']
+    assert any('snooker_app_player' in query['sql'] for query in logged['sql'])
+    assert json.loads(caplog.records[-1].getMessage())['sql'] == logged['sql']
+
+
+def test_duplicate_queries_are_counted():
+    recorder = QueryRecorder()
+    run = lambda sql, params, many, context: None
+    for params in ([1], [1], [2], [1]):
+        recorder(run, 'SELECT %s', params, False, {})
+    assert len(recorder.queries) == 4
+    assert recorder.duplicates == 2
@@ -1,8 +1,13 @@
 from datetime import timedelta, date, time
+from io import StringIO
+from threading import Thread
 
 import pytest
-from snooker_app.models import Player, Match, Referee, MatchPlayer
+from mixer.backend.django import mixer
+from snooker_app.models import Player, Match, Referee, MatchPlayer, Competition, GroupStage, Counter, TemporaryPlayer
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 
 
 @pytest.mark.django_db
@@ -127,3 +132,114 @@ class TestMatchPlayerModel:
         assert match_player.pot_success_percentage == 70.0
         assert match_player.total_points == 62
         assert str(match_player) == 'John Doe in Match on 2024-07-01 at 15:30:00 (Position: First)'
+
+
+@pytest.mark.django_db
+class TestGroupStageModel:
+    def test_create_groups_and_matches(self, django_assert_max_num_queries):
+        competition = mixer.blend(Competition)
+        players = [Player.objects.create(first_name=f'Player{i}') for i in range(16)]
+        competition.players.add(*players)
+        group_stage = GroupStage.objects.create(competition=competition, name='Groups', num_groups=2,
+                                                players_per_group=8, matches_per_pair=2)
+
+        with django_assert_max_num_queries(6):
+            report = group_stage.create_groups_and_matches(default_frames=5)
+
+        matches = Match.objects.filter(group_stage=group_stage)
+        assert report['matches'] == 2 * 28 * 2
+        assert report['seconds'] >= 0
+        assert matches.count() == report['matches']
+        assert set(matches.values_list('group_name', flat=True)) == {'A', 'B'}
+        assert Match.players.through.objects.filter(match__group_stage=group_stage).count() == 2 * report['matches']
+
+        match = matches.prefetch_related('players').first()
+        assert sorted(match.player_ids.split(', ')) == sorted(str(player.id) for player in match.players.all())
+        assert match.referee_names == ''
+
+
+@pytest.mark.django_db
+class TestMatchDenormalizedFields:
+    def test_save_without_relation_changes_does_not_touch_relations(self, django_assert_num_queries):
+        match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=5)
+        match.number_of_frames = 7
+
+        with django_assert_num_queries(1):
+            match.save()
+
+    def test_relation_changes_update_fields(self):
+        player1 = Player.objects.create(first_name='John', last_name='Doe')
+        player2 = Player.objects.create(first_name='Jane', last_name='Smith')
+        referee = Referee.objects.create(first_name='Ref', last_name='One')
+        match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=5)
+
+        match.players.add(player1, player2)
+        match.referees.add(referee)
+        match.refresh_from_db()
+        assert match.player_ids == f'{player1.id}, {player2.id}'
+        assert match.referee_names == 'Ref One'
+
+        match.players.remove(player2)
+        match.referees.clear()
+        match.refresh_from_db()
+        assert match.player_names == 'John Doe'
+        assert match.referee_ids == ''
+
+        player2.match_set.add(match)
+        match.refresh_from_db()
+        assert match.player_names == 'John Doe, Jane Smith'
+
+        player1.match_set.clear()
+        match.refresh_from_db()
+        assert match.player_names == 'Jane Smith'
+
+    def test_rebuild_denormalized_fields_command(self):
+        player1 = Player.objects.create(first_name='John', last_name='Doe')
+        player2 = Player.objects.create(first_name='Jane', last_name='Smith')
+        matches = [Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=5) for _ in range(5)]
+        for match in matches:
+            match.players.add(player1, player2)
+        Match.objects.update(player_names='stale', player_ids='')
+
+        call_command('rebuild_denormalized_fields', chunk_size=2, stdout=StringIO())
+
+        assert set(Match.objects.values_list('player_names', flat=True)) == {'John Doe, Jane Smith'}
+
+
+@pytest.mark.django_db
+class TestTemporaryPlayerNaming:
+    def test_counter_reserves_consecutive_ranges(self):
+        assert list(Counter.reserve('tables', 2)) == [1, 2]
+        assert list(Counter.reserve('tables', 3)) == [3, 4, 5]
+        assert list(Counter.reserve('other')) == [1]
+
+    def test_create_numbered_cost_does_not_grow(self, django_assert_num_queries):
+        assert [player.name for player in TemporaryPlayer.create_numbered(2)] == ['Player 1', 'Player 2']
+        TemporaryPlayer.objects.bulk_create([TemporaryPlayer(name='Old') for _ in range(50)])
+
+        with django_assert_num_queries(3):
+            players = TemporaryPlayer.create_numbered(2)
+        assert [player.name for player in players] == ['Player 3', 'Player 4']
+
+    def test_counter_starts_after_names_given_before_it(self):
+        TemporaryPlayer.objects.bulk_create([TemporaryPlayer(name=name)
+                                             for name in ('Player 1', 'Player 12', 'Player 3', 'Player x')])
+        players = TemporaryPlayer.create_numbered(2)
+        assert [player.name for player in players] == ['Player 13', 'Player 14']
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_temporary_players_get_unique_names():
+    def start_matches():
+        for _ in range(10):
+            TemporaryPlayer.create_numbered(2)
+        connection.close()
+
+    threads = [Thread(target=start_matches) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    names = list(TemporaryPlayer.objects.values_list('name', flat=True))
+    assert len(names) == len(set(names)) == 80
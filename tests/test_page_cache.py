@@ -0,0 +1,72 @@
+import pytest
+from django.urls import reverse
+
+from snooker_app import page_cache
+from snooker_app.models import Player, Match, MatchPlayer, MatchResult, Frame, Competition, GroupStage
+
+
+@pytest.fixture
+def group_match():
+    competition = Competition.objects.create(name='Open', start_date='2024-07-01', end_date='2024-07-02',
+                                             competition_type='Qualifiers')
+    stage = GroupStage.objects.create(competition=competition, name='Groups', num_groups=1, players_per_group=2)
+    match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=3,
+                                 group_stage=stage, group_name='A')
+    ronnie, judd = Player.objects.create(first_name='Ronnie'), Player.objects.create(first_name='Judd')
+    match.players.add(ronnie, judd)
+    return competition, match, ronnie, judd
+
+
+@pytest.mark.django_db
+def test_competition_detail_is_served_from_cache(client, group_match, django_assert_num_queries):
+    competition, *_ = group_match
+    url = reverse('competition_detail', args=[competition.pk])
+
+    first = client.get(url)
+    with django_assert_num_queries(0):
+        second = client.get(url)
+
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert page_cache.stats(['competition_detail']) == {'competition_detail': {'hits': 1, 'misses': 1}}
+
+
+@pytest.mark.django_db
+def test_frame_changes_invalidate_only_their_competition(client, group_match, django_capture_on_commit_callbacks):
+    competition, match, ronnie, judd = group_match
+    other = Competition.objects.create(name='Masters', start_date='2024-07-01', end_date='2024-07-02',
+                                       competition_type='Finals')
+    url = reverse('competition_detail', args=[competition.pk])
+    other_url = reverse('competition_detail', args=[other.pk])
+    assert client.get(url).context['group_data'][0]['player_stats'][0]['frames_won'] == 0
+    client.get(other_url)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        line = MatchPlayer.objects.create(match=match, player=ronnie, position=1)
+        Frame.objects.create(match_player=line, frame_number=1, winner=ronnie)
+        Frame.objects.create(match_player=line, frame_number=2, winner=ronnie)
+
+    response = client.get(url)
+    assert response.context is not None
+    rows = {row['player']: row for row in response.context['group_data'][0]['player_stats']}
+    assert rows[ronnie]['frames_won'] == 2
+    assert client.get(other_url).context is None
+
+
+@pytest.mark.django_db
+def test_recorded_results_invalidate_achievements(client, group_match, django_capture_on_commit_callbacks):
+    _, match, ronnie, judd = group_match
+    url = reverse('achievement_list')
+    client.get(url)
+    assert client.get(url).context is None
+
+    with django_capture_on_commit_callbacks(execute=True):
+        line = MatchPlayer.objects.create(match=match, player=ronnie, position=1)
+        MatchPlayer.objects.create(match=match, player=judd, position=2)
+        Frame.objects.create(match_player=line, frame_number=1, winner=ronnie)
+        MatchResult.objects.create(match=match)
+
+    response = client.get(url)
+    assert response.context is not None
+    assert [achievement.player for achievement in response.context['achievements']
+            if achievement.frames_won] == [ronnie]
@@ -0,0 +1,72 @@
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from snooker_app.models import Player, Match, MatchPlayer, MatchResult, PlayerStatistics
+from snooker_app.player_stats import record_match
+
+
+def create_line(player, position, **stats):
+    match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=5)
+    return MatchPlayer.objects.create(match=match, player=player, position=position, **stats)
+
+
+@pytest.fixture
+def player():
+    return Player.objects.create(first_name='John', last_name='Doe')
+
+
+@pytest.mark.django_db
+def test_match_result_updates_player_statistics(player):
+    first = create_line(player, 1, attempts=10, successful_pots=8, fouls=2, foul_points=8, max_break=54,
+                        avg_shot_time=timedelta(seconds=20))
+    second = create_line(player, 1, attempts=30, successful_pots=12, fouls=0, foul_points=0, max_break=101,
+                         avg_shot_time=timedelta(seconds=40))
+
+    MatchResult.objects.create(match=first.match)
+    MatchResult.objects.create(match=second.match)
+
+    player.refresh_from_db()
+    assert player.highest_break == 101
+    assert player.pot_success_percentage == 50.0
+    assert player.avg_shots_per_match == 20.0
+    assert player.avg_fouls_per_match == 1.0
+    assert player.avg_foul_points_per_match == 4.0
+    assert player.avg_shot_time == timedelta(seconds=35)
+    assert player.statistics.matches_played == 2
+
+
+@pytest.mark.django_db
+def test_record_match_is_constant_and_not_repeated(player, django_assert_max_num_queries):
+    for _ in range(5):
+        MatchResult.objects.create(match=create_line(player, 1, attempts=10, successful_pots=5).match)
+    line = create_line(player, 1, attempts=10, successful_pots=5)
+
+    with django_assert_max_num_queries(10) as captured:
+        assert record_match(line.match) == 1
+    # The lines are locked, so an overlapping call waits and then skips them.
+    assert any('"stats_recorded"' in query['sql'] and 'FOR UPDATE' in query['sql']
+               for query in captured.captured_queries)
+    assert record_match(line.match) == 0
+    assert PlayerStatistics.objects.get(player=player).matches_played == 6
+
+
+@pytest.mark.django_db
+def test_recompute_player_stats_command(player):
+    line = create_line(player, 1, attempts=4, successful_pots=3, max_break=30)
+    MatchResult.objects.create(match=line.match)
+    create_line(player, 1, attempts=100, successful_pots=0)
+    idle = Player.objects.create(first_name='Idle', highest_break=147)
+    PlayerStatistics.objects.filter(player=player).update(attempts=999)
+
+    call_command('recompute_player_stats', stdout=StringIO())
+
+    player.refresh_from_db()
+    idle.refresh_from_db()
+    assert player.statistics.attempts == 4
+    assert player.pot_success_percentage == 75.0
+    assert player.highest_break == 30
+    assert idle.highest_break is None
+    assert not MatchPlayer.objects.get(match__matchresult__isnull=True).stats_recorded
@@ -0,0 +1,132 @@
+from io import StringIO
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from mixer.backend.django import mixer
+
+from snooker_app.models import Player, Match, MatchPlayer, MatchResult, RatingHistory, Frame, Competition, KnockoutStage
+from snooker_app.ratings import layers, rate_chunk, rating_change, record_match, seed, seed_groups
+from tests.test_achievements import play_match
+
+
+@pytest.fixture
+def players():
+    return [Player.objects.create(first_name=name) for name in ('Ronnie', 'Judd', 'Mark', 'Neil')]
+
+
+def test_layers_keep_each_players_matches_in_order():
+    assert layers(np.array([0, 1, 0, 2]), np.array([1, 2, 3, 3])).tolist() == [0, 1, 1, 2]
+
+
+def test_vectorized_rating_matches_match_by_match():
+    rng = np.random.default_rng(1)
+    first = rng.integers(0, 20, 500)
+    second = (first + rng.integers(1, 20, 500)) % 20
+    scores = rng.choice([0.0, 0.5, 1.0], 500)
+
+    expected = np.full(20, 1500.0)
+    for a, b, score in zip(first, second, scores):
+        change = rating_change(expected[a], expected[b], score)
+        expected[a] += change
+        expected[b] -= change
+
+    ratings = np.full(20, 1500.0)
+    before, after = rate_chunk(ratings, first, second, scores)
+    assert np.allclose(ratings, expected)
+    assert np.allclose(after[:, 1] - before[:, 1], before[:, 0] - after[:, 0])
+
+
+@pytest.mark.django_db
+def test_results_update_ratings_incrementally(players):
+    ronnie, judd, *_ = players
+    match = play_match(1, ronnie, judd, [ronnie, judd, ronnie])
+
+    ronnie.refresh_from_db()
+    judd.refresh_from_db()
+    assert (ronnie.rating, judd.rating) == (1516, 1484)
+    assert (ronnie.rated_matches, judd.rated_matches) == (1, 1)
+    assert sorted(RatingHistory.objects.filter(match=match).values_list('rating_before', 'rating_after')) == \
+           [(1500, 1484), (1500, 1516)]
+
+    play_match(2, judd, ronnie, [judd, ronnie])
+    ronnie.refresh_from_db()
+    assert ronnie.rating < 1516
+
+
+@pytest.mark.django_db
+def test_matches_without_a_won_frame_are_rated_later(players, django_assert_max_num_queries):
+    ronnie, judd, *_ = players
+    match = play_match(1, ronnie, judd, [None])
+    assert not RatingHistory.objects.exists()
+    assert not MatchPlayer.objects.filter(match=match, rating_recorded=True).exists()
+
+    Frame.objects.filter(match_player__match=match).update(winner=judd)
+    with django_assert_max_num_queries(8) as captured:
+        assert record_match(match) == 1
+    # The lines are locked, so an overlapping call waits and then skips them.
+    assert any('"rating_recorded"' in query['sql'] and 'FOR UPDATE' in query['sql']
+               for query in captured.captured_queries)
+    assert record_match(match) == 0
+    assert RatingHistory.objects.filter(match=match).count() == 2
+    judd.refresh_from_db()
+    assert judd.rating == 1516
+
+
+@pytest.mark.django_db
+def test_replay_matches_incremental_results(players):
+    ronnie, judd, mark, neil = players
+    play_match(1, ronnie, judd, [ronnie, ronnie])
+    play_match(2, mark, neil, [neil])
+    play_match(3, ronnie, mark, [mark, ronnie, mark])
+    play_match(4, judd, neil, [judd, neil])
+    play_match(5, neil, ronnie, [neil])
+    expected = dict(Player.objects.values_list('pk', 'rating'))
+    history = RatingHistory.objects.count()
+
+    play_match(6, ronnie, neil, [ronnie], record=False)
+    Player.objects.update(rating=1000, rated_matches=0)
+    call_command('replay_ratings', chunk_size=2, stdout=StringIO())
+
+    assert RatingHistory.objects.count() == history == 10
+    for pk, rating in Player.objects.values_list('pk', 'rating'):
+        assert rating == pytest.approx(expected[pk])
+    assert Player.objects.get(pk=ronnie.pk).rated_matches == 3
+
+    MatchResult.objects.create(match=Match.objects.get(date='2024-07-06'))
+    assert RatingHistory.objects.count() == 12
+
+
+@pytest.mark.django_db
+def test_stages_are_seeded_by_rating():
+    players = [Player.objects.create(first_name=f'Player{i}', rating=2000 - i) for i in range(8)]
+
+    groups = seed_groups(reversed(players), 2, 4)
+    assert [[player.rating for player in group] for group in groups] == [[2000, 1997, 1996, 1993],
+                                                                         [1999, 1998, 1995, 1994]]
+    assert seed(players[::-1]) == players
+
+    competition = mixer.blend(Competition)
+    competition.players.add(*players)
+    stage = KnockoutStage.objects.create(competition=competition, name='KO', num_rounds=3, frames_per_match=7)
+    stage.create_knockout_matches()
+    first_round = Match.objects.filter(knockout_stage=stage, bracket_round=1).order_by('bracket_slot')
+    assert [match.player_names for match in first_round] == [
+        'Player0, Player7', 'Player3, Player4', 'Player1, Player6', 'Player2, Player5']
+
+
+@pytest.mark.django_db
+def test_rating_views(client, players):
+    ronnie, judd, mark, _ = players
+    play_match(1, ronnie, judd, [ronnie])
+    play_match(2, mark, judd, [mark])
+
+    response = client.get(reverse('rankings'), {'per_page': 2})
+    assert [player.pk for player in response.context['players']] == [ronnie.pk, mark.pk]
+    assert response.context['next_query']
+    response = client.get(f"{reverse('rankings')}?{response.context['next_query']}")
+    assert [player.pk for player in response.context['players']] == [judd.pk]
+
+    response = client.get(reverse('player_detail', args=[judd.pk]))
+    assert [entry.match.date.day for entry in response.context['rating_history']] == [2, 1]
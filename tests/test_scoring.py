@@ -0,0 +1,216 @@
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+import pytest
+from django.db import DatabaseError
+from django.urls import reverse
+
+from snooker_app import shot_log
+from snooker_app.models import Player, Match, MatchPlayer, Frame, ShotEvent
+from snooker_app.scoring import replay
+from snooker_app.shot_log import ShotEventBuffer
+
+
+@pytest.fixture
+def match():
+    match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=5)
+    match.players.add(Player.objects.create(first_name='Mark'), Player.objects.create(first_name='John'))
+    return match
+
+
+def post_events(client, match, frame_number, seq, events):
+    url = reverse('frame_events', args=[match.pk, frame_number])
+    return client.post(url, json.dumps({'seq': seq, 'events': events}), content_type='application/json')
+
+
+def test_replay():
+    state = replay([
+        {'type': 'pot', 'value': 1}, {'type': 'pot', 'value': 7}, {'type': 'pot', 'value': 1},
+        {'type': 'pot', 'value': 7}, {'type': 'miss'},
+        {'type': 'foul', 'points': 4},
+        {'type': 'pot', 'value': 1}, {'type': 'safety'},
+    ])
+    assert state['active_player'] == 2
+    assert state['breaks'] == [[16], []]
+    assert state['points'] == [17, 0]
+    assert state['scores'] == [21, 0]
+    assert state['fouls'] == [0, 1]
+    assert state['max_break'] == [16, 0]
+    assert state['points_on_table'] == 130
+
+
+@pytest.mark.django_db
+def test_frame_events_apply_batches(client, match):
+    response = post_events(client, match, 1, 1, [{'type': 'pot', 'value': 1}, {'type': 'pot', 'value': 5},
+                                                 {'type': 'pot', 'value': 1}, {'type': 'pot', 'value': 7},
+                                                 {'type': 'miss'}])
+    assert response.status_code == 200
+    assert response.json()['scores'] == [14, 0]
+
+    response = post_events(client, match, 1, 2, [{'type': 'pot', 'value': 1}, {'type': 'foul', 'points': 5},
+                                                 {'type': 'pot', 'value': 4}, {'type': 'undo'}])
+    state = response.json()
+    assert state['scores'] == [19, 1]
+    assert state['active_player'] == 1
+    assert state['seq'] == 2
+
+    frame = Frame.objects.get(match_player__match=match, frame_number=1)
+    assert frame.points_scored_player1 == 14
+    assert frame.break_points_player1 == [14]
+    assert frame.player2_fouls == 1
+    assert frame.foul_points_player2 == 5
+    assert frame.misses_player1 == 1
+
+    line1, line2 = MatchPlayer.objects.filter(match=match).order_by('position')
+    assert line1.points_scored == 14
+    assert line1.successful_pots == 4
+    assert line1.attempts == 5
+    assert line1.max_break == 14
+    assert line2.foul_points == 5
+
+
+@pytest.mark.django_db
+def test_frame_events_retry_is_ignored(client, match):
+    post_events(client, match, 1, 1, [{'type': 'pot', 'value': 1}])
+    response = post_events(client, match, 1, 1, [{'type': 'pot', 'value': 1}])
+
+    assert response.json()['scores'] == [1, 0]
+    assert client.get(reverse('frame_events', args=[match.pk, 1])).json()['scores'] == [1, 0]
+
+
+@pytest.mark.django_db
+def test_frame_events_reject_invalid_batches(client, match):
+    assert post_events(client, match, 1, 1, [{'type': 'pot', 'value': 9}]).status_code == 400
+    assert post_events(client, match, 1, 1, [{'type': 'pot', 'value': 1}, {'type': 'jump'}]).status_code == 400
+    for event in ({'type': 'pot', 'value': True}, {'type': 'pot', 'value': 3.0}, {'type': 'foul', 'points': 4.0},
+                  {'type': 'set_player', 'player': True}, {'type': 'miss', 'time': True},
+                  {'type': 'miss', 'time': -1.5}):
+        assert post_events(client, match, 1, 1, [event]).status_code == 400
+    assert not Frame.objects.exists()
+
+    lonely = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=5)
+    assert post_events(client, lonely, 1, 1, [{'type': 'miss'}]).status_code == 400
+    assert post_events(client, match, 1, True, [{'type': 'miss'}]).status_code == 400
+    assert client.get(reverse('frame_events', args=[lonely.pk, 1])).status_code == 400
+
+
+@pytest.mark.django_db
+def test_reading_a_frame_writes_nothing(client, match, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks() as callbacks:
+        response = client.get(reverse('frame_events', args=[match.pk, 1]))
+    assert response.status_code == 200
+    assert [player['name'] for player in response.json()['players']] == ['Mark', 'John']
+    assert response.json()['scores'] == [0, 0]
+    assert not MatchPlayer.objects.exists()
+    assert not callbacks
+
+
+@pytest.mark.django_db
+def test_shot_events_are_logged_in_order(client, match, shot_buffer, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        post_events(client, match, 1, 1, [{'type': 'pot', 'value': 1, 'time': 12.5}, {'type': 'miss'},
+                                          {'type': 'foul', 'points': 4}])
+        post_events(client, match, 1, 1, [{'type': 'pot', 'value': 1}])
+        post_events(client, match, 1, 2, [{'type': 'pot', 'value': 7}, {'type': 'undo'},
+                                          {'type': 'set_player', 'player': 2}])
+        post_events(client, match, 2, 1, [{'type': 'safety'}])
+    assert len(shot_buffer) == 7
+    assert not ShotEvent.objects.exists()
+
+    assert shot_buffer.flush() == 7
+    assert len(shot_buffer) == 0
+    logged = list(ShotEvent.objects.filter(match=match).order_by('frame_number', 'sequence')
+                  .values_list('frame_number', 'sequence', 'player', 'kind', 'value', 'shot_time'))
+    assert logged == [
+        (1, 1, 1, 'pot', 1, 12.5),
+        (1, 2, 1, 'miss', None, None),
+        (1, 3, 2, 'foul', 4, None),
+        (1, 4, 1, 'pot', 7, None),
+        (1, 5, 1, 'undo', None, None),
+        (1, 6, 2, 'set_player', None, None),
+        (2, 1, 1, 'safety', None, None),
+    ]
+
+
+@pytest.mark.django_db
+def test_shot_buffer_flushes_when_full(match):
+    buffer = ShotEventBuffer(max_rows=3, max_seconds=3600)
+    row = (match.pk, 1, 1, 1, 'pot', 1, None, '2024-07-01T15:30:00+00:00')
+
+    buffer.add([row, row])
+    assert not ShotEvent.objects.exists()
+    buffer.add([row])
+    assert len(buffer) == 0
+    assert ShotEvent.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_shot_buffer_keeps_events_when_a_write_fails(match, monkeypatch, caplog):
+    buffer = ShotEventBuffer(max_rows=2, max_seconds=3600)
+    row = (match.pk, 1, 1, 1, 'pot', 1, None, '2024-07-01T15:30:00+00:00')
+
+    def fail(rows):
+        raise DatabaseError('connection lost')
+
+    monkeypatch.setattr(shot_log, 'copy_rows', fail)
+    buffer.add([row, row])
+    assert len(buffer) == 2
+    assert 'Could not write 2 shot events' in caplog.text
+
+    monkeypatch.undo()
+    assert buffer.flush() == 2
+    assert ShotEvent.objects.count() == 2
+    buffer.close()
+
+
+def test_shot_buffer_flushes_quiet_buffers_on_a_timer(monkeypatch):
+    written = []
+    monkeypatch.setattr(shot_log, 'copy_rows', lambda rows: written.append(rows) or len(rows))
+    monkeypatch.setattr(shot_log.transaction, 'atomic', nullcontext)
+    monkeypatch.setattr(shot_log.connection, 'close', lambda: None)
+    buffer = ShotEventBuffer(max_rows=100, max_seconds=0.05)
+
+    buffer.add([('row',)])
+    for _ in range(100):
+        if written:
+            break
+        time.sleep(0.01)
+    assert written == [[('row',)]]
+    assert len(buffer) == 0
+
+
+def test_shot_buffer_writes_in_order_when_flushes_overlap(monkeypatch):
+    written = []
+    copying = threading.Event()
+    fail = threading.Event()
+
+    def copy(rows):
+        if not copying.is_set():
+            copying.set()
+            fail.wait(5)
+            raise DatabaseError('connection lost')
+        written.append(list(rows))
+        return len(rows)
+
+    monkeypatch.setattr(shot_log, 'copy_rows', copy)
+    monkeypatch.setattr(shot_log.transaction, 'atomic', nullcontext)
+    buffer = ShotEventBuffer(max_rows=100, max_seconds=3600)
+
+    buffer.add([('old',)])
+    first = threading.Thread(target=buffer.flush)
+    first.start()
+    copying.wait(5)
+    buffer.add([('new',)])
+    second = threading.Thread(target=buffer.flush)
+    second.start()
+    time.sleep(0.05)
+    fail.set()
+    first.join(5)
+    second.join(5)
+    buffer.close()
+
+    # The second flush waited for the failed one, then wrote both in order.
+    assert written == [[('old',), ('new',)]]
+    assert len(buffer) == 0
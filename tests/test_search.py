@@ -0,0 +1,125 @@
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.urls import reverse
+
+from snooker_app.forms import MatchForm, CompetitionForm, AddPlayersToCompetitionForm
+from snooker_app.models import Player, Referee, Match, Competition
+from snooker_app.search import search_players, search_referees, search_matches
+
+
+@pytest.fixture
+def players():
+    return {
+        'ronnie': Player.objects.create(first_name='Ronnie', last_name="O'Sullivan", nickname='Rocket', rating=1700),
+        'ronan': Player.objects.create(first_name='Ronan', last_name='Keating', rating=1400),
+        'judd': Player.objects.create(first_name='Judd', last_name='Trump', nickname='Ace', rating=1650),
+        'mark': Player.objects.create(first_name='Mark', last_name='Selby', nickname='Jester', rating=1600),
+    }
+
+
+def names(players):
+    return [player.first_name for player in players]
+
+
+@pytest.mark.django_db
+def test_search_matches_name_prefixes(players):
+    assert sorted(names(search_players('ron'))) == ['Ronan', 'Ronnie']
+    assert names(search_players('RON rock')) == ['Ronnie']
+    assert names(search_players('trump')) == ['Judd']
+    assert names(search_players('jest')) == ['Mark']
+    assert names(search_players('ump')) == []
+    assert search_players('  ').count() == 4
+
+
+@pytest.mark.django_db
+def test_search_uses_the_prefix_indexes(players):
+    sql, params = search_players('sel').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'EXPLAIN {sql}', params)
+        plan = '\n'.join(row[0] for row in cursor.fetchall())
+    assert 'player_last_name_prefix_idx' in plan
+    assert 'player_nickname_prefix_idx' in plan
+
+
+def test_prefix_index_names_pass_the_system_check():
+    # Index names longer than 30 characters fail models.E034.
+    call_command('check', 'snooker_app')
+
+
+@pytest.mark.django_db
+def test_player_search_view_pages_by_rating(client, players, django_assert_num_queries):
+    url = reverse('player_search')
+    with django_assert_num_queries(1):
+        response = client.get(url, {'q': 'r', 'per_page': 1})
+    page = response.json()
+    assert page['results'] == [{'id': players['ronnie'].pk, 'text': 'Ronnie "Rocket" O\'Sullivan', 'rating': 1700}]
+
+    page = client.get(url, {'q': 'r', 'per_page': 1, 'cursor': page['next']}).json()
+    assert [result['id'] for result in page['results']] == [players['ronan'].pk]
+    assert page['next'] is None
+
+    assert client.get(url, {'cursor': 'nope'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_player_search_view_excludes_competition_players(client, players):
+    competition = Competition.objects.create(name='Masters', start_date='2024-01-01', end_date='2024-01-07')
+    competition.players.add(players['ronnie'])
+    page = client.get(reverse('player_search'), {'q': 'ron', 'exclude_competition': competition.pk}).json()
+    assert [result['id'] for result in page['results']] == [players['ronan'].pk]
+
+
+@pytest.mark.django_db
+def test_player_pickers_render_only_selected_players(players):
+    assert 'Ronnie' not in MatchForm().as_p()
+
+    form = MatchForm(initial={'players': [players['judd'].pk, players['mark'].pk]})
+    html = form.as_p()
+    assert 'Judd' in html and 'Mark' in html and 'Ronnie' not in html
+    assert reverse('player_search') in html
+    assert 'js/search_select.js' in str(form.media)
+
+    competition = Competition.objects.create(name='Masters', start_date='2024-01-01', end_date='2024-01-07')
+    competition.players.add(players['judd'])
+    form = AddPlayersToCompetitionForm(data={'players': [players['judd'].pk]}, competition=competition)
+    assert not form.is_valid()
+    assert f'exclude_competition={competition.pk}' in AddPlayersToCompetitionForm(competition=competition).as_p()
+
+
+@pytest.mark.django_db
+def test_referee_and_match_search(client, players):
+    michaela = Referee.objects.create(first_name='Michaela', last_name='Tabb', license_number='WPBSA-7')
+    Referee.objects.create(first_name='Olivier', last_name='Marteel')
+    assert list(search_referees('tab')) == [michaela]
+    assert list(search_referees('wpbsa')) == [michaela]
+
+    older = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=5)
+    older.players.add(players['ronnie'], players['judd'])
+    newer = Match.objects.create(date='2024-07-02', time='15:30:00', number_of_frames=5)
+    newer.players.add(players['ronnie'], players['mark'])
+    assert set(search_matches('ronnie')) == {older, newer}
+    assert list(search_matches('ronnie trump')) == [older]
+    assert list(search_matches('2024-07-02')) == [newer]
+    assert list(search_matches('2024-13-45')) == []
+
+    page = client.get(reverse('match_search'), {'q': 'ronnie', 'per_page': 1}).json()
+    assert page['results'][0]['id'] == newer.pk and page['next']
+    page = client.get(reverse('referee_search'), {'q': 'mich'}).json()
+    assert page['results'] == [{'id': michaela.pk, 'text': 'Michaela Tabb'}]
+
+
+@pytest.mark.django_db
+def test_referee_and_match_pickers_render_only_selected_rows():
+    referees = [Referee.objects.create(first_name=f'Referee{i}') for i in range(3)]
+    matches = [Match.objects.create(date=f'2024-07-0{i + 1}', time='15:30:00', number_of_frames=5)
+               for i in range(3)]
+
+    html = MatchForm(initial={'referees': [referees[0].pk]}).as_p()
+    assert 'Referee0' in html and 'Referee1' not in html
+    assert reverse('referee_search') in html
+
+    html = CompetitionForm(initial={'matches': [matches[0].pk]}).as_p()
+    assert str(matches[0]) in html and str(matches[1]) not in html
+    assert reverse('match_search') in html
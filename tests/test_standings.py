@@ -0,0 +1,73 @@
+import pytest
+from mixer.backend.django import mixer
+
+from snooker_app.models import Player, Match, MatchPlayer, Frame, Competition, GroupStage
+from snooker_app.standings import compute_group_standings, is_decided
+
+
+def play(match, player1, player2, frames1, frames2):
+    match_player = MatchPlayer.objects.create(match=match, player=player1, position=1)
+    MatchPlayer.objects.create(match=match, player=player2, position=2)
+    winners = [player1] * frames1 + [player2] * frames2
+    for number, winner in enumerate(winners, start=1):
+        Frame.objects.create(match_player=match_player, frame_number=number, winner=winner)
+
+
+def create_group_match(stage, group_name, player1, player2, number_of_frames=3):
+    match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=number_of_frames,
+                                 group_stage=stage, group_name=group_name)
+    match.players.add(player1, player2)
+    return match
+
+
+@pytest.fixture
+def group_stage():
+    competition = mixer.blend(Competition)
+    return mixer.blend(GroupStage, competition=competition, num_groups=2, players_per_group=2)
+
+
+def test_is_decided():
+    assert is_decided(3, [2, 0])
+    assert is_decided(4, [2, 2])
+    assert not is_decided(5, [2, 1])
+    assert not is_decided(3, [])
+
+
+@pytest.mark.django_db
+def test_compute_group_standings(group_stage):
+    alice, bob, carol = [Player.objects.create(first_name=name) for name in ('Alice', 'Bob', 'Carol')]
+    dave, eve = [Player.objects.create(first_name=name) for name in ('Dave', 'Eve')]
+
+    play(create_group_match(group_stage, 'A', alice, bob), alice, bob, 2, 1)
+    play(create_group_match(group_stage, 'A', alice, carol), alice, carol, 0, 2)
+    play(create_group_match(group_stage, 'A', bob, carol, number_of_frames=2), bob, carol, 1, 1)
+    play(create_group_match(group_stage, 'B', dave, eve), dave, eve, 1, 0)
+
+    standings = compute_group_standings([group_stage])[group_stage.pk]
+
+    assert list(standings) == ['A', 'B']
+    group_a = {row['player']: row for row in standings['A']}
+    assert [row['player'] for row in standings['A']] == [carol, alice, bob]
+    assert group_a[carol] == {'player': carol, 'played': 2, 'won': 1, 'drawn': 1, 'lost': 0,
+                              'frames_won': 3, 'frames_lost': 1, 'points': 4}
+    assert group_a[alice]['points'] == 3
+    assert group_a[bob]['drawn'] == 1
+    assert group_a[bob]['frames_lost'] == 3
+
+    group_b = {row['player']: row for row in standings['B']}
+    assert group_b[dave]['played'] == 0
+    assert group_b[eve]['points'] == 0
+
+
+@pytest.mark.django_db
+def test_compute_group_standings_query_budget(group_stage, django_assert_max_num_queries):
+    players = mixer.cycle(8).blend(Player)
+    for i, player1 in enumerate(players):
+        for player2 in players[i + 1:]:
+            play(create_group_match(group_stage, 'A', player1, player2), player1, player2, 2, 1)
+
+    with django_assert_max_num_queries(3):
+        standings = group_stage.standings()
+
+    assert len(standings['A']) == 8
+    assert sum(row['played'] for row in standings['A']) == 8 * 7
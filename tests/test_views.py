@@ -6,7 +6,7 @@ from django.urls import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
 from mixer.backend.django import mixer
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from django.test import Client
 
 from snooker_app.forms import MatchForm, CompetitionForm, SignUpForm
@@ -220,6 +220,61 @@ def test_match_list_view(client):
     assert len(response.context['matches']) == 2
 
 
+@pytest.mark.django_db
+def test_match_list_view_keyset_pagination(client):
+    matches = [Match.objects.create(date=date(2024, 7, 1 + i % 3), time='15:30:00', number_of_frames=5)
+               for i in range(7)]
+    expected = sorted(matches, key=lambda match: (match.date, match.time, match.pk), reverse=True)
+
+    url = reverse('match_list')
+    seen = []
+    response = client.get(url, {'per_page': 3})
+    while True:
+        assert response.status_code == 200
+        seen.extend(response.context['matches'])
+        if not response.context['next_query']:
+            break
+        response = client.get(f"{url}?{response.context['next_query']}")
+
+    assert seen == expected
+    assert client.get(url, {'cursor': 'garbage'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_match_list_view_filters(client):
+    venue = mixer.blend(Venue)
+    competition = mixer.blend(Competition)
+    stage = mixer.blend(GroupStage, competition=competition)
+    player = mixer.blend(Player)
+    at_venue = mixer.blend(Match, venue=venue)
+    in_stage = mixer.blend(Match, group_stage=stage, venue=None)
+    linked = mixer.blend(Match, venue=None, group_stage=None, knockout_stage=None)
+    competition.matches.add(linked)
+    with_player = mixer.blend(Match, venue=None, group_stage=None, knockout_stage=None)
+    with_player.players.add(player)
+
+    url = reverse('match_list')
+    assert client.get(url, {'venue': venue.pk}).context['matches'] == [at_venue]
+    assert set(client.get(url, {'competition': competition.pk}).context['matches']) == {in_stage, linked}
+    assert client.get(url, {'player': player.pk}).context['matches'] == [with_player]
+
+
+@pytest.mark.django_db
+def test_match_list_view_query_budget(client, django_assert_max_num_queries):
+    venue = mixer.blend(Venue)
+    players = mixer.cycle(4).blend(Player)
+    referee = mixer.blend(Referee)
+    for _ in range(30):
+        match = mixer.blend(Match, venue=venue)
+        match.players.add(*players[:2])
+        match.referees.add(referee)
+
+    with django_assert_max_num_queries(8):
+        response = client.get(reverse('match_list'), {'per_page': 25})
+
+    assert len(response.context['matches']) == 25
+
+
 @pytest.mark.django_db
 def test_add_match_view_get(client):
     url = reverse('add_match')
@@ -409,6 +464,27 @@ def test_competition_detail_view(client):
     assert add_players_url in response.content.decode()
 
 
+@pytest.mark.django_db
+def test_competition_detail_view_query_budget(client, django_assert_max_num_queries):
+    competition = mixer.blend(Competition)
+    for _ in range(4):
+        group_stage = mixer.blend(GroupStage, competition=competition)
+        players = mixer.cycle(4).blend(Player)
+        for i, player1 in enumerate(players):
+            for player2 in players[i + 1:]:
+                match = Match.objects.create(date='2024-07-01', time='15:30:00', number_of_frames=3,
+                                             group_stage=group_stage, group_name='A')
+                match.players.add(player1, player2)
+
+    url = reverse('competition_detail', args=[competition.pk])
+    with django_assert_max_num_queries(10):
+        response = client.get(url)
+
+    assert response.status_code == 200
+    assert len(response.context['group_data']) == 4
+    assert all(len(group['player_stats']) == 4 for group in response.context['group_data'])
+
+
 @pytest.mark.django_db
 def test_competition_delete_view(client):
     competition = mixer.blend(Competition)
@@ -704,3 +780,55 @@ def test_achievement_list_view_table_content(sample_player):
     assert f'<td>{achievement1.longest_frame_won}</td>' in str(response.content)
     assert f'<td>{achievement1.consecutive_frames_won}</td>' in str(response.content)
     assert f'<td>{achievement1.consecutive_matches_won}</td>' in str(response.content)
+
+
+@pytest.mark.django_db
+def test_achievement_list_is_paginated(client):
+    for matches_won in (3, 2, 1):
+        Achievement.objects.create(player=mixer.blend(Player), matches_won=matches_won)
+
+    response = client.get(reverse('achievement_list'), {'per_page': 2})
+    assert [achievement.matches_won for achievement in response.context['achievements']] == [3, 2]
+
+    response = client.get(reverse('achievement_list') + '?' + response.context['next_query'])
+    assert [achievement.matches_won for achievement in response.context['achievements']] == [1]
+    assert response.context['next_query'] is None
+
+
+@pytest.mark.django_db
+def test_achievement_chart_data(client):
+    fast, slow = mixer.blend(Player), mixer.blend(Player)
+    Achievement.objects.create(player=fast, matches_won=1, fastest_frame_won=timedelta(minutes=8))
+    Achievement.objects.create(player=slow, matches_won=5, fastest_frame_won=timedelta(minutes=12, seconds=30))
+    Achievement.objects.create(player=mixer.blend(Player), matches_won=3)
+    url = reverse('achievement_chart_data')
+
+    response = client.get(url, {'column': 'matches_won', 'limit': 2})
+    assert response.json()['values'] == [5, 3]
+    assert response.json()['labels'][0] == str(slow)
+
+    response = client.get(url, {'column': 'fastest_frame_won'})
+    assert response.json() == {'column': 'fastest_frame_won', 'unit': 'seconds',
+                               'labels': [str(fast), str(slow)], 'values': [480.0, 750.0]}
+
+    assert client.get(url, {'column': 'player_id'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_achievement_chart_data_etag(client, django_assert_num_queries):
+    Achievement.objects.create(player=mixer.blend(Player), matches_won=1)
+    url = reverse('achievement_chart_data')
+    etag = client.get(url, {'column': 'matches_won'})['ETag']
+
+    with django_assert_num_queries(0):
+        response = client.get(url, {'column': 'matches_won'}, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert client.get(url, {'column': 'frames_won'}, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name', ['match_list', 'achievement_list', 'rankings', 'player_search'])
+def test_paged_views_clamp_page_size(client, name):
+    mixer.cycle(2).blend(Match, number_of_frames=3)
+    for per_page in (-5, 0, 10_000):
+        assert client.get(reverse(name), {'per_page': per_page}).status_code == 200